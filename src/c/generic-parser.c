@@ -1,73 +1,239 @@
+#define _GNU_SOURCE
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
+#include <math.h>
 
-void __debug__(FILE *f) {
-    long int pos = ftell(f);
-    char *line = NULL;
-    size_t len;
-    if (getline(&line, &len, f) != -1) printf("Line: [%s]\n", line);
-    if (line) free(line);
-    fseek(f,pos,SEEK_SET);
+#include "generic-parser.h"
+
+cursor cursor_new(const char *data, long len) {
+    cursor result;
+    result.data = data;
+    result.len = len;
+    result.pos = 0;
+    return result;
+}
+
+void __debug__(cursor *f) {
+    const char *start = f->data + f->pos;
+    const char *end = memchr(start, '\n', f->len - f->pos);
+    int n = end == NULL ? f->len - f->pos : end - start;
+    printf("Line: [%.*s]\n", n, start);
+}
+
+long find(const char *c, long n, cursor *f, long limit) {
+    // Finds the first occurrence of c ending before limit
+    const char *match;
+    if (limit - f->pos < n) return -1;
+    if (n == 1) match = memchr(f->data + f->pos, c[0], limit - f->pos);
+    else match = memmem(f->data + f->pos, limit - f->pos, c, n);
+    if (match == NULL) return -1;
+    return match - f->data;
 }
 
-int skip_either(char **c, int n, FILE *f) {
-    char ch;
-    int i[n];
-    memset(i, 0, sizeof(i));
+int skip_either(char **c, int n, cursor *f) {
+    // Moves behind the occurrence of any of c which ends first
+    long best_end = f->len + 1;
+    int best = -1;
     int j;
     
-    while (1) {
-        
-        ch = fgetc(f);
-        for (j=0; j<n; j++) {
-            if (ch == EOF) return -1;
-            if (ch == c[j][i[j]]) i[j]++; else i[j] = 0;
-            if (c[j][i[j]] == 0) return j;
+    for (j=0; j<n; j++) {
+        long l = strlen(c[j]);
+        long start = find(c[j], l, f, best_end - 1);
+        if (start >= 0) {
+            best_end = start + l;
+            best = j;
         }
     }
     
-    return -1;
+    f->pos = best < 0 ? f->len : best_end;
+    return best;
 }
 
-int skip(char *c, FILE *f) {
+int skip(char *c, cursor *f) {
     if (skip_either(&c, 1, f) == 0) return 1; else return 0;
 }
 
-int skip_line(FILE *f) {
+int skip_line(cursor *f) {
     return skip("\n", f);
 }
 
-int skip_line_n(FILE *f, int n) {
+int skip_line_n(cursor *f, int n) {
     int i;
     for (i=0; i<n; i++) if (!skip_line(f)) return 0;
     return 1;
 }
 
-int present(char *c, FILE *f) {
-    long int pos = ftell(f);
+int present(char *c, cursor *f) {
+    long pos = f->pos;
     int result = skip(c,f);
-    fseek(f,pos,SEEK_SET);
+    f->pos = pos;
     return result;
 }
 
-int present_either(char **c, int n, FILE *f) {
-    long int pos = ftell(f);
+int present_either(char **c, int n, cursor *f) {
+    long pos = f->pos;
     int result = skip_either(c,n,f);
-    fseek(f,pos,SEEK_SET);
+    f->pos = pos;
     return result;
 }
 
-int present_either2(char *c1, char *c2, FILE *f) {
+int present_either2(char *c1, char *c2, cursor *f) {
     char *c[2];
     c[0] = c1; c[1] = c2;
     return present_either(c, 2, f);
 }
 
-long int position_of(char *c, FILE *f) {
-    long int pos = ftell(f);
+long int position_of(char *c, cursor *f) {
+    long pos = f->pos;
     int result = skip(c,f);
-    long int p2 = ftell(f);
-    fseek(f,pos,SEEK_SET);
+    long p2 = f->pos;
+    f->pos = pos;
     if (result) return p2; else return -1;
 }
+
+long count(char *c, cursor *f) {
+    // Counts occurrences of c after the cursor
+    long pos = f->pos;
+    long result = 0;
+    while (skip(c, f)) result++;
+    f->pos = pos;
+    return result;
+}
+
+void skip_space(cursor *f) {
+    while (f->pos < f->len && (f->data[f->pos] == ' ' || (f->data[f->pos] >= '\t' && f->data[f->pos] <= '\r'))) f->pos++;
+}
+
+int scan_char(cursor *f, char c) {
+    // Matches a character as a literal in scanf format
+    if (f->pos < f->len && f->data[f->pos] == c) {
+        f->pos++;
+        return 1;
+    }
+    return 0;
+}
+
+long token(cursor *f, char *buffer) {
+    // Copies the text after whitespace into a null-terminated buffer
+    skip_space(f);
+    long n = f->len - f->pos;
+    if (n > TOKEN_SIZE - 1) n = TOKEN_SIZE - 1;
+    memcpy(buffer, f->data + f->pos, n);
+    buffer[n] = 0;
+    return n;
+}
+
+int scan_int(cursor *f, int *x) {
+    // Reads an integer similarly to scanf("%d")
+    char buffer[TOKEN_SIZE];
+    char *end;
+    token(f, buffer);
+    long result = strtol(buffer, &end, 10);
+    if (end == buffer) return 0;
+    *x = result;
+    f->pos += end - buffer;
+    return 1;
+}
+
+int scan_double(cursor *f, double *x) {
+    // Reads a float similarly to scanf("%lf")
+    char buffer[TOKEN_SIZE];
+    char *end;
+    token(f, buffer);
+    double result = strtod(buffer, &end);
+    if (end == buffer) return 0;
+    *x = result;
+    f->pos += end - buffer;
+    return 1;
+}
+
+int is_digit(char c) {
+    return c >= '0' && c <= '9';
+}
+
+int match_float(const char *s, long len, long pos, long *start, long *end) {
+    // Finds the next match of generic.re_float
+    long i, j;
+    for (i=pos; i<len; i++) {
+        j = i;
+        if ((s[j] == '-' || s[j] == '+') && j+1 < len && is_digit(s[j+1])) j++;
+        if (is_digit(s[j])) {
+            while (j<len && is_digit(s[j])) j++;
+            if (j<len && s[j] == '.') j++;
+            while (j<len && is_digit(s[j])) j++;
+            if (j<len && (s[j] == 'e' || s[j] == 'E' || s[j] == 'd' || s[j] == 'D')) {
+                j++;
+                if (j<len && (s[j] == '-' || s[j] == '+')) j++;
+                while (j<len && is_digit(s[j])) j++;
+            }
+            *start = i;
+            *end = j;
+            return 1;
+        }
+        if (i+3 <= len && s[i] == 'n' && s[i+1] == 'a' && s[i+2] == 'n') {
+            *start = i;
+            *end = i+3;
+            return 1;
+        }
+    }
+    return 0;
+}
+
+int match_int(const char *s, long len, long pos, long *start, long *end) {
+    // Finds the next match of generic.re_int
+    long i, j;
+    for (i=pos; i<len; i++) {
+        j = i;
+        if ((s[j] == '-' || s[j] == '+') && j+1 < len && is_digit(s[j+1])) j++;
+        if (is_digit(s[j])) {
+            while (j<len && is_digit(s[j])) j++;
+            *start = i;
+            *end = j;
+            return 1;
+        }
+    }
+    return 0;
+}
+
+double token_float(const char *s, long start, long end) {
+    char buffer[TOKEN_SIZE];
+    long i;
+    if (end - start == 3 && s[start] == 'n') return NAN;
+    if (end - start >= TOKEN_SIZE) end = start + TOKEN_SIZE - 1;
+    for (i=start; i<end; i++) {
+        if (s[i] == 'd' || s[i] == 'D') buffer[i-start] = 'e'; else buffer[i-start] = s[i];
+    }
+    buffer[end-start] = 0;
+    return strtod(buffer, NULL);
+}
+
+long long token_int(const char *s, long start, long end) {
+    char buffer[TOKEN_SIZE];
+    if (end - start >= TOKEN_SIZE) end = start + TOKEN_SIZE - 1;
+    memcpy(buffer, s+start, end-start);
+    buffer[end-start] = 0;
+    return strtoll(buffer, NULL, 10);
+}
+
+long read_floats(cursor *f, double *data, long n, long limit) {
+    long i, start, end;
+    for (i=0; i<n; i++) {
+        if (!match_float(f->data, f->len, f->pos, &start, &end)) break;
+        if (limit >= 0 && end > limit) break;
+        data[i] = token_float(f->data, start, end);
+        f->pos = end;
+    }
+    return i;
+}
+
+long read_ints(cursor *f, long long *data, long n, long limit) {
+    long i, start, end;
+    for (i=0; i<n; i++) {
+        if (!match_int(f->data, f->len, f->pos, &start, &end)) break;
+        if (limit >= 0 && end > limit) break;
+        data[i] = token_int(f->data, start, end);
+        f->pos = end;
+    }
+    return i;
+}
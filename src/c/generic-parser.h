@@ -1,12 +1,39 @@
-void __debug__(FILE *f);
+#include <stdio.h>
 
-int skip_either(char **c, int n, FILE *f);
-int skip(char *c, FILE *f);
-int skip_line(FILE *f);
-int skip_line_n(FILE *f, int n);
+#define TOKEN_SIZE 64
 
-int present_either(char **c, int n, FILE *f);
-int present_either2(char *c1, char *c2, FILE *f);
-int present(char *c, FILE *f);
+typedef struct {
+    const char *data;
+    long len;
+    long pos;
+} cursor;
 
-long int position_of(char *c, FILE *f);
+cursor cursor_new(const char *data, long len);
+
+void __debug__(cursor *f);
+
+long find(const char *c, long n, cursor *f, long limit);
+int skip_either(char **c, int n, cursor *f);
+int skip(char *c, cursor *f);
+int skip_line(cursor *f);
+int skip_line_n(cursor *f, int n);
+
+int present_either(char **c, int n, cursor *f);
+int present_either2(char *c1, char *c2, cursor *f);
+int present(char *c, cursor *f);
+
+long int position_of(char *c, cursor *f);
+long count(char *c, cursor *f);
+
+void skip_space(cursor *f);
+
+int scan_char(cursor *f, char c);
+int scan_int(cursor *f, int *x);
+int scan_double(cursor *f, double *x);
+
+int match_float(const char *s, long len, long pos, long *start, long *end);
+int match_int(const char *s, long len, long pos, long *start, long *end);
+double token_float(const char *s, long start, long end);
+long long token_int(const char *s, long start, long end);
+long read_floats(cursor *f, double *data, long n, long limit);
+long read_ints(cursor *f, long long *data, long n, long limit);
@@ -0,0 +1,114 @@
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <numpy/arrayobject.h>
+#include <stdio.h>
+#include <stdlib.h>
+
+#include "generic-parser.h"
+
+static char module_docstring[] = "A module containing native implementations of generic parsing routines";
+static char generic_floats_docstring[] = "Reads floats into a numpy array";
+static char generic_ints_docstring[] = "Reads integers into a numpy array";
+static PyObject *generic_floats(PyObject *self, PyObject *args);
+static PyObject *generic_ints(PyObject *self, PyObject *args);
+
+static PyMethodDef module_methods[] = {
+    {"generic_floats", generic_floats, METH_VARARGS, generic_floats_docstring},
+    {"generic_ints", generic_ints, METH_VARARGS, generic_ints_docstring},
+    {NULL, NULL, 0, NULL}
+};
+
+PyMODINIT_FUNC initnative_generic(void)
+{
+    PyObject *m = Py_InitModule3("native_generic", module_methods, module_docstring);
+    if (m == NULL)
+        return;
+
+    import_array();
+}
+
+/*
+ * Both routines take (data, pos, n, limit) and return (array, pos).
+ * If n is non-negative exactly n numbers are read or StopIteration is
+ * raised. Otherwise all numbers ending before limit are read.
+ */
+
+static PyObject *numbers(PyObject *args, int type) {
+
+    const char *string_data;
+    Py_ssize_t len;
+    long pos, n, limit;
+    if (!PyArg_ParseTuple(args, "s#lll", &string_data, &len, &pos, &n, &limit))
+        return NULL;
+
+    if (pos < 0 || pos > len) {
+        PyErr_SetString(PyExc_ValueError, "Position out of range");
+        return NULL;
+    }
+
+    cursor f = cursor_new(string_data, len);
+    f.pos = pos;
+    size_t item = type == NPY_DOUBLE ? sizeof(double) : sizeof(long long);
+    npy_intp dims_npy[1];
+    PyObject *result;
+
+    if (n >= 0) {
+        // Read straight into the resulting array
+        dims_npy[0] = n;
+        result = PyArray_SimpleNew(1, dims_npy, type);
+        if (result == NULL) return NULL;
+        void *data = PyArray_DATA((PyArrayObject*)result);
+        long read;
+        if (type == NPY_DOUBLE)
+            read = read_floats(&f, (double*)data, n, -1);
+        else
+            read = read_ints(&f, (long long*)data, n, -1);
+        if (read < n) {
+            Py_DECREF(result);
+            PyErr_SetNone(PyExc_StopIteration);
+            return NULL;
+        }
+        return Py_BuildValue("Nl", result, f.pos);
+    }
+
+    long allocated = 1024;
+    long count = 0;
+    char *data = malloc(item * allocated);
+    if (data == NULL) return PyErr_NoMemory();
+
+    while (1) {
+        long chunk = allocated - count;
+        long read;
+        if (type == NPY_DOUBLE)
+            read = read_floats(&f, ((double*)data) + count, chunk, limit);
+        else
+            read = read_ints(&f, ((long long*)data) + count, chunk, limit);
+        count += read;
+        if (read < chunk) break;
+        allocated *= 2;
+        char *data_new = realloc(data, item * allocated);
+        if (data_new == NULL) {
+            free(data);
+            return PyErr_NoMemory();
+        }
+        data = data_new;
+    }
+
+    dims_npy[0] = count;
+    result = PyArray_SimpleNew(1, dims_npy, type);
+    if (result == NULL) {
+        free(data);
+        return NULL;
+    }
+    memcpy(PyArray_DATA((PyArrayObject*)result), data, item * count);
+    free(data);
+    return Py_BuildValue("Nl", result, f.pos);
+}
+
+static PyObject *generic_floats(PyObject *self, PyObject *args) {
+    return numbers(args, NPY_DOUBLE);
+}
+
+static PyObject *generic_ints(PyObject *self, PyObject *args) {
+    return numbers(args, NPY_LONGLONG);
+}
@@ -1,3 +1,4 @@
+#define PY_SSIZE_T_CLEAN
 #include <Python.h>
 #include <numpy/arrayobject.h>
 #include <stdio.h>
@@ -23,63 +24,64 @@ PyMODINIT_FUNC initnative_openmx(void)
     import_array();
 }
 
-int bands(double **data, int dims[2], FILE *f) {
+int bands_dims(int dims[2], cursor *f) {
 
     int nbands;
-    if (!(fscanf(f, "%d", &nbands) == 1)) return 0;
+    if (!scan_int(f, &nbands)) return 0;
     if (!skip_line_n(f,2)) return 0;
     nbands += 3;
     
     int npath;
-    if (!(fscanf(f, "%d", &npath) == 1)) return 0;
+    if (!scan_int(f, &npath)) return 0;
     
     int i;
     int nk = 0;
     int nk_add;
     for (i=0; i<npath; i++) {
-        if (!(fscanf(f, "%d", &nk_add) == 1)) return 0;
+        if (!scan_int(f, &nk_add)) return 0;
         nk += nk_add;
         if (!skip_line(f)) return 0;
     }
     
-    *data = malloc(sizeof(double) * nk * nbands);
-    if (*data == NULL) return 0;
-    for (i=0; i<nk; i++) {
-        
-        if (!(fscanf(f, "%d", &nk_add) == 1)) {
-            free(*data);
-            return 0;
-        }
-        
-        int j;
-        
-        for (j=0; j<nbands; j++) if (!(fscanf(f, "%lf", (*data) + i*nbands + j) == 1)) {
-            free(*data);
-            return 0;
-        }
-    }
     dims[0] = nk;
     dims[1] = nbands;
     return 1;
 }
 
+int bands(double *data, int dims[2], cursor *f) {
+    
+    int i, j, k;
+    for (i=0; i<dims[0]; i++) {
+        if (!scan_int(f, &k)) return 0;
+        for (j=0; j<dims[1]; j++) if (!scan_double(f, data + i*dims[1] + j)) return 0;
+    }
+    return 1;
+}
+
 static PyObject *openmx_bands_bands(PyObject *self, PyObject *args) {
     
-    char *string_data;
-    if (!PyArg_ParseTuple(args, "s", &string_data))
+    const char *string_data;
+    Py_ssize_t len;
+    if (!PyArg_ParseTuple(args, "s#", &string_data, &len))
         return NULL;
         
-    FILE *f = fmemopen(string_data, strlen(string_data), "r");
-    double *data;
+    cursor f = cursor_new(string_data, len);
     int dims[2];
-    if (!bands(&data, dims, f)) {
+    if (!bands_dims(dims, &f)) {
         PyErr_SetString(PyExc_Exception, "Bands data is broken");
         return NULL;
     }
-    fclose(f);
     
     npy_intp dims_npy[2];
     int i;
     for (i=0; i<2; i++) dims_npy[i] = dims[i];
-    return PyArray_SimpleNewFromData(2, dims_npy, NPY_DOUBLE, data);
+    PyObject *result = PyArray_SimpleNew(2, dims_npy, NPY_DOUBLE);
+    if (result == NULL) return NULL;
+    
+    if (!bands((double*)PyArray_DATA((PyArrayObject*)result), dims, &f)) {
+        Py_DECREF(result);
+        PyErr_SetString(PyExc_Exception, "Bands data is broken");
+        return NULL;
+    }
+    return result;
 }
@@ -1,3 +1,4 @@
+#define PY_SSIZE_T_CLEAN
 #include <Python.h>
 #include <numpy/arrayobject.h>
 #include <stdio.h>
@@ -6,11 +7,20 @@
 #include "generic-parser.h"
 
 static char module_docstring[] = "A module containing native parsing implementations of QE parsing routines";
-static char qeproj_weights_docstring[] = "Retrieves projection weights as a numpy array";
+static char qeproj_weights_docstring[] = "Retrieves projection weights as a numpy array: takes data, lower and upper band bounds (upper < 0 for all bands), sorted k-point indices or None, a flag for double precision and, optionally, the range of bytes to read k-point blocks from";
+static char qeoutput_bands_docstring[] = "Retrieves pw.x band energies (eV) as a numpy array: takes data, starting position and the number of k-points; returns the array and the position behind the last k-point";
+static char qeoutput_positions_docstring[] = "Retrieves coordinates of atoms from ATOMIC_POSITIONS blocks as a numpy array: takes data, positions of blocks and the number of atoms";
 static PyObject *qeproj_weights(PyObject *self, PyObject *string_data);
+static PyObject *qeoutput_bands(PyObject *self, PyObject *args);
+static PyObject *qeoutput_positions(PyObject *self, PyObject *args);
+
+static char format_error_docstring[] = "Raised when the data layout is not supported by native routines";
+static PyObject *FormatError;
 
 static PyMethodDef module_methods[] = {
     {"qe_proj_weights", qeproj_weights, METH_VARARGS, qeproj_weights_docstring},
+    {"qe_output_bands", qeoutput_bands, METH_VARARGS, qeoutput_bands_docstring},
+    {"qe_output_positions", qeoutput_positions, METH_VARARGS, qeoutput_positions_docstring},
     {NULL, NULL, 0, NULL}
 };
 
@@ -20,22 +30,31 @@ PyMODINIT_FUNC initnative_qe(void)
     if (m == NULL)
         return;
 
+    FormatError = PyErr_NewExceptionWithDoc("native_qe.FormatError", format_error_docstring, NULL, NULL);
+    if (FormatError == NULL)
+        return;
+    Py_INCREF(FormatError);
+    PyModule_AddObject(m, "FormatError", FormatError);
+
     import_array();
 }
 
 
-int n_bands(FILE *f) {
+int n_bands(cursor *f) {
+    // Counts bands in the k-point block following the cursor
+    long pos = f->pos;
     if (!skip("k =",f)) return -1;
     int result = 0;
     while (present_either2("==== e(","k =",f) == 0) {
         skip("==== e(",f);
         result++;
     }
+    f->pos = pos;
     return result;
 }
 
-int n_basis(FILE *f) {
-    if (!skip("Calling projwave",f)) return -1;
+int n_basis(cursor *f) {
+    // Counts states listed in the header and moves behind the list
     if (!skip(":\n\n",f)) return -1;
     if (!present("\n\n",f)) return -1;
     int result = 0;
@@ -46,97 +65,328 @@ int n_basis(FILE *f) {
     return result;
 }
 
-int _weights(float **data, int basis_size, int bands_number, FILE *f) {
-    
-    if (!skip("Calling projwave", f)) return -1;
-    
-    int nk = 0;
-    
-    int nk_allocated = 1;
-    int multiplier = bands_number*basis_size;
-    *data = malloc(sizeof(float)*nk_allocated*multiplier);
-    memset(*data, 0, sizeof(*data[0])*nk_allocated*multiplier);
-        
-    while (present("k =", f)) {
+int k_weights(char *data, int type, int ne_min, int ne_max, int basis_size, cursor *f) {
+    // Reads weights for bands in [ne_min, ne_max) of the current k-point
+    int ne;
+    for (ne=0; ne<ne_max; ne++) {
         
-        if (!skip("k =",f)) return -1;
+        if (!skip("==== e(",f)) return 0;
+        if (ne < ne_min) continue;
+        if (!skip_line(f)) return 0;
+        if (!skip("psi =", f)) return 0;
         
-        if (nk == nk_allocated) {
-            nk_allocated = nk_allocated * 2;
-            *data = realloc(*data, sizeof(float)*nk_allocated*multiplier);
-            memset((*data) + nk_allocated*multiplier/2, 0, sizeof(float)*nk_allocated*multiplier/2);
+        int state;
+        double w;
+        while (scan_double(f, &w) && scan_char(f, '*') && scan_char(f, '[') && scan_char(f, '#') && scan_int(f, &state) && scan_char(f, ']')) {
+            if (state < 1 || state > basis_size) return 0;
+            long i = (ne - ne_min)*basis_size + state-1;
+            if (type == NPY_DOUBLE) ((double*)data)[i] = w; else ((float*)data)[i] = w;
+            scan_char(f, '+');
         }
+    }
+    return 1;
+}
+
+static PyObject *qeproj_weights(PyObject *self, PyObject *args) {
+    
+    const char *string_data;
+    Py_ssize_t len;
+    int lower, upper, double_precision;
+    PyObject *k_obj;
+    long begin = 0, end = -1;
+    if (!PyArg_ParseTuple(args, "s#iiOi|ll", &string_data, &len, &lower, &upper, &k_obj, &double_precision, &begin, &end))
+        return NULL;
         
-        int ne;
-                
-        for (ne=0; ne<bands_number; ne++) {
-            
-            if (!skip("==== e(",f)) return -1;
-            if (!skip_line(f)) return -1;
-            if (!skip("psi =", f)) return -1;
-            
-            int state;
-            int w1,w2;
-            while (fscanf(f, "%d.%d*[#%d]+", &w1, &w2, &state) == 3) {
-                (*data)[nk*multiplier + ne*basis_size + state-1] = 1.0*w1+1e-3*w2;
+    cursor f = cursor_new(string_data, len);
+    int type = double_precision ? NPY_DOUBLE : NPY_FLOAT;
+    if (end < 0 || end > len) end = len;
+    // Blocks starting before end
+    long limit = end + 2 < len ? end + 2 : len;
+    
+    // Header
+    if (!skip("Calling projwave", &f)) {
+        PyErr_SetString(FormatError, "Projection data is broken");
+        return NULL;
+    }
+    int basis_size = n_basis(&f);
+    int bands_number = n_bands(&f);
+    if (basis_size < 0 || bands_number < 0) {
+        PyErr_SetString(FormatError, "Projection data is broken");
+        return NULL;
+    }
+    if (f.pos < begin) f.pos = begin;
+    
+    if (upper < 0 || upper > bands_number) upper = bands_number;
+    if (lower < 0) lower = 0;
+    if (lower > upper) lower = upper;
+    
+    // K-points requested: either indices or all blocks in the range.
+    // In the latter case the number of blocks is estimated from the
+    // size of the first one and the array grows if needed.
+    PyArrayObject *k = NULL;
+    long nk;
+    if (k_obj == Py_None) {
+        long first = find("k =", 3, &f, limit);
+        if (first < 0) nk = 0;
+        else {
+            long pos = f.pos;
+            f.pos = first + 3;
+            long second = find("k =", 3, &f, len);
+            f.pos = pos;
+            nk = second < 0 ? 1 : (limit - first) / (second - first) + 1;
+        }
+    } else {
+        k = (PyArrayObject*)PyArray_FROMANY(k_obj, NPY_LONG, 1, 1, NPY_ARRAY_IN_ARRAY);
+        if (k == NULL) return NULL;
+        nk = PyArray_DIM(k, 0);
+    }
+    
+    npy_intp dims_npy[3];
+    dims_npy[0] = nk;
+    dims_npy[1] = upper - lower;
+    dims_npy[2] = basis_size;
+    PyArrayObject *result = (PyArrayObject*)PyArray_ZEROS(3, dims_npy, type, 0);
+    if (result == NULL) {
+        Py_XDECREF(k);
+        return NULL;
+    }
+    
+    // Data: requested k-points are sorted
+    long i = 0, ik = -1, ik_next = -1;
+    int status = 0; // 1: done, -1: broken data, -2: k-point out of range
+    while (1) {
+        char *data = PyArray_DATA(result);
+        long stride = PyArray_STRIDE(result, 0);
+        Py_BEGIN_ALLOW_THREADS
+        for (; i<nk; i++) {
+            if (k == NULL) {
+                long next = find("k =", 3, &f, limit);
+                if (next < 0) {
+                    status = 1;
+                    break;
+                }
+                f.pos = next + 3;
+            } else {
+                ik_next = ((long*)PyArray_DATA(k))[i];
+                if (ik_next <= ik) {
+                    status = -1;
+                    break;
+                }
+                for (; ik<ik_next; ik++) {
+                    long next = find("k =", 3, &f, limit);
+                    if (next < 0) break;
+                    f.pos = next + 3;
+                }
+                if (ik < ik_next) {
+                    status = -2;
+                    break;
+                }
+            }
+            if (!k_weights(data + i*stride, type, lower, upper, basis_size, &f)) {
+                status = -1;
+                break;
             }
-        
         }
+        Py_END_ALLOW_THREADS
         
-        nk++;
-        
+        if (status == 0) {
+            // Either all requested k-points are read or the estimate is exceeded
+            if (k != NULL || find("k =", 3, &f, limit) < 0) status = 1;
+            else nk += nk/2 + 1;
+        }
+        if (status < 0) break;
+        if (status > 0) nk = i;
+        if (nk != PyArray_DIM(result, 0)) {
+            PyArray_Dims shape = {dims_npy, 3};
+            dims_npy[0] = nk;
+            PyObject *resized = PyArray_Resize(result, &shape, 0, NPY_CORDER);
+            if (resized == NULL) {
+                Py_XDECREF(k);
+                Py_DECREF(result);
+                return NULL;
+            }
+            Py_DECREF(resized);
+        }
+        if (status > 0) break;
     }
     
-    return nk;
-    
+    Py_XDECREF(k);
+    if (status < 0) {
+        Py_DECREF(result);
+        if (status == -2) PyErr_Format(PyExc_ValueError, "K-point index out of range: %ld", ik_next);
+        else PyErr_SetString(FormatError, "Projection data is broken");
+        return NULL;
+    }
+    return (PyObject*)result;
 }
 
-int weights(float **data, int dims[3], FILE *f) {
-    
-    long int pos = ftell(f);
-    int result_basis = n_basis(f);
-    fseek(f,pos,SEEK_SET);
+long k_energies(double *data, long n, cursor *f) {
+    // Reads at most n energies of the next k-point block
+    if (!skip("k =",f)) return -1;
+    if (!skip_line_n(f,2)) return -1;
+    long limit = position_of("\n\n",f);
+    if (limit < 0) return -1;
+    return read_floats(f, data, n, limit - 2);
+}
 
-    if (result_basis<0) return 0;
-    
-    pos = ftell(f);
-    int result_bands = n_bands(f);
-    fseek(f,pos,SEEK_SET);
+long k_energies_count(cursor *f) {
+    // Counts energies of the next k-point block without moving the cursor
+    long pos = f->pos;
+    double buffer[TOKEN_SIZE];
+    long read = k_energies(buffer, TOKEN_SIZE, f);
+    long result = read;
+    while (read == TOKEN_SIZE) {
+        read = read_floats(f, buffer, TOKEN_SIZE, position_of("\n\n",f) - 2);
+        result += read;
+    }
+    f->pos = pos;
+    return result;
+}
 
-    if (result_bands<0) return 0;
+static PyObject *qeoutput_bands(PyObject *self, PyObject *args) {
+    
+    const char *string_data;
+    Py_ssize_t len;
+    long pos, nk;
+    if (!PyArg_ParseTuple(args, "s#ll", &string_data, &len, &pos, &nk))
+        return NULL;
+        
+    if (pos < 0 || pos > len || nk < 0) {
+        PyErr_SetString(PyExc_ValueError, "Position or number of k-points out of range");
+        return NULL;
+    }
+    
+    cursor f = cursor_new(string_data, len);
+    f.pos = pos;
     
-    pos = ftell(f);
-    int result = _weights(data, result_basis, result_bands, f);
-    fseek(f,pos,SEEK_SET);
+    long nb;
+    Py_BEGIN_ALLOW_THREADS
+    nb = nk > 0 ? k_energies_count(&f) : 0;
+    Py_END_ALLOW_THREADS
+    if (nb < 0) {
+        PyErr_SetString(FormatError, "Bands data is broken");
+        return NULL;
+    }
+    
+    npy_intp dims_npy[2];
+    dims_npy[0] = nk;
+    dims_npy[1] = nb;
+    PyObject *result = PyArray_SimpleNew(2, dims_npy, NPY_DOUBLE);
+    if (result == NULL) return NULL;
+    double *data = (double*)PyArray_DATA((PyArrayObject*)result);
     
-    if (result<0) {
-        if (*data) free(*data);
-        return 0;
+    // Each block holds exactly nb energies
+    long i;
+    double extra;
+    int success = 1;
+    Py_BEGIN_ALLOW_THREADS
+    for (i=0; i<nk; i++) {
+        if (k_energies(data + i*nb, nb, &f) != nb || read_floats(&f, &extra, 1, position_of("\n\n",&f) - 2) != 0) {
+            success = 0;
+            break;
+        }
     }
+    Py_END_ALLOW_THREADS
     
-    dims[0] = result;
-    dims[1] = result_bands;
-    dims[2] = result_basis;
-    return 1;
+    if (!success) {
+        Py_DECREF(result);
+        PyErr_SetString(FormatError, "Bands data is broken");
+        return NULL;
+    }
+    
+    return Py_BuildValue("Nl", result, f.pos);
 }
 
-static PyObject *qeproj_weights(PyObject *self, PyObject *args) {
+long word(cursor *f) {
+    // Moves behind the next word and returns its length
+    skip_space(f);
+    long start = f->pos;
+    while (f->pos < f->len && !(f->data[f->pos] == ' ' || (f->data[f->pos] >= '\t' && f->data[f->pos] <= '\r'))) f->pos++;
+    return f->pos - start;
+}
+
+int positions(double *data, long *offsets, long nsteps, long n, cursor *f) {
+    // Reads ATOMIC_POSITIONS blocks with the same species in each
+    long *species = malloc(2 * n * sizeof(long));
+    if (species == NULL) return 0;
+    
+    long i, j;
+    int k;
+    int success = 1;
+    for (i=0; i<nsteps && success; i++) {
+        f->pos = offsets[i];
+        if (f->pos < 0 || f->pos > f->len || !skip_line(f)) {
+            success = 0;
+            break;
+        }
+        for (j=0; j<n; j++) {
+            long l = word(f);
+            long start = f->pos - l;
+            if (l == 0) {
+                success = 0;
+                break;
+            }
+            if (i == 0) {
+                species[2*j] = start;
+                species[2*j+1] = l;
+            } else if (species[2*j+1] != l || memcmp(f->data + start, f->data + species[2*j], l) != 0) {
+                success = 0;
+                break;
+            }
+            for (k=0; k<3; k++) if (!scan_double(f, data + (i*n + j)*3 + k)) {
+                success = 0;
+                break;
+            }
+            if (!success) break;
+            if (j < n-1 && !skip_line(f)) {
+                success = 0;
+                break;
+            }
+        }
+    }
+    
+    free(species);
+    return success;
+}
+
+static PyObject *qeoutput_positions(PyObject *self, PyObject *args) {
     
-    char *string_data;
-    if (!PyArg_ParseTuple(args, "s", &string_data))
+    const char *string_data;
+    Py_ssize_t len;
+    PyObject *offsets_obj;
+    long n;
+    if (!PyArg_ParseTuple(args, "s#Ol", &string_data, &len, &offsets_obj, &n))
         return NULL;
         
-    FILE *f = fmemopen(string_data, strlen(string_data), "r");
-    float *data;
-    int dims[3];
-    if (!weights(&data, dims, f)) {
-        PyErr_SetString(PyExc_Exception, "Projection data is broken");
+    if (n <= 0) {
+        PyErr_SetString(PyExc_ValueError, "The number of atoms has to be positive");
         return NULL;
     }
-    fclose(f);
+        
+    PyArrayObject *offsets = (PyArrayObject*)PyArray_FROMANY(offsets_obj, NPY_LONG, 1, 1, NPY_ARRAY_IN_ARRAY);
+    if (offsets == NULL) return NULL;
     
     npy_intp dims_npy[3];
-    int i;
-    for (i=0; i<3; i++) dims_npy[i] = dims[i];
-    return PyArray_SimpleNewFromData(3, dims_npy, NPY_FLOAT, data);
+    dims_npy[0] = PyArray_DIM(offsets, 0);
+    dims_npy[1] = n;
+    dims_npy[2] = 3;
+    PyObject *result = PyArray_SimpleNew(3, dims_npy, NPY_DOUBLE);
+    if (result == NULL) {
+        Py_DECREF(offsets);
+        return NULL;
+    }
+    
+    cursor f = cursor_new(string_data, len);
+    int success;
+    Py_BEGIN_ALLOW_THREADS
+    success = positions((double*)PyArray_DATA((PyArrayObject*)result), (long*)PyArray_DATA(offsets), dims_npy[0], n, &f);
+    Py_END_ALLOW_THREADS
+    
+    Py_DECREF(offsets);
+    if (!success) {
+        Py_DECREF(result);
+        PyErr_SetString(FormatError, "Atomic positions data is broken");
+        return NULL;
+    }
+    return result;
 }
@@ -8,7 +8,7 @@ import json
 import numpy
 from numericalunits import angstrom
 
-from dfttools.types import __angle__
+from dfttools.types import Categorical, __angle__
 from dfttools.presentation import __elements_name_lookup_table__
 
 def __xsf_structure__(cell, tag = None, indent = 4):
@@ -247,6 +247,10 @@ def siesta_input(cell, indent = 4):
     """
     indent = ' '*indent
     species = cell.species().keys()
+    values = Categorical(cell.values)
+    # The label table may hold labels with no atoms left
+    lookup = dict((s, i) for i, s in enumerate(species))
+    index = numpy.array(tuple(lookup.get(i, -1) for i in values.labels.tolist()), dtype = int)[values.codes]
     
     section_csl = "\n".join(tuple(
         indent + "{:d} {:d} {}".format(i+1, __elements_name_lookup_table__[s.lower()][0], s)
@@ -258,7 +262,7 @@ def siesta_input(cell, indent = 4):
             cell.coordinates[i,0],
             cell.coordinates[i,1],
             cell.coordinates[i,2],
-            species.index(cell.values[i]),
+            index[i],
         )
         for i in range(cell.size())
     ))
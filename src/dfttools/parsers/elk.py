@@ -7,9 +7,9 @@ import re
 import numpy
 import numericalunits
 
-from .generic import parse, cre_nonspace, cre_float, cre_word, AbstractParser
+from .generic import parse, cre_nonspace, cre_float, cre_word, AbstractParser, ParseError
 from ..simple import band_structure, unit_cell
-from ..types import UnitCell, Basis
+from ..types import UnitCell, Basis, Trajectory
 from . import default_real_space_basis
 
 class UnitCellsParser(AbstractParser):
@@ -21,20 +21,18 @@ class UnitCellsParser(AbstractParser):
         data (string): contents of GEOMETRY_OPT.OUT file
     """
     
+    filenames = ("GEOMETRY_OPT.OUT",)
+    
     @staticmethod
     def valid_header(header):
         return "! Lattice and atomic position optimisation steps" in header
         
-    @staticmethod
-    def valid_filename(name):
-        return name == "GEOMETRY_OPT.OUT"
-    
     def __tosection__(self, section):
         kw = re.compile(r'\b'+section+r'\b')
         self.parser.skip(kw)
         self.parser.nextLine()
 
-    def __next_unit_cell__(self):
+    def __next_frame__(self):
         
         self.parser.save()
         try:
@@ -79,9 +77,13 @@ class UnitCellsParser(AbstractParser):
             coordinates.append(self.parser.nextFloat(n = (n_at, 6))[:,:3])
             values = values + [name]*n_at
             
+        return vectors, numpy.concatenate(coordinates, axis = 0), values
+        
+    def __next_unit_cell__(self):
+        vectors, coordinates, values = self.__next_frame__()
         return UnitCell(
             default_real_space_basis(vectors),
-            numpy.concatenate(coordinates, axis = 0),
+            coordinates,
             values,
         )
     
@@ -105,6 +107,35 @@ class UnitCellsParser(AbstractParser):
                 break
                 
         return result
+        
+    def trajectory(self):
+        """
+        Retrives the geometry optimization steps as a trajectory.
+        
+        Returns:
+        
+            A Trajectory with all steps.
+        """
+        
+        self.parser.reset()
+        result = []
+        
+        while True:
+            try:
+                result.append(self.__next_frame__())
+            except StopIteration:
+                break
+                
+        if len(result) == 0:
+            raise ParseError("No geometry optimization steps found")
+            
+        vectors, coordinates, values = zip(*result)
+        return Trajectory(
+            vectors,
+            coordinates,
+            values[0],
+            units = "angstrom",
+        )
     
 class Input(UnitCellsParser):
     """
@@ -115,9 +146,7 @@ class Input(UnitCellsParser):
         data (string): contents of elk.in file
     """
     
-    @staticmethod
-    def valid_filename(name):
-        return name == "elk.in"
+    filenames = ("elk.in",)
     
     @staticmethod
     def valid_header(header):
@@ -192,9 +221,7 @@ class Output(AbstractParser):
         data (string): contents of INFO.OUT file
     """
     
-    @staticmethod
-    def valid_filename(name):
-        return name == "INFO.OUT"
+    filenames = ("INFO.OUT",)
 
     @staticmethod
     def valid_header(header):
@@ -266,9 +293,7 @@ class Bands(AbstractParser):
         data (string): contents of Elk BAND.OUT file
     """
     
-    @staticmethod
-    def valid_filename(name):
-        return name == "BAND.OUT"
+    filenames = ("BAND.OUT",)
     
     @band_structure
     def bands(self):
@@ -2,11 +2,23 @@
 Contains helper routines to parse text.
 """
 import re
+import os
+import io
 import sys
 import json
+import mmap
+import bisect
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+from collections import OrderedDict
     
 import numpy
 
+try:
+    from .native_generic import generic_floats, generic_ints
+except ImportError:
+    generic_floats = generic_ints = None
+
 re_float = r"([-+]?[0-9]+\.?[0-9]*(?:[eEdD][-+]?[0-9]*)?)|(nan)"
 re_int = r"([-+]?\d+)"
 re_line = r"^(.*)$"
@@ -14,6 +26,7 @@ re_word = r"(\w+)"
 re_varName = r"(\w[\d\w\(\)\._]+)"
 re_nonspace = r"([^\s]+)"
 re_quotedText = r"(\'.*?\')|(\".*?\")"
+re_restOfLine = r"[^\n]*"
 
 cre_float = re.compile(re_float)
 cre_int = re.compile(re_int)
@@ -22,27 +35,284 @@ cre_word = re.compile(re_word)
 cre_varName = re.compile(re_varName)
 cre_nonspace = re.compile(re_nonspace)
 cre_quotedText = re.compile(re_quotedText,re.DOTALL)
+cre_restOfLine = re.compile(re_restOfLine)
 
 class ParseError(Exception):
     pass
     
+class LiteralMatch(object):
+    """
+    A minimal counterpart of ``re.MatchObject`` returned by
+    ``LiteralPattern``.
+    """
+    
+    __slots__ = ("string", "__start__", "__end__")
+    
+    def __init__(self, string, start, end):
+        self.string = string
+        self.__start__ = start
+        self.__end__ = end
+        
+    def start(self):
+        return self.__start__
+        
+    def end(self):
+        return self.__end__
+        
+    def group(self):
+        return self.string[self.__start__:self.__end__]
+        
+class LiteralPattern(object):
+    """
+    A plain substring search mimicking the subset of ``re.RegexObject``
+    interface used by ``StringParser``. Only applicable to literals
+    which are not affected by case folding.
+    
+    Args:
+    
+        literal (str): the substring to search for.
+    """
+    
+    def __init__(self, literal):
+        self.literal = literal
+        self.pattern = re.escape(literal)
+        
+    def search(self, string, pos = 0):
+        start = string.find(self.literal, pos)
+        if start == -1:
+            return None
+        return LiteralMatch(string, start, start + len(self.literal))
+        
+    def finditer(self, string, pos = 0):
+        while True:
+            match = self.search(string, pos)
+            if match is None:
+                return
+            yield match
+            pos = match.end()
+            
+class LiteralCache(object):
+    """
+    A bounded LRU cache of case-insensitive patterns compiled from
+    string literals.
+    
+    Kwargs:
+    
+        size (int): the maximal number of patterns stored.
+        
+    .. note::
+    
+        The ``hits`` and ``misses`` fields count cache lookups.
+    """
+    
+    def __init__(self, size = 1024):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self.__patterns__ = OrderedDict()
+        
+    def __len__(self):
+        return len(self.__patterns__)
+        
+    def __getitem__(self, literal):
+        try:
+            pattern = self.__patterns__.pop(literal)
+            self.hits += 1
+        except KeyError:
+            self.misses += 1
+            pattern = self.__compile__(literal)
+            if len(self.__patterns__) >= self.size:
+                self.__patterns__.popitem(last = False)
+        self.__patterns__[literal] = pattern
+        return pattern
+        
+    def __compile__(self, literal):
+        if len(literal) > 0 and literal.lower() == literal.upper():
+            return LiteralPattern(literal)
+        else:
+            return re.compile(re.escape(literal),re.I)
+            
+    def clear(self):
+        """
+        Removes all patterns and resets counters.
+        """
+        self.__patterns__.clear()
+        self.hits = 0
+        self.misses = 0
+        
+class AlternativesCache(LiteralCache):
+    """
+    A bounded LRU cache of case-insensitive patterns matching any of
+    several alternatives. The keys are tuples of pattern strings; the
+    values are pairs of the combined pattern and a tuple mapping
+    ``match.lastindex - 1`` to the index of the alternative matched.
+    The value is None if the alternatives cannot be combined, for
+    example, because of duplicate group names.
+    
+    Kwargs:
+    
+        size (int): the maximal number of patterns stored.
+    """
+    
+    def __compile__(self, patterns):
+        # Each alternative is wrapped into an unnamed group which is
+        # always the last one closed
+        groups = []
+        try:
+            for i, p in enumerate(patterns):
+                groups += [i] + [None]*re.compile(p, re.I).groups
+            return re.compile("|".join("({})".format(p) for p in patterns), re.I), tuple(groups)
+        except re.error:
+            return None
+    
+def map_file(f):
+    """
+    Maps a file into memory for reading.
+    
+    Args:
+    
+        f (file): a file object backed by a file descriptor.
+        
+    Returns:
+    
+        A read-only ``mmap.mmap`` object with the contents of the file
+        or None if the file cannot be mapped (empty files, pipes, file
+        objects positioned away from the beginning, etc.).
+    """
+    if not isinstance(f, (file, io.FileIO, io.BufferedReader)):
+        return None
+    try:
+        if f.tell() != 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+    except (EnvironmentError, ValueError):
+        return None
+        
+def map_chunks(function, n, threads = None, minimal = 1024):
+    """
+    Splits a sequence of independent items into contiguous chunks and
+    processes them in threads. Useful with native routines releasing
+    the GIL.
+    
+    Args:
+    
+        function (callable): a function of the first and the last
+        (exclusive) items of a chunk;
+        
+        n (int): the number of items.
+        
+    Kwargs:
+    
+        threads (int): the number of threads, the number of CPUs by
+        default;
+        
+        minimal (int): the minimal number of items per chunk.
+        
+    Returns:
+    
+        A list with results for each chunk in order.
+    """
+    if threads is None:
+        threads = multiprocessing.cpu_count()
+    n_chunks = max(1, min(threads, n // minimal))
+    bounds = list(n*i//n_chunks for i in range(n_chunks+1))
+    chunks = list(zip(bounds[:-1], bounds[1:]))
+    
+    if n_chunks == 1:
+        return [function(*chunks[0])]
+        
+    pool = ThreadPool(n_chunks)
+    try:
+        return pool.map(lambda x: function(*x), chunks)
+    finally:
+        pool.close()
+        pool.join()
+        
 class AbstractParser(object):
     """
     A root class for text parsers.
     
     Args:
     
-        data (str): text to parse or a file to read.
+        data (str,file): text to parse or a file to read. Use
+        ``from_path`` to parse a file by its path.
+        
+    .. note::
+    
+        Files are memory-mapped where possible: ``self.data`` is then a
+        read-only ``mmap.mmap`` object rather than ``str`` and the data
+        is paged in by the OS on demand. The mapping is released by
+        ``close`` or when leaving the ``with`` block::
+        
+            with Parser.from_path("output") as p:
+                p.bands()
+        
+    .. note::
+    
+        Literals listed in ``markers`` class field are indexed by
+        ``self.parser``: see ``StringParser``.
+        
+    .. note::
+    
+        Large data may be parsed in ``threads`` threads (class field,
+        the number of CPUs if None): see ``map_chunks``.
+        
+    .. note::
+    
+        ``valid_header`` receives the first ``header_size`` bytes of
+        the file (class field). Parsers with signatures located further
+        into the file may declare a larger size at the expense of
+        reading more data during automatic detection.
     """
     
+    markers = ()
+    threads = None
+    filenames = ()
+    extensions = ()
+    header_size = 4*1024
+    
     def __init__(self, file):
         if hasattr(file,"read"):
             self.file = file
-            self.data = file.read()
+            self.data = map_file(file)
+            if self.data is None:
+                self.data = file.read()
         else:
             self.file = None
             self.data = file
-        self.parser = parse(self.data)
+        self.parser = parse(self.data, markers = self.markers)
+        
+    @classmethod
+    def from_path(cls, path):
+        """
+        Opens a file and prepares a parser for it.
+        
+        Args:
+        
+            path (str): a path to the file.
+            
+        Returns:
+        
+            A new parser.
+        """
+        with open(path, "rb") as f:
+            result = cls(f)
+        result.file = None
+        return result
+        
+    def close(self):
+        """
+        Releases the memory-mapped data, if any. The parser cannot be
+        used afterwards.
+        """
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+            
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, *args):
+        self.close()
     
     @staticmethod
     def valid_header(header):
@@ -52,7 +322,8 @@ class AbstractParser(object):
         
         Args:
         
-            header (str): the file header;
+            header (str): the file header, at most ``header_size``
+            bytes;
             
         Returns:
         
@@ -60,11 +331,14 @@ class AbstractParser(object):
         """
         raise NotImplementedError
         
-    @staticmethod
-    def valid_filename(name):
+    @classmethod
+    def valid_filename(cls, name):
         """
         Checks whether the file name is an expected one. Used in
-        automatic determination of file format.
+        automatic determination of file format. The default
+        implementation compares the base name against ``filenames``
+        and the end of the name against ``extensions`` (case
+        insensitive) class fields.
         
         Args:
         
@@ -74,7 +348,10 @@ class AbstractParser(object):
         
             True if the name is as expected.
         """
-        raise NotImplementedError
+        if len(cls.filenames) == 0 and len(cls.extensions) == 0:
+            raise NotImplementedError
+        l = name.lower()
+        return os.path.basename(name) in cls.filenames or any(l.endswith(i.lower()) for i in cls.extensions)
         
 class AbstractJSONParser(AbstractParser):
     """
@@ -86,6 +363,8 @@ class AbstractJSONParser(AbstractParser):
     """
     
     def __init__(self, data):
+        if hasattr(data, "read"):
+            data = data.read()
         if isinstance(data, (str, unicode)):
             self.json = json.loads(data)
         elif isinstance(data, dict):
@@ -107,19 +386,86 @@ class StringParser(object):
     
     Args:
     
-        string (str): input string to be parsed.
+        string (str,mmap.mmap): input string to be parsed.
+        
+    Kwargs:
+    
+        markers (list): string literals to index. Offsets of all
+        occurrences of each marker are recorded by a single scan upon
+        the first use of the marker. Subsequent ``goto``, ``skip``,
+        ``present``, ``distance`` and ``closest`` calls with markers are
+        resolved by a binary search in these offsets.
         
     .. note::
         
         The input string can be further accessed by ``self.string``
-        field. The contents of the string is not copied.
+        field. The contents of the string is not copied: all matching
+        is performed in place starting from the caret position.
     
     """
     
-    def __init__(self, string):
+    literals = LiteralCache()
+    alternatives = AlternativesCache()
+    
+    def __init__(self, string, markers = ()):
         self.string = string
         self.__position__ = 0
         self.__history__ = []
+        self.__markers__ = dict((i, None) for i in markers if len(i) > 0)
+        
+    def __compile__(self, expression):
+        """
+        Retrieves a compiled pattern for the expression. String literals
+        are compiled once and shared between all instances through
+        ``StringParser.literals``.
+        """
+        if isinstance(expression, str):
+            return self.literals[expression]
+        return expression
+        
+    def __offsets__(self, expression):
+        """
+        Retrieves sorted offsets of all (possibly overlapping)
+        occurrences of a marker or None if the expression is not a
+        marker.
+        """
+        if not isinstance(expression, str) or not expression in self.__markers__:
+            return None
+        offsets = self.__markers__[expression]
+        if offsets is None:
+            pattern = self.__compile__(expression)
+            offsets = []
+            match = pattern.search(self.string, 0)
+            while not match is None:
+                offsets.append(match.start())
+                match = pattern.search(self.string, match.start() + 1)
+            self.__markers__[expression] = offsets
+        return offsets
+        
+    def __indexed__(self, expression, n = 1):
+        """
+        Locates nth occurrence of a marker using the index.
+        
+        Returns:
+        
+            Start and end of the occurrence or None if the expression
+            is not a marker.
+            
+        Raises:
+        
+            StopIteration: No occurrences left in the string.
+        """
+        offsets = self.__offsets__(expression)
+        if offsets is None:
+            return None
+        end = self.__position__
+        for i in range(n):
+            j = bisect.bisect_left(offsets, end)
+            if j == len(offsets):
+                raise StopIteration
+            start = offsets[j]
+            end = start + len(expression)
+        return start, end
         
     def goto(self, expression, n = 1):
         """
@@ -139,12 +485,15 @@ class StringParser(object):
         
             StopIteration: No occurrences left in the string.
         """
-        if isinstance(expression, str):
-            expression = re.compile(re.escape(expression),re.I)
-        ex_it = expression.finditer(self.string[self.__position__:])
+        indexed = self.__indexed__(expression, n)
+        if not indexed is None:
+            self.__position__ = indexed[0]
+            return
+        expression = self.__compile__(expression)
+        ex_it = expression.finditer(self.string, self.__position__)
         for i in range(n):
             start = next(ex_it).start()
-        self.__position__ += start
+        self.__position__ = start
         
     def pop(self):
         """
@@ -195,12 +544,15 @@ class StringParser(object):
         
             StopIteration: No occurrences left in the string.
         """
-        if isinstance(expression, str):
-            expression = re.compile(re.escape(expression),re.I)
-        ex_it = expression.finditer(self.string[self.__position__:])
+        indexed = self.__indexed__(expression, n)
+        if not indexed is None:
+            self.__position__ = indexed[1]
+            return
+        expression = self.__compile__(expression)
+        ex_it = expression.finditer(self.string, self.__position__)
         for i in range(n):
             end = next(ex_it).end()
-        self.__position__ += end
+        self.__position__ = end
             
     def skipAll(self, expression):
         """
@@ -216,15 +568,14 @@ class StringParser(object):
         
             StopIteration: No occurrences left in the string.
         """
-        if isinstance(expression, str):
-            expression = re.compile(re.escape(expression),re.I)
-        ex_it = expression.finditer(self.string[self.__position__:])
+        expression = self.__compile__(expression)
+        ex_it = expression.finditer(self.string, self.__position__)
         end = next(ex_it).end()
         while True:
             try:
                 end = next(ex_it).end()
             except StopIteration:
-                self.__position__ += end
+                self.__position__ = end
                 return
         
     def present(self, expression):
@@ -274,10 +625,12 @@ class StringParser(object):
         
             StopIteration: No occurrences left in the string.
         """
-        if isinstance(expression, str):
-            expression = re.compile(re.escape(expression),re.I)
-        ex_it = expression.finditer(self.string[self.__position__:])
         try:
+            indexed = self.__indexed__(expression, n)
+            if not indexed is None:
+                return indexed[0] - self.__position__
+            expression = self.__compile__(expression)
+            ex_it = expression.finditer(self.string, self.__position__)
             for i in range(n):
                 start = next(ex_it).start()
         except StopIteration:
@@ -285,13 +638,62 @@ class StringParser(object):
                 raise
             else:
                 return default
-        return start
+        return start - self.__position__
         
-    def reset(self):
+    def offsets(self, expression, n = None):
+        """
+        Locates non-overlapping occurrences of an expression after the
+        caret. The caret is not moved.
+        
+        Args:
+        
+            expression (str,re.RegexObject): expression to locate.
+            
+        Kwargs:
+        
+            n (int): the number of occurrences to locate, all by
+            default.
+            
+        Returns:
+        
+            A numpy array with positions of occurrences.
+            
+        Raises:
+        
+            StopIteration: Less than *n* occurrences left in the string.
+        """
+        result = []
+        indexed = self.__offsets__(expression)
+        
+        if indexed is None:
+            for match in self.__compile__(expression).finditer(self.string, self.__position__):
+                if len(result) == n:
+                    break
+                result.append(match.start())
+                
+        else:
+            end = self.__position__
+            for i in indexed[bisect.bisect_left(indexed, end):]:
+                if len(result) == n:
+                    break
+                if i >= end:
+                    result.append(i)
+                    end = i + len(expression)
+                    
+        if not n is None and len(result) < n:
+            raise StopIteration
+        return numpy.array(result, dtype = numpy.int64)
+        
+    def reset(self, position = 0):
         """
         Resets the caret to the beginning of the string.
+        
+        Kwargs:
+        
+            position (int): an absolute position to put the caret to
+            instead, such as the one returned by ``offsets``.
         """
-        self.__position__ = 0
+        self.__position__ = position
         
     def nextMatch(self, match, n = None):
         """
@@ -318,12 +720,18 @@ class StringParser(object):
             StopIteration: Not enough matches left in the string.
                 
         """
-        ex_it = match.finditer(self.string[self.__position__:])
+        return self.__collect__(match.finditer(self.string, self.__position__), n)
+        
+    def __collect__(self, ex_it, n):
+        """
+        Collects matches from an iterator over match objects and moves
+        the caret behind the last one. See ``nextMatch`` for the meaning
+        of *n*.
+        """
         if n is None:
             match = next(ex_it)
-            result = match.group()
-            self.__position__ += match.end()
-            return result
+            self.__position__ = match.end()
+            return match.group()
         elif isinstance(n,(int, list, tuple, numpy.ndarray)):
             n_elements = n if isinstance(n,int) else numpy.prod(n)
             result = numpy.zeros(n_elements, dtype = object)
@@ -331,12 +739,12 @@ class StringParser(object):
                 for x in range(n_elements):
                     match = next(ex_it)
                     result[x] = match.group()
-                self.__position__ += match.end()
+                self.__position__ = match.end()
             return result.reshape(n)
         else:
-            lim = self.distance(n)
+            lim = self.__position__ + self.distance(n)
             result = []
-            end = 0
+            end = self.__position__
             while True:
                 try:
                     match = next(ex_it)
@@ -348,8 +756,35 @@ class StringParser(object):
                         break
                 except StopIteration:
                     break
-            self.__position__ += end
+            self.__position__ = end
             return numpy.array(result, dtype = object)
+            
+    def __nextNumbers__(self, native, n):
+        """
+        Reads numbers straight into a numpy array using a native
+        tokenizer. See ``nextMatch`` for the meaning of *n*.
+        """
+        if isinstance(n,(int, list, tuple, numpy.ndarray)):
+            n_elements = int(numpy.prod(n))
+            result, self.__position__ = native(self.string, self.__position__, n_elements, -1)
+            return result.reshape(n)
+        else:
+            limit = self.__position__ + self.distance(n)
+            result, self.__position__ = native(self.string, self.__position__, -1, limit)
+            return result
+            
+    def __lines__(self):
+        """
+        Iterates over lines starting from the caret. The first line
+        yielded is the remainder of the current line.
+        """
+        # re_line relies on "^" which does not match at an arbitrary
+        # search position: match the rest of each line explicitly
+        start = self.__position__
+        while start <= len(self.string):
+            match = cre_restOfLine.match(self.string, start)
+            yield match
+            start = match.end() + 1
 
     def matchAfter(self,after,match,n = None):
         """
@@ -424,11 +859,12 @@ class StringParser(object):
             array([ 7.,  8.,  9.])
                 
         """
-        result = self.nextMatch(cre_int, n = n)
         if n is None:
-            return int(result)
+            return int(self.nextMatch(cre_int))
+        elif not generic_ints is None and not isinstance(self.string, unicode):
+            return self.__nextNumbers__(generic_ints, n)
         else:
-            return result.astype(numpy.int)
+            return self.nextMatch(cre_int, n = n).astype(numpy.int)
             
     def intAfter(self, after, n = None):
         """
@@ -500,11 +936,12 @@ class StringParser(object):
             array([ 3.7  ,  0.562])
                 
         """
-        result = self.nextMatch(cre_float, n = n)
         if n is None:
-            return float(result.replace('d','e').replace('D','E'))
+            return float(self.nextMatch(cre_float).replace('d','e').replace('D','E'))
+        elif not generic_floats is None and not isinstance(self.string, unicode):
+            return self.__nextNumbers__(generic_floats, n)
         else:
-            return result.astype(numpy.float)
+            return self.nextMatch(cre_float, n = n).astype(numpy.float)
             
     def floatAfter(self, after, n = None):
         """
@@ -570,11 +1007,36 @@ class StringParser(object):
         """
         if self.__position__ == len(self.string):
             raise StopIteration
-        result = self.nextMatch(cre_line, n = n)
+        result = self.__collect__(self.__lines__(), n)
         if self.__position__ < len(self.string):
             self.__position__ += 1
         return result
         
+    def nextNative(self, native, *args):
+        """
+        Reads data with a native routine starting from the caret.
+        
+        Args:
+        
+            native (callable): a routine taking the string, the caret
+            position and *args* and returning the data read and the new
+            caret position.
+            
+        Returns:
+        
+            The data returned by *native*. The caret is put behind the
+            data read. If *native* raises the caret is not moved.
+            
+        Raises:
+        
+            ValueError: the string is unicode and cannot be passed to
+            *native* as a buffer.
+        """
+        if isinstance(self.string, unicode):
+            raise ValueError("Native routines do not support unicode strings")
+        result, self.__position__ = native(self.string, self.__position__, *args)
+        return result
+        
     def startOfLine(self):
         """
         Goes to the beginning of the current line.
@@ -602,8 +1064,15 @@ class StringParser(object):
         Returns:
         
             Index of the closest expression. The distance is measured to
-            the beginnings of matches. Returns None if none of
-            expressions matched.
+            the beginnings of matches. If several expressions match at
+            the same position the first one is reported. Returns None if
+            none of expressions matched.
+            
+        .. note::
+        
+            All expressions are combined into a single pattern and
+            matched in a single pass stopping at the first match unless
+            they are all markers or cannot be combined.
         
         Example:
         
@@ -612,14 +1081,26 @@ class StringParser(object):
             2
             
         """
-        patterns = tuple(re.escape(i) if isinstance(i,str) else i.pattern for i in exprs)
-        match = re.search("("+(")|(".join(patterns))+")",self.string[self.__position__:],re.I)
+        if len(exprs) == 0:
+            return None
+            
+        combined = None
+        if not all(isinstance(i, str) and i in self.__markers__ for i in exprs):
+            combined = self.alternatives[tuple(self.__compile__(i).pattern for i in exprs)]
+            
+        if combined is None:
+            result = None
+            for i, e in enumerate(exprs):
+                d = self.distance(e, default = -1)
+                if d >= 0 and (result is None or d < distance):
+                    result, distance = i, d
+            return result
+            
+        pattern, groups = combined
+        match = pattern.search(self.string, self.__position__)
         if match is None:
             return None
         else:
-            matchedString = match.group()
-            for i in range(len(patterns)):
-                if not re.search(patterns[i],matchedString,re.I) is None:
-                    return i
+            return groups[match.lastindex - 1]
 
 parse = StringParser
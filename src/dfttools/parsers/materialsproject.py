@@ -2,6 +2,12 @@
 Parsing `Materials Project <http://materialsproject.org/>`_ responses.
 """
 import json
+import os
+import hashlib
+import tempfile
+import time
+from multiprocessing.pool import ThreadPool
+
 import requests
 
 import numpy
@@ -14,6 +20,200 @@ from . import default_real_space_basis
 
 GATEWAY = "https://www.materialsproject.org/rest/v1/"
 
+class Client(object):
+    """
+    A client of Materials Project REST API. The client keeps a pool of
+    HTTP connections, checks the API key once and, optionally, stores
+    responses on disk.
+    
+    Args:
+    
+        api_key (str): Materials Project API key;
+        
+    Kwargs:
+    
+        gateway (str): the API root, ``GATEWAY`` by default;
+        
+        workers (int): the maximal number of concurrent requests;
+        
+        cache (str): a folder to store responses in, nothing is stored
+        by default;
+        
+        ttl (float): the time in seconds for stored responses to stay
+        valid.
+    """
+    
+    def __init__(self, api_key, gateway = None, workers = 4, cache = None, ttl = 24*3600):
+        self.api_key = api_key
+        self.gateway = GATEWAY if gateway is None else gateway
+        self.workers = workers
+        self.cache = cache
+        self.ttl = ttl
+        self.key_valid = False
+        
+        self.session = requests.Session()
+        self.session.headers["x-api-key"] = api_key
+        adapter = requests.adapters.HTTPAdapter(pool_connections = 1, pool_maxsize = workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        
+        if not cache is None and not os.path.isdir(cache):
+            os.makedirs(cache)
+        
+    def __cached__(self, request):
+        """
+        Retrieves a path to the stored response. Responses depend on the
+        API key and are stored separately for each key.
+        """
+        key = "\n".join((self.api_key, self.gateway, request))
+        return os.path.join(self.cache, hashlib.sha1(key).hexdigest()+".json")
+        
+    def request(self, request, cache = True):
+        """
+        Performs a request and initial checks of the response.
+        
+        Args:
+        
+            request (str): Materials Project request;
+            
+        Kwargs:
+        
+            cache (bool): if False, the stored response is not used.
+            
+        Returns:
+        
+            A json object with the response.
+            
+        Raises:
+        
+            RuntimeError: the server responds with a status other than
+            200 or the response is not valid. Such responses are never
+            stored.
+        """
+        cache = cache and not self.cache is None
+        
+        if cache:
+            path = self.__cached__(request)
+            try:
+                if time.time() - os.path.getmtime(path) < self.ttl:
+                    with open(path, "r") as f:
+                        return json.load(f)
+            except (IOError, OSError, ValueError):
+                pass
+                
+        r = self.session.get('{}{}'.format(self.gateway, request))
+        if r.status_code != 200:
+            raise RuntimeError("Server responds {:d}".format(r.status_code))
+            
+        try:
+            r_json = r.json()
+        except:
+            raise RuntimeError("Response JSON could not be parsed:\n{}".format(r.text))
+            
+        if isinstance(r_json, dict) and r_json.get("valid_response") is False:
+            raise RuntimeError("The response is not valid:\n{}".format(r.text))
+            
+        if cache:
+            handle, temp = tempfile.mkstemp(dir = self.cache)
+            try:
+                with os.fdopen(handle, "w") as f:
+                    f.write(r.text.encode("utf-8"))
+                os.rename(temp, path)
+            finally:
+                if os.path.exists(temp):
+                    os.remove(temp)
+            
+        return r_json
+        
+    def check_key(self):
+        """
+        Checks the API key once per client. Raises an exception if check
+        failed.
+        """
+        if self.key_valid:
+            return
+            
+        r_json = self.request("api_check", cache = False)
+            
+        if not "api_key_valid" in r_json:
+            raise RuntimeError("The response does not contain key 'api_key_valid':\n{}".format(str(r_json)))
+            
+        if not r_json["api_key_valid"]:
+            raise RuntimeError("The key is not valid")
+            
+        self.key_valid = True
+        
+    def download_structures(self, query, skip_key_check = False):
+        """
+        Downloads structure information for a given query.
+        
+        Args:
+        
+            query (str): query string;
+        
+        Kwargs:
+        
+            skip_key_check (bool): skips the key check if set to True;
+            
+        Returns:
+            
+            A parser of the response data.
+        """
+        if not skip_key_check:
+            self.check_key()
+        return JSONResponse(self.request('materials/{}/vasp/structure'.format(query)))
+        
+    def download_many(self, queries, skip_key_check = False):
+        """
+        Downloads structure information for several queries, at most
+        ``workers`` at a time.
+        
+        Args:
+        
+            queries (list): query strings such as material IDs;
+            
+        Kwargs:
+        
+            skip_key_check (bool): skips the key check if set to True;
+            
+        Returns:
+        
+            A list of parsers of the response data in the order of
+            queries.
+        """
+        if not skip_key_check:
+            self.check_key()
+            
+        queries = list(queries)
+        if self.workers is None or self.workers < 2 or len(queries) < 2:
+            return list(self.download_structures(i, skip_key_check = True) for i in queries)
+            
+        pool = ThreadPool(min(self.workers, len(queries)))
+        try:
+            return pool.map(lambda i: self.download_structures(i, skip_key_check = True), queries)
+        finally:
+            pool.close()
+            pool.join()
+        
+__clients__ = {}
+
+def get_client(api_key):
+    """
+    Retrieves a client for the given API key. Clients are kept for the
+    lifetime of the interpreter.
+    
+    Args:
+    
+        api_key (str): Materials Project API key.
+        
+    Returns:
+    
+        A Client object.
+    """
+    if not (api_key, GATEWAY) in __clients__:
+        __clients__[api_key, GATEWAY] = Client(api_key)
+    return __clients__[api_key, GATEWAY]
+    
 def __request__(api_key, request):
     """
     Performs a request and initial checks of the response of Materials
@@ -25,20 +225,7 @@ def __request__(api_key, request):
     Returns:
         A json object with the response.
     """
-    r = requests.get('{}{}'.format(GATEWAY, request),
-        headers = {
-            "x-api-key": api_key,
-        }
-    )
-    if r.status_code == 404:
-        raise RuntimeError("Server responds 404")
-        
-    try:
-        r_json = r.json()
-    except:
-        raise RuntimeError("Response JSON could not be parsed:\n{}".format(r.text))
-        
-    return r_json
+    return get_client(api_key).request(request)
     
 def check_key(api_key):
     """
@@ -46,13 +233,7 @@ def check_key(api_key):
     Args:
         api_key (str): Materials Project API key;
     """
-    r_json = __request__(api_key, "api_check")
-        
-    if not "api_key_valid" in r_json:
-        raise RuntimeError("The response does not contain key 'api_key_valid':\n{}".format(str(r_json)))
-        
-    if not r_json["api_key_valid"]:
-        raise RuntimeError("The key is not valid")
+    get_client(api_key).check_key()
 
 def download_structures(api_key, query, skip_key_check=False):
     """
@@ -67,10 +248,7 @@ def download_structures(api_key, query, skip_key_check=False):
     Returns:
         A parser of the response data.
     """
-    if not skip_key_check:
-        check_key(api_key)
-    r_json = __request__(api_key, 'materials/{}/vasp/structure'.format(query))
-    return JSONResponse(r_json)
+    return get_client(api_key).download_structures(query, skip_key_check = skip_key_check)
 
 class JSONResponse(AbstractJSONParser):
     """
@@ -84,23 +262,31 @@ class JSONResponse(AbstractJSONParser):
         
         result = []
         
-        if isinstance(root,list):
-            for i in root:
-                result += self.unitCells(root = i)
+        # Depth-first traversal
+        stack = [iter((root,))]
+        while len(stack) > 0:
+            
+            try:
+                node = next(stack[-1])
+            except StopIteration:
+                stack.pop()
+                continue
+                
+            if isinstance(node, list):
+                stack.append(iter(node))
+                
+            elif isinstance(node, dict):
+                if "@class" in node and node["@class"] == "Structure":
+                    b = default_real_space_basis(numpy.array(node["lattice"]["matrix"])*numericalunits.angstrom)
+                    coords = []
+                    vals = []
+                    for s in node["sites"]:
+                        coords.append(s["abc"])
+                        vals.append(s["label"])
+                    result.append(UnitCell(b,coords,vals))
                 
-        elif isinstance(root, dict):
-            if "@class" in root and root["@class"] == "Structure":
-                b = default_real_space_basis(numpy.array(root["lattice"]["matrix"])*numericalunits.angstrom)
-                coords = []
-                vals = []
-                for s in root["sites"]:
-                    coords.append(s["abc"])
-                    vals.append(s["label"])
-                return [UnitCell(b,coords,vals)]
-            
-            else:
-                for k,v in root.items():
-                    result += self.unitCells(root = v)
+                else:
+                    stack.append(node.itervalues())
                     
         return result
     
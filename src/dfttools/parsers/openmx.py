@@ -5,8 +5,10 @@ import re
 import warnings
 import math
 import json
+import hashlib
 import os
 import os.path
+import multiprocessing
 
 import numpy
 import numericalunits
@@ -14,8 +16,8 @@ import numericalunits
 from .generic import parse, cre_varName, cre_word, cre_nonspace, re_int, cre_int, cre_float, AbstractParser, AbstractJSONParser, ParseError
 from .structure import cube
 from .native_openmx import openmx_bands_bands
-from ..simple import band_structure, unit_cell, guess_parser, parse, tag_method
-from ..types import UnitCell, Basis
+from ..simple import band_structure, unit_cell, get_manifest, parse, tag_method
+from ..types import UnitCell, Basis, Trajectory
 from . import default_real_space_basis
 
 def populations(s):
@@ -42,7 +44,20 @@ def populations(s):
         
     return result
     
-def joint_populations(files):
+def __descriptor__(data):
+    """
+    Hashes bands and basis description of decoded Lowdin populations.
+    """
+    return hashlib.sha1(json.dumps((data["bands"], data["basis"]), sort_keys = True)).hexdigest()
+    
+def __k_populations__(s):
+    """
+    Decodes per-k data of Lowdin populations.
+    """
+    data = json.loads(s)
+    return data["k-id"], __descriptor__(data), data["k"], data["energies"], data["weights"]
+    
+def joint_populations(files, workers = None):
     """
     Collects several files with Lowdin populations and parses them into
     a single object.
@@ -50,6 +65,11 @@ def joint_populations(files):
     Args:
     
         files (list of str): file contents in an array.
+        
+    Kwargs:
+    
+        workers (int): the number of processes to decode files in, the
+        files are decoded in this process by default.
     
     Returns:
     
@@ -58,40 +78,55 @@ def joint_populations(files):
     if len(files) == 0:
         raise ValueError("Empty array passed")
         
-    parsed = {}
-    for f in files:
-        p = populations(f)
-        parsed[p["k-id"]] = p
-
-    collected = {
-        "k": [],
-        "energies": [],
-        "weights": [],
-    }
-    for i in range(len(parsed)):
-        
-        if not i in parsed:
-            raise ValueError("Missing data at k-point #{:d}".format(i))
-        p = parsed[i]
-        p2 = parsed[0]
-        
-        if i>0:
-            if not numpy.all(p["bands"] == p2["bands"]):
-                raise ValueError("Different bands reported at k #0 and k #{:d}".format(i))
-            for k in p["basis"].keys() + p2["basis"].keys():
-                if not k in p["basis"] or not k in p2["basis"]:
-                    raise ValueError("The basis description '{}' is missing for k #0 or k #{:d}".format(k,i))
-                if not numpy.all(p["basis"][k] == p2["basis"][k]):
-                    raise ValueError("The basis description '{}' is different for k #0 and k #{:d}".format(k,i))
-        
-        for c in collected.keys():
-            collected[c].append(p[c])
-        
-    result = parsed[0]
-    del result["k-id"]
-    for c in collected.keys():
-        result[c] = numpy.array(collected[c])
+    # The first file sizes the output
+    first = json.loads(files[0])
+    descriptor = __descriptor__(first)
+    nk = len(files)
+    nb = len(first["bands"])
+    ns = len(first["weights"][0]) if nb > 0 else 0
+    
+    result = dict((k, v) for k, v in first.items() if not k in ("k-id", "k", "energies", "weights"))
+    result["bands"] = numpy.array(result["bands"])
+    for field in result["basis"].keys():
+        result["basis"][field] = numpy.array(result["basis"][field])
+    first = first["k-id"]
+        
+    result["k"] = numpy.empty((nk, 3))
+    result["energies"] = numpy.empty((nk, nb))
+    result["weights"] = numpy.empty((nk, nb, ns))
+    done = numpy.zeros(nk, dtype = bool)
+    
+    if workers is None:
+        pool = None
+        decoded = (__k_populations__(i) for i in files)
+    else:
+        pool = multiprocessing.Pool(workers)
+        decoded = pool.imap_unordered(__k_populations__, files)
+        
+    try:
+        for i, h, k, energies, weights in decoded:
+            
+            if not 0 <= i < nk or done[i]:
+                raise ValueError("Unexpected data at k-point #{:d}".format(i))
+                
+            if not h == descriptor:
+                raise ValueError("Different bands or basis reported at k #{:d} and k #{:d}".format(first, i))
+                
+            result["k"][i] = k
+            result["energies"][i] = energies
+            result["weights"][i] = weights
+            done[i] = True
+            
+    finally:
+        # All results are consumed unless an error occurs
+        if not pool is None:
+            pool.terminate()
+            pool.join()
+            
+    if not numpy.all(done):
+        raise ValueError("Missing data at k-point #{:d}".format(numpy.argmin(done)))
         
+    result["energies"] *= numericalunits.Hartree
     return result
     
 class JSON_DOS(AbstractJSONParser):
@@ -103,14 +138,12 @@ class JSON_DOS(AbstractJSONParser):
         data (str): contents of OpenMX JSON DoS file.
     """
     
+    extensions = (".Dos.json",)
+    
     @staticmethod
     def valid_header(header):
         return "openmx-dos-negf" in header
         
-    @staticmethod
-    def valid_filename(name):
-        return name.endswith(".Dos.json")
-        
     def __init__(self, data):
         super(JSON_DOS, self).__init__(data)
         self.__set_units__("energy",numericalunits.Hartree)
@@ -392,6 +425,15 @@ class Output(AbstractParser):
         data (string): contents of OpenMX output file
     """
         
+    markers = (
+        "lattice vectors (bohr)",
+        "MD or geometry opt. at MD",
+        "maximum force",
+        "XYZ(ang)",
+        "***",
+        "Utot  =",
+    )
+    
     @staticmethod
     def valid_header(header):
         return "Welcome to OpenMX" in header and "T. Ozaki" in header
@@ -463,9 +505,33 @@ class Output(AbstractParser):
         
             A set of all unit cells found.
         """
-        self.parser.reset()
         cells = []
         
+        for shape, coordinates in self.__frames__(noraise):
+            
+            try:
+                cells.append(UnitCell(
+                    default_real_space_basis(shape),
+                    coordinates,
+                    startingCell.values,
+                    c_basis = "cartesian",
+                ))
+                
+            except:
+                if not noraise:
+                    raise
+                else:
+                    return cells
+                    
+        return cells
+        
+    def __frames__(self, noraise):
+        """
+        Iterates over lattice vectors and cartesian coordinates of
+        relaxation steps.
+        """
+        self.parser.reset()
+        
         while self.parser.present("lattice vectors (bohr)"):
             
             try:
@@ -482,36 +548,71 @@ class Output(AbstractParser):
                     self.parser.skip("XYZ(ang)")
                     coordinates.append(self.parser.nextFloat(3)*numericalunits.angstrom)
                     
-                cells.append(UnitCell(
-                    default_real_space_basis(shape),
-                    coordinates,
-                    startingCell.values,
-                    c_basis = "cartesian",
-                ))
-                
+            except StopIteration:
+                # Would silently end this generator
+                if not noraise:
+                    raise ParseError("Relaxation step data is truncated")
+                else:
+                    return
+                    
             except:
                 if not noraise:
                     raise
                 else:
-                    return cells
+                    return
+                    
+            yield shape, coordinates
+            
+    def trajectory(self, startingCell, noraise = False):
+        """
+        Retrieves atomic positions data for relax calculation as a
+        trajectory.
         
-        return cells
+        Args:
+        
+            startingCell (qetools.cell.Cell): a unit cell from the input
+            file. It is required since no chemical captions are written
+            in the output.
+            
+        Kwargs:
+        
+            noraise (bool): retirieves as much structures as possible
+            without raising exceptions.
+        
+        Returns:
+        
+            A Trajectory with all unit cells found.
+        """
+        frames = []
+        for shape, coordinates in self.__frames__(noraise):
+            if noraise and not len(coordinates) == startingCell.size():
+                break
+            frames.append((shape, coordinates))
+            
+        if len(frames) == 0:
+            raise ParseError("No relaxation steps found")
+            
+        shapes, coordinates = zip(*frames)
+        return Trajectory(
+            shapes,
+            coordinates,
+            startingCell.values,
+            c_basis = "cartesian",
+            units = "angstrom",
+        )
     
     @tag_method("unit-cell", take_file = True)
     def __unit_cells_silent__(self, f):
         # Search for an input file
-        directory = os.path.dirname(f.name)
-        file_names = list(os.path.join(directory,i) for i in os.listdir(directory))
-        for name in file_names:
-            if os.path.isfile(name):
-                with open(name, "r") as f:
-                    if Input in guess_parser(f):
-                        try:
-                            c = Input(f.read()).unitCell()
-                            if c.size() == self.nat():
-                                return self.unitCells(c, noraise = True)
-                        except:
-                            pass
+        directory = os.path.dirname(os.path.abspath(f.name))
+        for name in get_manifest(directory).find(Input):
+            with open(name, "r") as f:
+                try:
+                    c = Input(f.read()).unitCell()
+                    if c.size() == self.nat():
+                        return self.unitCells(c, noraise = True)
+                except:
+                    pass
         
         raise ParseError("Could not locate corresponding input file")
                         
@@ -611,9 +712,7 @@ class Bands(AbstractParser):
         data (string): contents of OpenMX Band file
     """
         
-    @staticmethod
-    def valid_filename(name):
-        return name.endswith(".Band")
+    extensions = (".Band",)
         
     def fermi(self):
         """
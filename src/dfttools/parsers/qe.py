@@ -7,10 +7,10 @@ import re
 import numpy
 import numericalunits
 
-from .generic import parse, cre_varName, cre_word, cre_float, cre_quotedText, re_float, cre_int, ParseError, AbstractParser
-from .native_qe import qe_proj_weights
+from .generic import parse, cre_varName, cre_word, cre_float, cre_quotedText, re_float, cre_int, ParseError, AbstractParser, map_chunks
+from .native_qe import qe_proj_weights, qe_output_bands, qe_output_positions, FormatError
 from ..simple import band_structure, unit_cell, tag_method
-from ..types import UnitCell, Basis
+from ..types import UnitCell, Basis, Trajectory
 from . import default_real_space_basis
 
 class Bands(AbstractParser):
@@ -108,10 +108,107 @@ class Output(AbstractParser):
         data (str): string with the contents of the output file.
     """
         
+    markers = (
+        "End of self-consistent calculation",
+        "End of band structure calculation",
+        "the Fermi energy is",
+        "highest occupied level",
+        "estimated scf accuracy",
+        "Total force =",
+        "!    total energy",
+        "total cpu time spent up to now is",
+        "ATOMIC_POSITIONS",
+        "CELL_PARAMETERS",
+        "k =",
+    )
+    
+    def __init__(self, file):
+        super(Output, self).__init__(file)
+        self.__tables__ = {}
+        
     @staticmethod
     def valid_header(header):
         return "Program PWSCF" in header
         
+    def __table__(self, expression):
+        """
+        Retrieves (once) offsets of all occurrences of an expression.
+        """
+        if not expression in self.__tables__:
+            self.parser.save()
+            self.parser.reset()
+            self.__tables__[expression] = self.parser.offsets(expression)
+            self.parser.pop()
+        return self.__tables__[expression]
+        
+    def __sections__(self):
+        """
+        Retrieves (once) the table of calculation sections. Each section
+        starts behind "End of self-consistent calculation" or "End of
+        band structure calculation" and ends at the next one.
+        
+        Returns:
+        
+            Numpy arrays with positions of the section markers,
+            beginnings and ends of sections and their kinds: 0 for
+            self-consistent and 1 for band structure calculations.
+        """
+        if not None in self.__tables__:
+            scf = self.__table__("End of self-consistent calculation")
+            bands = self.__table__("End of band structure calculation")
+            
+            starts = numpy.concatenate((scf, bands))
+            kinds = numpy.concatenate((numpy.zeros(len(scf), dtype = int), numpy.ones(len(bands), dtype = int)))
+            order = numpy.argsort(starts, kind = "mergesort")
+            starts = starts[order]
+            kinds = kinds[order]
+            
+            begin = starts + numpy.where(kinds == 0, len("End of self-consistent calculation"), len("End of band structure calculation"))
+            end = numpy.append(starts[1:], len(self.parser.string))
+            self.__tables__[None] = starts, begin, end, kinds
+            
+        return self.__tables__[None]
+        
+    def __section__(self, index):
+        """
+        Retrieves bounds of the section with the given (possibly
+        negative) index.
+        """
+        starts, begin, end, kinds = self.__sections__()
+        if not -len(begin) <= index < len(begin):
+            raise ParseError("Only {:d} calculations found ({:d} requested)".format(len(begin), index))
+        return begin[index], end[index]
+        
+    def __first__(self, expressions, begin, end):
+        """
+        Locates the first occurrence of any of expressions in between
+        begin and end.
+        
+        Returns:
+        
+            The position and the index of the expression or None if
+            nothing found.
+        """
+        result = None
+        for i, e in enumerate(expressions):
+            offsets = self.__table__(e)
+            j = numpy.searchsorted(offsets, begin)
+            if j < len(offsets) and offsets[j] < end and (result is None or offsets[j] < result[0]):
+                result = offsets[j], i
+        return result
+        
+    def __floats__(self, expression, offsets):
+        """
+        Reads floats behind each occurrence of an expression.
+        """
+        result = []
+        self.parser.save()
+        for i in offsets:
+            self.parser.reset(i + len(expression))
+            result.append(self.parser.nextFloat())
+        self.parser.pop()
+        return numpy.array(result)
+        
     def success(self):
         """
         Checks for success signature in the end of the file.
@@ -120,7 +217,7 @@ class Output(AbstractParser):
         
             True if the signature is present.
         """
-        return 'JOB DONE.' in self.data
+        return self.data.find('JOB DONE.') != -1
         
     def routineError(self):
         """
@@ -137,23 +234,38 @@ class Output(AbstractParser):
         else:
             return result[0]
         
-    def scf_accuracy(self):
+    def scf_accuracy(self, index = None):
         """
         Retrieves scf convergence history.
         
+        Kwargs:
+        
+            index (int): index of a calculation to retrieve convergence
+            history for. Supports negative indexing. The history of all
+            calculations is retrieved by default.
+        
         Returns:
         
             A numpy array containing estimated errors after all scf
             steps during calculations. The energies are given in **eV**.
         """
-        self.parser.reset()
-        result = []
-        
-        while self.parser.present("estimated scf accuracy"):
-            self.parser.skip("estimated scf accuracy")
-            result.append(self.parser.nextFloat())
+        offsets = self.__table__("estimated scf accuracy")
+        
+        if not index is None:
+            # The history lasts until the convergence report
+            starts, begin, end, kinds = self.__sections__()
+            self.__section__(index)
+            index = index % len(starts)
+            bounds = []
+            for i in (index-1, index):
+                if i < 0:
+                    bounds.append(0)
+                else:
+                    found = self.__first__(("convergence has been achieved", "convergence NOT achieved"), begin[i], end[i])
+                    bounds.append(end[i] if found is None else found[0])
+            offsets = offsets[numpy.searchsorted(offsets, bounds[0]):numpy.searchsorted(offsets, bounds[1])]
             
-        return numpy.array(result)*numericalunits.Ry
+        return self.__floats__("estimated scf accuracy", offsets)*numericalunits.Ry
         
     def scf_steps(self):
         """
@@ -174,65 +286,80 @@ class Output(AbstractParser):
         
             True if the signature is present.
         """
-        return 'convergence NOT achieved' in self.data
+        return self.data.find('convergence NOT achieved') != -1
         
-    def fermi(self):
+    def fermi(self, index = None):
         """
         Retrieves Fermi energies.
         
+        Kwargs:
+        
+            index (int): index of a calculation to retrieve the Fermi
+            energy for. Supports negative indexing. Fermi energies of
+            all calculations are retrieved by default.
+        
         Returns:
         
-            A numpy array containing Fermi energies for each MD step.
+            A numpy array containing Fermi energies for each MD step or
+            a single Fermi energy (None if not found) if *index* is
+            specified.
         """
-        result = []
-        self.parser.reset()
+        expressions = ("the Fermi energy is", "highest occupied level")
         
-        while True:
-            
-            parseMode = self.parser.closest(("End of self-consistent calculation","End of band structure calculation"))
-            
-            if parseMode is None:
-                break
-            elif parseMode == 0:
-                self.parser.skip("End of self-consistent calculation")
-            elif parseMode == 1:
-                self.parser.skip("End of band structure calculation")
+        if not index is None:
+            found = self.__first__(expressions, *self.__section__(index))
+            if found is None:
+                return None
+            return self.__floats__(expressions[found[1]], found[:1])[0]*numericalunits.eV
             
-            x = self.parser.closest(("the Fermi energy is","highest occupied level","End of self-consistent calculation","End of band structure calculation"))
-            
-            if x == 0:
-                self.parser.skip("the Fermi energy is")
-                result.append(self.parser.nextFloat()*numericalunits.eV)
-                
-            elif x == 1:
-                self.parser.skip("highest occupied level")
-                result.append(self.parser.nextFloat()*numericalunits.eV)
-            
-            elif x == 2 or x == 3:
-                result.append(None)
-                
+        result = []
+        starts, begin, end, kinds = self.__sections__()
+        
+        for i in range(len(begin)):
+            found = self.__first__(expressions, begin[i], end[i])
+            if found is None:
+                # No record for the last calculation is omitted
+                if i < len(begin) - 1:
+                    result.append(None)
             else:
-                break
+                result.append(self.__floats__(expressions[found[1]], found[:1])[0]*numericalunits.eV)
             
         return numpy.array(result)
 
-    def force(self):
+    def force(self, index = None):
         """
         Retrieves total force.
         
+        Kwargs:
+        
+            index (int): index of a calculation to retrieve the total
+            force for. Supports negative indexing. Forces of all
+            calculations are retrieved by default.
+        
         Returns:
         
             A numpy array containing total forces for each
-            self-consistent calculation.
-        """
-        self.parser.reset()
-        result = []
+            self-consistent calculation or a single total force (None if
+            not found) if *index* is specified.
+            
+        .. note::
         
-        while self.parser.present("Total force ="):
-            self.parser.skip("Total force =")
-            result.append(self.parser.nextFloat())
+            Unlike ``fermi`` and ``scf_accuracy``, the array retrieved
+            by default lists only calculations reporting a force while
+            *index* counts all calculations. Thus ``force(i)`` differs
+            from ``force()[i]`` if some calculations before *i*, such
+            as band structure calculations, report no force.
+        """
+        if not index is None:
+            found = self.__first__(("Total force =",), *self.__section__(index))
+            if found is None:
+                return None
+            offsets = found[:1]
+        else:
+            offsets = self.__table__("Total force =")
             
-        return numpy.array(result)*numericalunits.Ry/numericalunits.aBohr
+        result = self.__floats__("Total force =", offsets)*numericalunits.Ry/numericalunits.aBohr
+        return result if index is None else result[0]
         
     def total(self):
         """
@@ -299,88 +426,239 @@ class Output(AbstractParser):
         else:
             return alat*numericalunits.aBohr
     
-    @unit_cell
-    def unitCells(self):
+    def __frames__(self):
         """
-        Retrieves atomic position data.
+        Iterates over atomic position data.
         
-        Returns:
+        Yields:
         
-            A set of all unit cells found.
+            Lattice vectors, coordinates, captions and a flag which is
+            True if coordinates are cartesian.
         """
-        result = []
+        # StopIteration would silently end this generator: report
+        # truncated data as ParseError instead
+        try:
+            alat = self.alat()
+            
+            self.parser.reset()
+            
+            # Parse initial unit cell
+            self.parser.skip("number of atoms/cell")
+            n = self.parser.nextInt()
+            
+            self.parser.skip("crystal axes: (cart. coord. in units of alat)")
+            shape = self.parser.nextFloat((3,4))[:,1:]*alat
+            
+            self.parser.skip("Cartesian axes")
+            coordinates = numpy.zeros((n,3))
+            captions = numpy.zeros(n,dtype = 'S2')
+            self.parser.nextLine(3)
+            
+            for i in range(n):
+                
+                self.parser.nextInt()
+                captions[i] = self.parser.nextMatch(cre_word)
+                self.parser.skip("=")
+                coordinates[i,:] = self.parser.nextFloat(3)
+                
+        except StopIteration:
+            raise ParseError("Initial atomic positions are missing or truncated")
+            
+        yield shape, coordinates*alat, captions, True
         
-        alat = self.alat()
+        # Parse MD steps
+        self.parser.save()
+        try:
+            steps = self.__steps_native__(n, shape, alat)
+        except FormatError:
+            steps = None
+        except StopIteration:
+            raise ParseError("Atomic positions data is truncated")
+        self.parser.pop()
+        
+        if steps is None:
+            steps = self.__steps_python__(n, shape, alat)
+            
+        for step in steps:
+            yield step
+            
+    def __cell_parameters__(self, alat):
+        
+        self.parser.skip("CELL_PARAMETERS")
+        mode = self.parser.closest(("(alat=", "(angstrom)"))
+        if mode == 0:
+            alat = self.parser.nextFloat()*numericalunits.aBohr
+            shape = self.parser.nextFloat((3,3))*alat
+        elif mode == 1:
+            shape = self.parser.nextFloat((3,3))*numericalunits.angstrom
+        else:
+            raise RuntimeError("Unknown format")
+            
+        return shape, alat
         
-        self.parser.reset()
+    @staticmethod
+    def __units__(units, alat):
+        
+        if units == "crystal":
+            return 1, False
+        elif units == "alat":
+            return alat, True
+        elif units == "bohr":
+            return numericalunits.aBohr, True
+        elif units == "angstrom":
+            return numericalunits.angstrom, True
+        else:
+            raise ParseError("Unknown units: %s" % units)
+        
+    def __steps_native__(self, n, shape, alat):
         
-        # Parse initial unit cell
-        self.parser.skip("number of atoms/cell")
-        n = self.parser.nextInt()
+        string = self.parser.string
+        if isinstance(string, unicode):
+            raise FormatError("Native routines do not support unicode strings")
+        positions = self.parser.offsets("ATOMIC_POSITIONS")
+        if len(positions) == 0:
+            return []
+        cells = self.parser.offsets("CELL_PARAMETERS")
         
-        self.parser.skip("crystal axes: (cart. coord. in units of alat)")
-        shape = self.parser.nextFloat((3,4))[:,1:]*alat
-        basis = default_real_space_basis(shape)
+        # All coordinates in one go
+        coordinates = qe_output_positions(string, positions, n)
         
-        self.parser.skip("Cartesian axes")
-        coordinates = numpy.zeros((n,3))
-        captions = numpy.zeros(n,dtype = 'S2')
-        self.parser.nextLine(3)
+        # Captions are the same in every block
+        end = positions[1] if len(positions) > 1 else len(string)
+        lines = string[positions[0]:end].split("\n", n+1)[1:n+1]
+        captions = numpy.array(list(i.split()[0] for i in lines), dtype = 'S2')
         
-        for i in range(n):
+        # The first cell block in between two atomic blocks applies
+        has_cell = numpy.diff(numpy.concatenate(((0,), numpy.searchsorted(cells, positions)))) > 0
+        
+        result = []
+        for i, p in enumerate(positions):
             
-            self.parser.nextInt()
-            captions[i] = self.parser.nextMatch(cre_word)
-            self.parser.skip("=")
-            coordinates[i,:] = self.parser.nextFloat(3)
+            if has_cell[i]:
+                shape, alat = self.__cell_parameters__(alat)
+            self.parser.skip("ATOMIC_POSITIONS")
+            
+            units = cre_word.search(string, p + len("ATOMIC_POSITIONS")).group()
+            factor, cartesian = self.__units__(units, alat)
+            result.append((shape, coordinates[i]*factor, captions, cartesian))
             
-        coordinates *= alat
-        result.append(UnitCell(basis, coordinates, captions, c_basis = "cartesian"))
+        return result
+        
+    def __steps_python__(self, n, shape, alat):
         
-        # Parse MD steps
         while self.parser.present("ATOMIC_POSITIONS"):
             
             coordinates = numpy.zeros((n,3))
             captions = numpy.zeros(n,dtype = 'S2')
             
-            # Check if vcr steps are present
-            if self.parser.present("CELL_PARAMETERS") and (self.parser.distance("CELL_PARAMETERS")<self.parser.distance("ATOMIC_POSITIONS")):
+            try:
                 
-                self.parser.skip("CELL_PARAMETERS")
-                mode = self.parser.closest(("(alat=", "(angstrom)"))
-                if mode == 0:
-                    alat = self.parser.nextFloat()*numericalunits.aBohr
-                    shape = self.parser.nextFloat((3,3))*alat
-                elif mode == 1:
-                    shape = self.parser.nextFloat((3,3))*numericalunits.angstrom
-                else:
-                    raise RuntimeError("Unknown format")
-                basis = default_real_space_basis(shape)
-            
-            # Parse atomic data
-            self.parser.skip("ATOMIC_POSITIONS")
-            units = self.parser.nextMatch(cre_word)
-            
-            for i in range(n):
+                # Check if vcr steps are present
+                if self.parser.present("CELL_PARAMETERS") and (self.parser.distance("CELL_PARAMETERS")<self.parser.distance("ATOMIC_POSITIONS")):
+                    shape, alat = self.__cell_parameters__(alat)
                 
-                captions[i] = self.parser.nextMatch(cre_word)
-                coordinates[i,:] = self.parser.nextFloat(3)
-                self.parser.nextLine()
+                # Parse atomic data
+                self.parser.skip("ATOMIC_POSITIONS")
+                units = self.parser.nextMatch(cre_word)
                 
-            if units == "crystal":
-                result.append(UnitCell(basis, coordinates, captions))
-            elif units == "alat":
-                result.append(UnitCell(basis, coordinates*alat, captions, c_basis = "cartesian"))
-            elif units == "bohr":
-                result.append(UnitCell(basis, coordinates*numericalunits.aBohr, captions, c_basis = "cartesian"))
-            else:
-                raise ParseError("Unknown units: %s" % units)
+                for i in range(n):
+                    
+                    captions[i] = self.parser.nextMatch(cre_word)
+                    coordinates[i,:] = self.parser.nextFloat(3)
+                    self.parser.nextLine()
+                    
+            except StopIteration:
+                raise ParseError("Atomic positions data is truncated")
+                
+            factor, cartesian = self.__units__(units, alat)
+            yield shape, coordinates*factor, captions, cartesian
+                
+    @unit_cell
+    def unitCells(self):
+        """
+        Retrieves atomic position data.
+        
+        Returns:
+        
+            A set of all unit cells found.
+        """
+        result = []
+        
+        for shape, coordinates, captions, cartesian in self.__frames__():
+            result.append(UnitCell(
+                default_real_space_basis(shape),
+                coordinates,
+                captions,
+                c_basis = "cartesian" if cartesian else None,
+            ))
                 
         return result
         
+    def trajectory(self):
+        """
+        Retrieves atomic position data as a trajectory.
+        
+        Returns:
+        
+            A Trajectory with all unit cells found.
+        """
+        frames = list(self.__frames__())
+        if len(frames) == 0:
+            raise ParseError("No atomic positions found")
+            
+        shapes, coordinates, captions, cartesian = zip(*frames)
+        return Trajectory(
+            shapes,
+            coordinates,
+            captions[0],
+            c_basis = cartesian,
+            units = "angstrom",
+        )
+        
     def __bands_energies__(self, parseMode_kp, basis, kpoints, fermi, alat):
         
         n_kp = len(kpoints)
+        
+        try:
+            energies = self.__bands_energies_native__(n_kp)*numericalunits.eV
+        except (FormatError, StopIteration):
+            energies = self.__bands_energies_python__(n_kp)
+            
+        if parseMode_kp == 0:
+            c = UnitCell(basis, kpoints, energies)
+        else:
+            c = UnitCell(basis, kpoints*2*math.pi/alat, energies, c_basis = "cartesian")
+        
+        if not fermi is None:
+            c.meta["Fermi"] = fermi
+            
+        return c
+        
+    def __bands_energies_native__(self, n_kp):
+        
+        string = self.parser.string
+        if isinstance(string, unicode):
+            raise FormatError("Native routines do not support unicode strings")
+        offsets = self.parser.offsets("k =", n_kp)
+        
+        def read(first, last):
+            return qe_output_bands(string, offsets[first], last - first)[0]
+            
+        chunks = map_chunks(read, n_kp, threads = self.threads)
+        
+        # Each chunk takes the number of bands from its first k-point
+        if len(set(i.shape[1:] for i in chunks)) > 1:
+            raise FormatError("Bands data is broken")
+        energies = numpy.concatenate(chunks)
+        
+        # Move the caret behind the last k-point
+        self.parser.goto("k =", n_kp)
+        self.parser.nextNative(qe_output_bands, 1)
+        
+        return energies
+        
+    def __bands_energies_python__(self, n_kp):
+        
         energies = []
             
         for i in range(n_kp):
@@ -394,17 +672,9 @@ class Output(AbstractParser):
                 
             energies.append(sub_energies)
             
-        if parseMode_kp == 0:
-            c = UnitCell(basis, kpoints, energies)
-        else:
-            c = UnitCell(basis, kpoints*2*math.pi/alat, energies, c_basis = "cartesian")
-        
-        if not fermi is None:
-            c.meta["Fermi"] = fermi
-            
-        return c
+        return energies
     
-    def bands(self, index = -1, skipVCRelaxException = False):
+    def bands(self, index = -1, skipVCRelaxException = False, lazy = False):
         """
         Retrieves bands.
         
@@ -418,6 +688,10 @@ class Output(AbstractParser):
             relaxation exception. In this very special case no
             reciprocal lattice vectors are provided for the new cells
             in the output file.
+            
+            lazy (bool): if True and *index* is ``None`` a generator
+            parsing band structures one by one is returned instead of a
+            list.
                 
         Returns:
         
@@ -429,7 +703,6 @@ class Output(AbstractParser):
         
             Exception: if a variable cell calculation data found.
         """
-        fermi = self.fermi()
         self.parser.reset()
         if self.parser.present("new lattice vectors") and not skipVCRelaxException:
             raise Exception("Variable cell relaxation output detected. "+
@@ -461,61 +734,27 @@ class Output(AbstractParser):
         else:
             raise Exception("No kpoint data found in the file.")
         
-        bandStructures = []
-            
-        counter = 0
-        
-        while True:
-            
-            parseMode = self.parser.closest(("End of self-consistent calculation","End of band structure calculation"))
-            
-            if parseMode is None:
-                break
-            elif parseMode == 0:
-                self.parser.skip("End of self-consistent calculation")
-            elif parseMode == 1:
-                self.parser.skip("End of band structure calculation")
-                
-            curr_fermi = fermi[counter] if counter < len(fermi) else None
-            
-            if index is None:
-                
-                bandStructures.append(self.__bands_energies__(parseMode_kp, basis, kpoints, curr_fermi, alat))
-                    
-            elif index < 0:
-                
-                self.parser.save()
-            
-            elif index == counter:
-                
-                return self.__bands_energies__(parseMode_kp, basis, kpoints, curr_fermi, alat)
-            
-            counter += 1
-            
         if index is None:
+            bandStructures = self.__bands_all__(parseMode_kp, basis, kpoints, alat)
+            return bandStructures if lazy else list(bandStructures)
             
-            return bandStructures
+        starts, begin, end, kinds = self.__sections__()
+        if not -len(begin) <= index < len(begin):
+            raise ParseError("Only {:d} band structures found ({:d} requested)".format(len(begin), index))
             
-        elif index < 0:
-            
-            if (-index>counter):
-                raise ParseError("Only {:d} band structures found ({:d} requested)".format(counter, index))
-                
-            for i in range(-index):
-                self.parser.pop()
-            
-            c = self.__bands_energies__(parseMode_kp, basis, kpoints, fermi[index] if -index<=len(fermi) else None, alat)
-            
-            for i in range(counter+index):
-                self.parser.pop()
-                
-            return c
-                
-        else:
-            
-            raise ParseError("Only {:d} band structures found ({:d} requested)".format(counter, index))
+        return self.__bands_section__(index, parseMode_kp, basis, kpoints, alat)
+        
+    def __bands_section__(self, index, parseMode_kp, basis, kpoints, alat):
+        
+        fermi = self.fermi(index)
+        self.parser.reset(self.__section__(index)[0])
+        return self.__bands_energies__(parseMode_kp, basis, kpoints, fermi, alat)
+        
+    def __bands_all__(self, parseMode_kp, basis, kpoints, alat):
+        
+        for i in range(len(self.__sections__()[0])):
+            yield self.__bands_section__(i, parseMode_kp, basis, kpoints, alat)
             
-    
     @band_structure
     def __bands_silent__(self):
         return self.bands(skipVCRelaxException = True)
@@ -530,6 +769,13 @@ class Proj(AbstractParser):
         data (str): string with the contents of the output file.
     """
         
+    markers = (
+        "state #",
+        " k = ",
+        "k =",
+        "==== e(",
+    )
+    
     @staticmethod
     def valid_header(header):
         return "Program PROJWFC" in header
@@ -624,10 +870,25 @@ class Proj(AbstractParser):
             
         return states
     
-    def weights(self):
+    def weights(self, lower = 0, upper = None, k = None, dtype = numpy.float32):
         """
-        Retrieves projection weights onto localized basis set.
+        Retrieves projection weights onto localized basis set. The
+        data is read in a single pass: only the requested bands and
+        k-points are stored. All k-points are read in parallel chunks
+        of the data while a subset of k-points is read serially.
+        
+        Kwargs:
         
+            lower (int): the lowest band to read;
+            
+            upper (int): the band to stop at (exclusive), all bands
+            by default;
+            
+            k (array): indices of k-points to read, all k-points by
+            default;
+            
+            dtype (numpy.dtype): either float32 or float64.
+            
         Returns:
         
             A k by n by m numpy array with weights.
@@ -635,8 +896,36 @@ class Proj(AbstractParser):
             * k is a number of k points
             * n is a number of bands
             * m is a localized basis set size
+            
+        Raises:
+        
+            ValueError: unsupported dtype or k-point index out of range.
+            
+            ParseError: projection data is missing or broken.
         """
-        return qe_proj_weights(self.data)
+        dtype = numpy.dtype(dtype)
+        if not dtype in (numpy.float32, numpy.float64):
+            raise ValueError("Unsupported dtype: {}".format(dtype))
+        
+        if upper is None:
+            upper = -1
+            
+        try:
+            if k is None:
+                # Chunks are aligned to k-point blocks natively
+                def read(first, last):
+                    return qe_proj_weights(self.data, lower, upper, None, dtype == numpy.float64, first, last)
+                    
+                return numpy.concatenate(map_chunks(read, len(self.data), threads = self.threads, minimal = 1024*1024))
+                
+            else:
+                k, inverse = numpy.unique(k, return_inverse = True)
+                if k.size > 0 and k[0] < 0:
+                    raise ValueError("K-point index out of range: {:d}".format(k[0]))
+                return qe_proj_weights(self.data, lower, upper, k, dtype == numpy.float64)[inverse]
+                
+        except FormatError:
+            raise ParseError("Projection data is broken")
         
     def _weights(self, lower = 0, upper = None):
         
@@ -683,6 +972,15 @@ class Cond(AbstractParser):
         data (str): string with the contents of the output file.
     """
         
+    markers = (
+        "---  E-Ef",
+        "Nchannels of the left tip =",
+        "Nchannels of the right tip =",
+        "-->",
+        "Total T_j, R_j =",
+        "E-Ef(ev), T =",
+    )
+    
     @staticmethod
     def valid_header(header):
         return "Program PWCOND" in header
@@ -906,7 +1204,7 @@ class Input(AbstractParser):
     def __init__(self, file):
         super(Input,self).__init__(file)
         lines = []
-        for line in self.data.split('\n'):
+        for line in self.data[:].split('\n'):
             if not line.strip().startswith('!'):
                 lines.append(line)
         self.data = "\n".join(lines)
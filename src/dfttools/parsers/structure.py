@@ -4,9 +4,9 @@ Parsing various atomic structure files.
 import numpy
 import numericalunits
 
-from .generic import parse, cre_word, cre_nonspace, AbstractParser
+from .generic import parse, cre_word, cre_nonspace, AbstractParser, ParseError
 from ..simple import band_structure, unit_cell
-from ..types import UnitCell, Basis, Grid
+from ..types import UnitCell, Basis, Grid, Trajectory
 from ..presentation import __elements_table__
 from . import default_real_space_basis
 
@@ -20,56 +20,96 @@ class XSF(AbstractParser):
         data (str): string with the contents of the xsf file.
     """
         
-    @staticmethod
-    def valid_filename(name):
-        return name.lower().endswith(".xsf")
+    extensions = (".xsf",)
         
     @staticmethod
     def valid_header(header):
         l = header.lower()
         return "primvec" in l and "primcoord" in l
     
-    @unit_cell
-    def unitCells(self):
+    def __frames__(self):
         """
-        Retrieves unit cells.
+        Iterates over atomic position data.
         
-        Returns:
+        Yields:
         
-            A set of unit cells with atomic positions data.
+            Lattice vectors, cartesian coordinates and captions.
         """
-        result = []
-        
         self.parser.reset()
         
         while True:
 
             mode = self.parser.closest(("primvec","primcoord"))
             
-            if mode == 0:
-                self.parser.skip("primvec")
-                self.parser.nextLine()
-                shape = self.parser.nextFloat((3,3))*numericalunits.angstrom
+            # StopIteration would silently end this generator
+            try:
                 
-            elif mode == 1:
-                self.parser.skip('primcoord')
-                self.parser.nextLine()
-                n = self.parser.nextInt()
-                coordinates = numpy.zeros((n,3))
-                values = numpy.zeros(n,dtype = 'S2')
-                for i in range(n):
+                if mode == 0:
+                    self.parser.skip("primvec")
+                    self.parser.nextLine()
+                    shape = self.parser.nextFloat((3,3))*numericalunits.angstrom
+                    
+                elif mode == 1:
+                    self.parser.skip('primcoord')
                     self.parser.nextLine()
-                    values[i] = self.parser.nextMatch(cre_word)
-                    coordinates[i,:] = self.parser.nextFloat(3)*numericalunits.angstrom
-                result.append(UnitCell(
-                    default_real_space_basis(shape),
-                    coordinates,
-                    values,
-                    c_basis = 'cartesian'
-                ))
+                    n = self.parser.nextInt()
+                    coordinates = numpy.zeros((n,3))
+                    values = numpy.zeros(n,dtype = 'S2')
+                    for i in range(n):
+                        self.parser.nextLine()
+                        values[i] = self.parser.nextMatch(cre_word)
+                        coordinates[i,:] = self.parser.nextFloat(3)*numericalunits.angstrom
+                    
+                else:
+                    return
+                    
+            except StopIteration:
+                raise ParseError("Atomic structure data is truncated")
                 
-            else:
-                return result
+            if mode == 1:
+                yield shape, coordinates, values
+                
+    @unit_cell
+    def unitCells(self):
+        """
+        Retrieves unit cells.
+        
+        Returns:
+        
+            A set of unit cells with atomic positions data.
+        """
+        return list(UnitCell(
+            default_real_space_basis(shape),
+            coordinates,
+            values,
+            c_basis = 'cartesian'
+        ) for shape, coordinates, values in self.__frames__())
+        
+    def trajectory(self):
+        """
+        Retrieves unit cells as a trajectory. The number and the order
+        of atoms has to be the same in all steps.
+        
+        Returns:
+        
+            A Trajectory with atomic positions data.
+        """
+        frames = list(self.__frames__())
+        if len(frames) == 0:
+            raise ParseError("No atomic positions found")
+            
+        shapes, coordinates, values = zip(*frames)
+        for v in values[1:]:
+            if not numpy.all(v == values[0]):
+                raise ParseError("Atoms differ between steps")
+                
+        return Trajectory(
+            shapes,
+            coordinates,
+            values[0],
+            c_basis = 'cartesian',
+            units = "angstrom",
+        )
                 
     def grids(self):
         """
@@ -153,9 +193,7 @@ class GaussianCube(AbstractParser):
         data (str): string with the contents of the Gaussian CUBE file.
     """
         
-    @staticmethod
-    def valid_filename(name):
-        return name.lower().endswith(".cube")
+    extensions = (".cube",)
                 
     def grid(self):
         """
@@ -264,9 +302,7 @@ class XYZ(AbstractParser):
     
     vacuum_size = numericalunits.nm
         
-    @staticmethod
-    def valid_filename(name):
-        return name.lower().endswith(".xyz")
+    extensions = (".xyz",)
 
     @unit_cell
     def unitCell(self):
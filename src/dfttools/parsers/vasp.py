@@ -1,12 +1,19 @@
 """
 Parsing `VASP <https://www.vasp.at/>`_ files.
 """
+import re
+
+import numpy
 import numericalunits
 
-from .generic import AbstractParser
+from .generic import AbstractParser, ParseError
 from ..simple import band_structure, unit_cell
 from ..types import Basis, UnitCell
 
+cre_k_block = re.compile(r"^ k-point +\d+ :", re.MULTILINE)
+cre_k_header = re.compile(r"\n k-point ")
+cre_blank_line = re.compile(r"\n[ \t]*\n")
+
 class Output(AbstractParser):
     """
     Class for parsing VASP OUTCAR.
@@ -16,14 +23,16 @@ class Output(AbstractParser):
         data (string): contents of OUTCAR file
     """
         
+    markers = (
+        "E-fermi :",
+        "k-point",
+    )
+    filenames = ("OUTCAR",)
+    
     @staticmethod
     def valid_header(header):
         return header.startswith(" vasp.5.4")
         
-    @staticmethod
-    def valid_filename(name):
-        return name == "OUTCAR"
-        
     def fermi(self):
         """
         Retrieves Fermi energies.
@@ -32,12 +41,124 @@ class Output(AbstractParser):
         
             A numpy array containing Fermi energies for each MD step.
         """
-        self.parser.reset()
         result = []
-        while self.parser.present("E-fermi :"):
-            self.parser.skip("E-fermi :")
+        self.parser.save()
+        for i in self.__steps__():
+            self.parser.reset(i + len("E-fermi :"))
             result.append(self.parser.nextFloat()*numericalunits.eV)
+        self.parser.pop()
         return result
+        
+    def __steps__(self):
+        """
+        Locates all "E-fermi" records.
+        """
+        self.parser.save()
+        self.parser.reset()
+        result = self.parser.offsets("E-fermi :")
+        self.parser.pop()
+        return result
+        
+    def __step__(self, index):
+        """
+        Locates k-point blocks of an ionic step.
+        
+        Returns:
+        
+            Bounds of spin channels and the number of k-points.
+        """
+        steps = self.__steps__()
+        if not -len(steps) <= index < len(steps):
+            raise ParseError("Only {:d} ionic steps found ({:d} requested)".format(len(steps), index))
+        index = index % len(steps)
+        
+        string = self.parser.string
+        begin = steps[index]
+        end = steps[index+1] if index + 1 < len(steps) else len(string)
+        
+        # Memory-mapped data has no count method
+        n = sum(1 for i in cre_k_header.finditer(string, begin, end))
+        spin = string.find("spin component 2", begin, end)
+        bounds = [begin, end] if spin == -1 else [begin, spin, end]
+        if n == 0 or not n % (len(bounds)-1) == 0:
+            raise ParseError("Unexpected number of k-point blocks: {:d}".format(n))
+            
+        return bounds, n // (len(bounds)-1)
+        
+    def __spin_channel__(self, begin, nk, nb):
+        """
+        Reads band energies and occupations from consequent k-point
+        blocks in one go.
+        """
+        self.parser.reset(self.parser.string.find("\n k-point ", begin) + len("\n k-point "))
+        data = self.parser.nextFloat((nk, 4+3*nb))
+        
+        # Each block: k-point ID, its coordinates and a table of bands
+        table = data[:,4:].reshape(nk, nb, 3)
+        if not numpy.all(data[:,0] == numpy.arange(1, nk+1)) or not numpy.all(table[...,0] == numpy.arange(1, nb+1)):
+            raise ParseError("Irregular k-point blocks")
+            
+        return table[...,1], table[...,2]
+        
+    def __spin_channel_blocks__(self, begin, end, nb):
+        """
+        Reads band energies and occupations block by block.
+        """
+        blocks = list(i.start() for i in cre_k_block.finditer(self.parser.string, begin, end))
+        result = numpy.empty((len(blocks), nb, 3))
+        for i, b in enumerate(blocks):
+            self.parser.reset(b)
+            self.parser.nextLine(2)
+            result[i] = self.parser.nextFloat((nb, 3))
+        return result[...,1], result[...,2]
+        
+    def __eigenvalues__(self, index):
+        
+        bounds, nk = self.__step__(index)
+        nspin = len(bounds) - 1
+        
+        # The number of bands from the first block
+        self.parser.reset(self.parser.string.find("\n k-point ", bounds[0]))
+        self.parser.nextLine(3)
+        nb = len(self.parser.nextFloat(cre_blank_line)) // 3
+        
+        energies = numpy.empty((nspin, nk, nb))
+        occupations = numpy.empty((nspin, nk, nb))
+        for i in range(nspin):
+            try:
+                energies[i], occupations[i] = self.__spin_channel__(bounds[i], nk, nb)
+            except (ParseError, StopIteration):
+                energies[i], occupations[i] = self.__spin_channel_blocks__(bounds[i], bounds[i+1], nb)
+                
+        return energies*numericalunits.eV, occupations
+        
+    def eigenvalues(self, index = None):
+        """
+        Retrieves band energies and occupations.
+        
+        Kwargs:
+        
+            index (int): index of an ionic step, supports negative
+            indexing. All ionic steps are retrieved by default.
+            
+        Returns:
+        
+            Two numpy arrays with band energies and occupations of shape
+            (spin, nk, nbands) or (steps, spin, nk, nbands) if no index
+            specified.
+        """
+        self.parser.save()
+        try:
+            if index is None:
+                data = list(self.__eigenvalues__(i) for i in range(len(self.__steps__())))
+                if len(data) == 0:
+                    raise ParseError("No ionic steps found")
+                energies, occupations = zip(*data)
+                return numpy.array(energies), numpy.array(occupations)
+            else:
+                return self.__eigenvalues__(index)
+        finally:
+            self.parser.pop()
     
     def __reciprocal__(self):
         self.parser.skip("reciprocal lattice vectors")
@@ -51,9 +172,16 @@ class Output(AbstractParser):
         return self.parser.nextFloat("\n \n").reshape(-1,4)[:,:3]
         
     @band_structure
-    def bands(self):
+    def bands(self, index = 0, spin = 0):
         """
         Retrieves bands.
+        
+        Kwargs:
+        
+            index (int): index of an ionic step, supports negative
+            indexing;
+            
+            spin (int): the spin channel.
             
         Returns:
         
@@ -63,22 +191,14 @@ class Output(AbstractParser):
         basis = self.__reciprocal__()
         k = self.__kpoints__()
         
-        self.parser.skip("E-fermi :")
-        fermi = self.parser.nextFloat()*numericalunits.eV
+        energies = self.eigenvalues(index)[0]
         
-        e = []
-        for i in range(len(k)):
-            self.parser.skip("k-point")
-            self.parser.skip(str(i+1))
-            self.parser.nextLine(2)
-            e.append(self.parser.nextFloat("\n\n").reshape(-1,3)[:,1]*numericalunits.eV)
-            
         result = UnitCell(
             basis,
             k,
-            e,
+            energies[spin],
         )
-        result.meta["Fermi"] = fermi
+        result.meta["Fermi"] = self.fermi()[index]
         return result
         
 class Structure(AbstractParser):
@@ -1,7 +1,7 @@
 """
 This submodule contains data visualization routines.
 """
-from .types import Basis, UnitCell, Grid, __angle__, __xyz2i__
+from .types import Basis, UnitCell, Grid, Categorical, __angle__, __xyz2i__
 
 import math
 import colorsys
@@ -318,10 +318,11 @@ def svgwrite_unit_cell(
     projected = projection.transform_from(cell, cell.coordinates)
     
     # Collect elements
-    elements = tuple(__elements_name_lookup_table__[i.lower()] if i.lower() in __elements_name_lookup_table__ else (-1,) + __unknown_element__ for i in cell.values)
-    e_color = tuple(i[2] for i in elements)
-    e_size = numpy.array(tuple(i[3] for i in elements))*numericalunits.angstrom
-    e_covsize = numpy.array(tuple(i[4] for i in elements))*numericalunits.angstrom
+    species = Categorical(cell.values)
+    elements = tuple(__elements_name_lookup_table__[i.lower()] if i.lower() in __elements_name_lookup_table__ else (-1,) + __unknown_element__ for i in species.labels)
+    e_color = tuple(elements[i][2] for i in species.codes)
+    e_size = numpy.array(tuple(i[3] for i in elements))[species.codes]*numericalunits.angstrom
+    e_covsize = numpy.array(tuple(i[4] for i in elements))[species.codes]*numericalunits.angstrom
     
     # Determine boundaries
     b_min = numpy.min((projected - e_size[...,numpy.newaxis]*circle_size)[visible,:], axis = 0)
@@ -439,14 +440,14 @@ def svgwrite_unit_cell(
                 obj.append(g)
                 obj_z.append(projected[i,2])
         
-    d = cell.distances()
-    
-    if show_bonds:
+    if show_bonds and cell.size() > 0:
+        
+        indptr, indices, distances, images = cell.neighbors(2*e_covsize.max()*bond_ratio, periodic = False)
         
         # Draw lines
-        for i in range(d.shape[0]):
-            for j in range(i,d.shape[1]):
-                if (visible[i] or visible[j]) and (d[i,j]<(e_covsize[i]+e_covsize[j])*bond_ratio) and (d[i,j]>(e_size[i]+e_size[j])*circle_size):
+        for i in range(cell.size()):
+            for j, d in zip(indices[indptr[i]:indptr[i+1]], distances[indptr[i]:indptr[i+1]]):
+                if j > i and (visible[i] or visible[j]) and (d<(e_covsize[i]+e_covsize[j])*bond_ratio) and (d>(e_size[i]+e_size[j])*circle_size):
                     
                     unit = projected[j] - projected[i]
                     unit = unit / ((unit**2).sum())**0.5
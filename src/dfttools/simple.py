@@ -2,12 +2,18 @@
 This submodule contains commonly used shortcuts to parse the data.
 """
 import inspect
+import os
+import hashlib
+import cPickle
+import tempfile
+import multiprocessing
 
 import numericalunits
 
 import parsers
     
 from parsers.generic import AbstractParser, ParseError
+from types import Basis, UnitCell, Grid
 
 def tag_method(*tags, **kwargs):
     """
@@ -42,9 +48,12 @@ def tag_method(*tags, **kwargs):
 band_structure = tag_method("band-structure")
 unit_cell = tag_method("unit-cell")
 
+__parsers__ = {}
+
 def get_all_parsers(*modules):
     """
-    Retrieves all parsers.
+    Retrieves all parsers. The result is computed once per set of
+    modules.
     
     Kwargs:
     
@@ -55,26 +64,203 @@ def get_all_parsers(*modules):
     
         A list of parsing classes.
     """
+    if modules in __parsers__:
+        return list(__parsers__[modules])
     
     parsers.__import_all_parsers__()
     
-    if len(modules) == 0:
-        modules = []
+    names = modules
+    if len(names) == 0:
+        names = []
         for name in dir(parsers):
             obj = getattr(parsers, name)
             if inspect.ismodule(obj):
-                modules.append(name)
+                names.append(name)
     result = []
     
-    for name in modules:
+    for name in names:
         module = getattr(parsers, name)
         for obj_name in dir(module):
             obj = getattr(module, obj_name)
             if inspect.isclass(obj) and issubclass(obj, AbstractParser) and not obj == AbstractParser and not obj in result:
                 result.append(obj)
                 
+    __parsers__[modules] = tuple(result)
     return result
     
+class ParserRegistry(object):
+    """
+    A dispatch table for a set of parser classes: file names and
+    extensions declared by parsers are looked up in dicts, custom
+    ``valid_filename`` and ``valid_header`` checks are collected in
+    lists and tagged methods of each class are indexed by tag.
+    Header checks are grouped by the header size declared by each class.
+    
+    Args:
+    
+        classes (list): parser classes.
+    """
+    
+    def __init__(self, classes):
+        self.classes = list(classes)
+        self.order = dict((c, i) for i, c in enumerate(self.classes))
+        self.filenames = {}
+        self.extensions = {}
+        self.filename_checks = []
+        self.header_checks = []
+        self.tags = {}
+        
+        for c in self.classes:
+            
+            if getattr(c.valid_filename, "__func__", None) is AbstractParser.valid_filename.__func__:
+                for name in c.filenames:
+                    self.filenames.setdefault(name, []).append(c)
+                for ext in c.extensions:
+                    self.extensions.setdefault(ext.lower(), []).append(c)
+            else:
+                self.filename_checks.append(c)
+                
+            if not c.valid_header is AbstractParser.valid_header:
+                self.header_checks.append(c)
+                
+            # Index tagged methods
+            self.tagged(c, None)
+            
+        groups = {}
+        for c in self.header_checks:
+            groups.setdefault(c.header_size, []).append(c)
+        self.header_groups = sorted(groups.items())
+        self.header_sizes = tuple(size for size, classes in self.header_groups)
+                
+    def tagged(self, cls, tag):
+        """
+        Retrieves names of methods of a parser class tagged with a given
+        tag.
+        
+        Args:
+        
+            cls (class): a parser class;
+            
+            tag (str): the tag.
+            
+        Returns:
+        
+            A list of method names.
+        """
+        if not cls in self.tags:
+            tags = {}
+            for a in dir(cls):
+                for t in getattr(getattr(cls, a), "__tags__", ()):
+                    tags.setdefault(t, []).append(a)
+            self.tags[cls] = tags
+        return self.tags[cls].get(tag, [])
+        
+    def __sorted__(self, classes):
+        return sorted(set(classes), key = self.order.get)
+        
+    def by_filename(self, name):
+        """
+        Guesses parsers by the file name.
+        
+        Args:
+        
+            name (str): the file name.
+            
+        Returns:
+        
+            A list of parser candidates.
+        """
+        result = list(self.filenames.get(os.path.basename(name), ()))
+        
+        l = name.lower()
+        for ext, classes in self.extensions.items():
+            if l.endswith(ext):
+                result += classes
+                
+        for c in self.filename_checks:
+            try:
+                if c.valid_filename(name):
+                    result.append(c)
+            except NotImplementedError:
+                pass
+                
+        return self.__sorted__(result)
+        
+    def by_header(self, header):
+        """
+        Guesses parsers by the file header.
+        
+        Args:
+        
+            header (str): the file header.
+            
+        Returns:
+        
+            A list of parser candidates.
+        """
+        return list(c for c in self.header_checks if c.valid_header(header))
+        
+    def methods(self, parser, tag):
+        """
+        Retrieves methods of a parser tagged with a given tag.
+        
+        Args:
+        
+            parser (AbstractParser): a parser;
+            
+            tag (str): the tag.
+            
+        Returns:
+        
+            A list of bound methods.
+        """
+        return list(getattr(parser, a) for a in self.tagged(type(parser), tag))
+        
+    def guess(self, f):
+        """
+        Guesses parsers for a given file. Each parser is checked
+        against the header of the size it declares: a longer header is
+        read only if some parsers need it.
+        
+        Args:
+        
+            f (file): a file to parse.
+            
+        Returns:
+        
+            A list of parser candidates: header matches first followed
+            by file name matches.
+        """
+        name = getattr(f, "name", None)
+        by_name = self.by_filename(name) if isinstance(name, str) else []
+        
+        f.seek(0)
+        header = ""
+        matched = set()
+        for size, classes in self.header_groups:
+            header += f.read(size - len(header))
+            matched.update(c for c in classes if c.valid_header(header))
+        f.seek(0)
+        
+        result = list(c for c in self.header_checks if c in matched)
+        return result + list(c for c in by_name if not c in result)
+        
+__registry__ = None
+
+def get_registry():
+    """
+    Retrieves the registry of all parsers. The registry is built on
+    the first call.
+    
+    Returns:
+    
+        A ParserRegistry object.
+    """
+    global __registry__
+    if __registry__ is None:
+        __registry__ = ParserRegistry(get_all_parsers())
+    return __registry__
+    
 def guess_parser(f):
     """
     Guesses parsers for a given data.
@@ -87,31 +273,329 @@ def guess_parser(f):
     
         A list of parser candidates.
     """
-    result = []
+    return get_registry().guess(f)
+    
+class DirectoryManifest(object):
+    """
+    A listing of files in a folder with parser candidates guessed for
+    each of them. Files are re-examined only if their size or
+    modification time change and only headers are read: see
+    ``ParserRegistry.guess``. Parsers are guessed again only if the
+    largest header read by ``guess`` changes.
+    
+    Args:
+    
+        path (str): the folder.
+        
+    Kwargs:
+    
+        registry (ParserRegistry): a registry to guess parsers with,
+        ``get_registry()`` by default.
+    """
+    
+    def __init__(self, path, registry = None):
+        self.path = path
+        self.registry = get_registry() if registry is None else registry
+        self.entries = {}
+        
+    def __examine__(self, path, stat):
+        """
+        Guesses parsers for a file.
+        """
+        entry = self.entries.get(path)
+        
+        with open(path, "r") as f:
+            h = hashlib.sha1(f.read(max(self.registry.header_sizes + (0,)))).hexdigest()
+            
+            # Only metadata changed
+            if not entry is None and entry["fingerprint"] == h:
+                parsers = entry["parsers"]
+            else:
+                parsers = self.registry.guess(f)
+                
+        return {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "fingerprint": h,
+            "parsers": parsers,
+        }
+        
+    def refresh(self):
+        """
+        Updates the listing.
+        """
+        entries = {}
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            try:
+                stat = os.stat(path)
+                if not os.path.isfile(path):
+                    continue
+                entry = self.entries.get(path)
+                if entry is None or not (entry["size"], entry["mtime"]) == (stat.st_size, stat.st_mtime):
+                    entry = self.__examine__(path, stat)
+            except (IOError, OSError):
+                continue
+            entries[path] = entry
+        self.entries = entries
+        
+    def find(self, parser):
+        """
+        Locates files which can be parsed with a given parser. The
+        listing is refreshed before the lookup.
+        
+        Args:
+        
+            parser (class): a parser class.
+            
+        Returns:
+        
+            A sorted list of paths.
+        """
+        self.refresh()
+        return sorted(k for k, v in self.entries.items() if parser in v["parsers"])
+        
+__manifests__ = {}
+
+def get_manifest(path):
+    """
+    Retrieves a manifest of a folder. Manifests are kept for the
+    lifetime of the interpreter.
+    
+    Args:
+    
+        path (str): the folder.
+        
+    Returns:
+    
+        A DirectoryManifest object.
+    """
+    path = os.path.realpath(path)
+    if not path in __manifests__:
+        __manifests__[path] = DirectoryManifest(path)
+    return __manifests__[path]
+    
+def __pack__(data):
+    """
+    Replaces Basis, UnitCell and Grid objects with dicts of numpy
+    arrays which pickle into a compact binary form.
+    """
+    if isinstance(data, (list, tuple)):
+        return type(data)(__pack__(i) for i in data)
+        
+    for cls in (Grid, UnitCell, Basis):
+        if isinstance(data, cls):
+            result = {
+                "type": "dfttools."+cls.__name__,
+                "vectors": data.vectors,
+                "meta": data.meta,
+            }
+            if not cls is Basis:
+                result["coordinates"] = data.coordinates
+                result["values"] = data.values
+            return result
+            
+    return data
+    
+def __unpack__(data):
+    """
+    Restores objects packed by ``__pack__``.
+    """
+    if isinstance(data, (list, tuple)):
+        return type(data)(__unpack__(i) for i in data)
+        
+    if isinstance(data, dict) and data.get("type") in ("dfttools.Basis", "dfttools.UnitCell", "dfttools.Grid"):
+        basis = Basis(data["vectors"], meta = data["meta"])
+        if data["type"] == "dfttools.UnitCell":
+            return UnitCell(basis, data["coordinates"], data["values"])
+        elif data["type"] == "dfttools.Grid":
+            return Grid(basis, data["coordinates"], data["values"])
+        else:
+            return basis
+            
+    return data
+    
+__revisions__ = {}
+
+def __parser_revision__(cls):
+    """
+    Identifies a parser class and the revision of its source: the
+    qualified class name and a hash of the source file.
+    """
+    try:
+        path = inspect.getsourcefile(cls)
+    except TypeError:
+        path = None
+        
+    if not path in __revisions__:
+        h = hashlib.sha1()
+        try:
+            with open(path, "rb") as f:
+                h.update(f.read())
+        except (IOError, TypeError):
+            pass
+        __revisions__[path] = h.hexdigest()
+        
+    return "{}.{}:{}".format(cls.__module__, cls.__name__, __revisions__[path])
+    
+class ParseCache(object):
+    """
+    A size-bounded on-disk cache of ``parse`` results. Entries are keyed
+    on the file identity (path, inode, size, modification and change
+    times, or the contents hash for files without a path), the data
+    tag, parsing arguments, the parser candidates together with
+    revisions of their source and the current ``numericalunits``
+    scales. The least recently used entries are evicted once the total
+    size exceeds the limit.
+    
+    Args:
+    
+        path (str): a folder to store entries in.
+        
+    Kwargs:
+    
+        size (int): the maximal total size of entries in bytes.
+        
+    .. note::
+    
+        ``numericalunits`` picks random unit scales on import: entries
+        can only be reused by other processes with the same unit system,
+        for example, after ``numericalunits.reset_units("SI")``.
+    """
     
-    # Guess by contents
-    f.seek(0)
-    header = f.read(1024*1024)
-    for parser_class in get_all_parsers():
+    extension = ".dftcache"
+    
+    def __init__(self, path, size = 1024**3):
+        self.path = path
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(path):
+            os.makedirs(path)
+            
+    def __entries__(self):
+        """
+        Lists (modification time, size, path) of all entries.
+        """
+        result = []
+        for name in os.listdir(self.path):
+            if name.endswith(self.extension):
+                path = os.path.join(self.path, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                result.append((stat.st_mtime, stat.st_size, path))
+        return result
+        
+    def __len__(self):
+        return len(self.__entries__())
+        
+    def __path__(self, key):
+        return os.path.join(self.path, key+self.extension)
+        
+    def key(self, f, tag, args, parsers = ()):
+        """
+        Computes a cache key.
+        
+        Args:
+        
+            f (file): a file to parse;
+            
+            tag (str): the data tag;
+            
+            args (tuple): parsing arguments.
+            
+        Kwargs:
+        
+            parsers (list): parser candidates for the file.
+            
+        Returns:
+        
+            A string key or None if the arguments cannot be hashed.
+        """
+        h = hashlib.sha1()
+        
+        name = getattr(f, "name", None)
+        if isinstance(name, str) and os.path.isfile(name):
+            stat = os.stat(name)
+            # The change time cannot be set back unlike the modification time
+            h.update(repr((os.path.realpath(name), stat.st_ino, stat.st_size, stat.st_mtime, stat.st_ctime)))
+            
+        else:
+            f.seek(0)
+            for chunk in iter(lambda: f.read(1024*1024), ""):
+                h.update(chunk)
+            f.seek(0)
+                
+        try:
+            h.update(cPickle.dumps((tag, args), cPickle.HIGHEST_PROTOCOL))
+        except (cPickle.PicklingError, TypeError):
+            return None
+            
+        h.update(repr(tuple(__parser_revision__(i) for i in parsers)))
+        h.update(repr(tuple(getattr(numericalunits, i) for i in ("m", "kg", "s", "C", "K"))))
+        return h.hexdigest()
+        
+    def __getitem__(self, key):
+        path = self.__path__(key)
         try:
-            if parser_class.valid_header(header):
-                result.append(parser_class)
-        except NotImplementedError:
+            with open(path, "rb") as f:
+                result = __unpack__(cPickle.load(f))
+        except (IOError, EOFError, cPickle.UnpicklingError):
+            self.misses += 1
+            raise KeyError(key)
+        
+        # Mark as recently used
+        try:
+            os.utime(path, None)
+        except OSError:
             pass
-    f.seek(0)
+        self.hits += 1
+        return result
+        
+    def __setitem__(self, key, value):
+        handle, temp = tempfile.mkstemp(dir = self.path)
+        try:
+            with os.fdopen(handle, "wb") as f:
+                cPickle.dump(__pack__(value), f, cPickle.HIGHEST_PROTOCOL)
+            os.rename(temp, self.__path__(key))
             
-    # Guess by name
-    if "name" in dir(f) and isinstance(f.name, str):
-        for parser_class in get_all_parsers():
-            try:
-                if parser_class.valid_filename(f.name):
-                    result.append(parser_class)
-            except NotImplementedError:
-                pass
+        except (cPickle.PicklingError, TypeError):
+            # Values which cannot be pickled are not cached
+            return
             
-    return result
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+                
+        self.__evict__()
+        
+    def __evict__(self):
+        """
+        Removes the least recently used entries exceeding the size
+        limit.
+        """
+        entries = sorted(self.__entries__(), reverse = True)
+        total = 0
+        for mtime, size, path in entries:
+            total += size
+            if total > self.size:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                    
+    def clear(self):
+        """
+        Removes all entries.
+        """
+        for mtime, size, path in self.__entries__():
+            os.remove(path)
+        self.hits = 0
+        self.misses = 0
     
-def parse(f, tag, *args):
+def parse(f, tag, *args, **kwargs):
     """
     Identifies and parses data.
     
@@ -122,40 +606,160 @@ def parse(f, tag, *args):
         tag (str): the data tag, such as ``unit-cell`` or
         ``band-structure``;
         
+    Kwargs:
+    
+        cache (ParseCache): an optional cache of results. Parsing is
+        skipped if the result is found in the cache.
+        
     Returns:
     
         The parsed data.
     """
+    cache = kwargs.get("cache", None)
     candidates = guess_parser(f)
+    
+    if cache is None:
+        return __parse__(f, candidates, tag, *args)
+        
+    key = cache.key(f, tag, args, parsers = candidates)
+    if key is None:
+        return __parse__(f, candidates, tag, *args)
+        
+    try:
+        return cache[key]
+    except KeyError:
+        pass
+        
+    result = __parse__(f, candidates, tag, *args)
+    cache[key] = result
+    return result
+    
+def __parse__(f, candidates, tag, *args):
+    """
+    Parses data with the candidate parsers without caching. See
+    ``parse``.
+    """
     debug_data = "Candidate classes:\n" + "\n".join(" - "+str(i) for i in candidates)
     
     if len(candidates) == 0:
         raise ParseError("Unidentified data: no parser match")
     
-    data = f.read()
-    
     attempted = []
+    registry = get_registry()
     
     for parser_class in candidates:
-        parser = parser_class(data)
-        for a in dir(parser):
-            attr = getattr(parser, a)
-            if "__tags__" in dir(attr) and tag in attr.__tags__:
-                try:
+        if len(registry.tagged(parser_class, tag)) == 0:
+            continue
+        f.seek(0)
+        parser = parser_class(f)
+        for attr in registry.methods(parser, tag):
+            try:
+                
+                attempted.append(parser.__class__.__name__+"."+attr.__name__)
+                if attr.__take_file__:
+                    return attr(f, *args)
+                else:
+                    return attr(*args)
                     
-                    attempted.append(parser.__class__.__name__+"."+attr.__name__)
-                    if attr.__take_file__:
-                        return attr(f, *args)
-                    else:
-                        return attr(*args)
-                        
-                except (StopIteration, ParseError):
-                    pass
+            except (StopIteration, ParseError):
+                pass
     
     if len(attempted) == 0:
         raise ParseError("No matching parser found\n"+debug_data)
     
     else:
         raise ParseError("Parsing failed, attempted following candidates:\n" + "\n".join(tuple(
-            " - "+i for i in cadidates
+            " - "+i for i in attempted
         )))
+    
+def __parse_path__(task):
+    """
+    Parses a single file in a worker process. Errors are returned
+    rather than raised.
+    """
+    path, tag, args, kwargs = task
+    try:
+        with open(path, "r") as f:
+            return __pack__(parse(f, tag, *args, **kwargs))
+    except Exception as e:
+        if isinstance(e, ParseError):
+            return ParseError("{}: {}".format(path, e))
+        return ParseError("{}: {}: {}".format(path, e.__class__.__name__, e))
+        
+def parse_many(paths, tag, *args, **kwargs):
+    """
+    Identifies and parses many files in parallel processes.
+    
+    Args:
+    
+        paths (list): paths to files to parse;
+        
+        tag (str): the data tag, such as ``unit-cell`` or
+        ``band-structure``;
+        
+    Kwargs:
+    
+        workers (int): the number of worker processes, the number of
+        CPUs by default. With a single worker files are parsed in the
+        current process;
+        
+        ordered (bool): if True returns results in the order of *paths*.
+        Otherwise returns an iterator over ``(path, result)`` pairs in
+        the order of completion;
+        
+        cache (ParseCache): an optional cache of results.
+        
+    Returns:
+    
+        Parsed data for each file. If a file fails to parse a
+        ``ParseError`` object is returned in place of its data.
+        
+    .. note::
+    
+        Results are sent to the current process as numpy arrays rather
+        than lists. Workers are forked and share ``numericalunits``
+        scales with the current process.
+    """
+    workers = kwargs.pop("workers", None)
+    ordered = kwargs.pop("ordered", True)
+    
+    paths = list(paths)
+    tasks = list((p, tag, args, kwargs) for p in paths)
+    
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    workers = max(1, min(workers, len(tasks)))
+        
+    if ordered:
+        if workers == 1:
+            return list(__unpack__(__parse_path__(i)) for i in tasks)
+        pool = multiprocessing.Pool(workers)
+        try:
+            return list(__unpack__(i) for i in pool.imap(__parse_path__, tasks))
+        finally:
+            pool.close()
+            pool.join()
+            
+    else:
+        return __parse_unordered__(tasks, workers)
+        
+def __parse_unordered__(tasks, workers):
+    """
+    Yields ``(path, result)`` pairs in the order of completion. See
+    ``parse_many``.
+    """
+    if workers == 1:
+        for task in tasks:
+            yield task[0], __unpack__(__parse_path__(task))
+        return
+        
+    pool = multiprocessing.Pool(workers)
+    try:
+        for path, result in pool.imap_unordered(__parse_indexed__, tasks):
+            yield path, __unpack__(result)
+    finally:
+        pool.terminate()
+        pool.join()
+        
+def __parse_indexed__(task):
+    return task[0], __parse_path__(task)
@@ -1,13 +1,13 @@
 """
 This submodule contains key types for handling coordinate-dependent data:
-``UnitCell``, ``Grid`` and ``Basis``.
+``UnitCell``, ``Grid``, ``Basis`` and ``Trajectory`` as well as a
+compact ``Categorical`` array of atomic species.
 """
 import itertools
 from functools import wraps
 import warnings
 
 import numpy
-from numpy import random
 from scipy import linalg
 import numericalunits
 
@@ -57,6 +57,25 @@ def __xyz2i__(i):
     except KeyError:
         return i
         
+def __hermite_diagonal__(m):
+    """
+    Computes the diagonal of the lower-triangular Hermite normal form
+    of an integer matrix with rows being lattice vectors. Integer points
+    ``0 <= x[i] < diagonal[i]`` are unique representatives of integer
+    points modulo the lattice.
+    """
+    m = list(list(int(j) for j in i) for i in m)
+    for j in range(len(m)-1, -1, -1):
+        for i in range(j):
+            # Euclid's algorithm on rows
+            while not m[i][j] == 0:
+                q = m[j][j] // m[i][j]
+                m[j] = list(a - q*b for a, b in zip(m[j], m[i]))
+                m[i], m[j] = m[j], m[i]
+        if m[j][j] == 0:
+            raise ArgumentError("Linearly dependent vectors: {}".format(m))
+    return tuple(abs(m[i][i]) for i in range(len(m)))
+    
 class ArgumentError(Exception):
     pass
     
@@ -204,6 +223,26 @@ class Basis(object):
         """
         return "units" in self.meta
         
+    def __cached__(self, name, function):
+        """
+        Retrieves a quantity computed from basis vectors. Quantities are
+        kept until vectors change.
+        """
+        key = self.vectors.shape, self.vectors.tobytes()
+        cache = self.__dict__.get("__cache__")
+        if cache is None or not cache[0] == key:
+            cache = key, {}
+            self.__cache__ = cache
+        if not name in cache[1]:
+            cache[1][name] = function(self.vectors)
+        return cache[1][name]
+        
+    def __inverse__(self):
+        """
+        Retrieves the inverse of the matrix of basis vectors.
+        """
+        return self.__cached__("inverse", numpy.linalg.inv)
+        
     def transform_to(self, basis, coordinates):
         """
         Transforms coordinates to another basis set.
@@ -219,16 +258,8 @@ class Basis(object):
         
             An array with transformed coordinates.
         """
-        coordinates = numpy.array(coordinates, dtype = numpy.float64)
-        return numpy.tensordot(
-            coordinates,
-            numpy.tensordot(
-                self.vectors,
-                numpy.linalg.inv(basis.vectors),
-                axes=((1,),(0,))
-            ),
-            axes=((len(coordinates.shape)-1,),(0,))
-        )
+        coordinates = numpy.asarray(coordinates, dtype = numpy.float64)
+        return numpy.dot(coordinates, numpy.dot(self.vectors, basis.__inverse__()))
         
     def transform_from(self, basis, coordinates):
         """
@@ -260,10 +291,7 @@ class Basis(object):
         
             An array with transformed coordinates.
         """
-        return self.transform_to(
-            Basis(numpy.eye(self.vectors.shape[0])),
-            coordinates,
-        )
+        return numpy.dot(numpy.asarray(coordinates, dtype = numpy.float64), self.vectors)
         
     def transform_from_cartesian(self, coordinates):
         """
@@ -278,10 +306,7 @@ class Basis(object):
         
             An array with transformed coordinates.
         """
-        return self.transform_from(
-            Basis(numpy.eye(self.vectors.shape[0])),
-            coordinates,
-        )
+        return numpy.dot(numpy.asarray(coordinates, dtype = numpy.float64), self.__inverse__())
     
     def rotated(self, axis, angle, units = 'rad'):
         """
@@ -329,7 +354,7 @@ class Basis(object):
         
             Volume of the cell in **m^3**.
         """
-        return abs(numpy.linalg.det(self.vectors))
+        return self.__cached__("volume", lambda v: abs(numpy.linalg.det(v)))
         
     def reciprocal(self):
         """
@@ -344,7 +369,7 @@ class Basis(object):
             The :math:`2 \pi` multiplier is not present.
         
         """
-        return Basis(numpy.swapaxes(numpy.linalg.inv(self.vectors),0,1))
+        return Basis(numpy.swapaxes(self.__inverse__(),0,1))
         
     def vertices(self):
         """
@@ -474,13 +499,19 @@ class Basis(object):
             times (array): array of ints specifying how much the basis
             should be repeated along each of the vectors.
         """
-        c = self
+        return Basis(self.vectors*self.__repeats__(times)[:,numpy.newaxis], meta = self.meta)
+        
+    def __repeats__(self, times):
+        """
+        Validates the numbers of repetitions and pads them with ones
+        up to the dimensionality of this basis.
+        """
+        result = numpy.ones(self.vectors.shape[0], dtype = numpy.int64)
         for i, t in enumerate(times):
             if not isinstance(t, int):
                 raise ValueError("The input [{:d}] should be integers, found {} instead".format(i,times))
-            c = c.stack(*((c,)*(t-1)), vector = i)
-            
-        return c
+            result[i] = max(t, 1)
+        return result
 
     @input_as_list
     def reorder_vectors(self, new):
@@ -568,6 +599,165 @@ def diamond_basis(a):
     a = 0.5*a
     return Basis([[0,a,a],[a,0,a],[a,a,0]])
     
+class Categorical(object):
+    """
+    A compact array of labels, such as atomic species, stored as an
+    array of integer codes and a small sorted table of unique labels.
+    It can be used as ``UnitCell.values`` in place of an array of
+    strings.
+    
+    Args:
+    
+        values (array): labels or another Categorical.
+        
+    Kwargs:
+    
+        labels (array): if specified, ``values`` are integer codes
+        referring to these unique sorted labels.
+        
+    Raises:
+    
+        ArgumentError: if there are too many different labels.
+        
+    .. note::
+    
+        Indexing with an integer returns a label while any other index
+        returns a new Categorical sharing the label table. Comparisons
+        with a label or another Categorical are done on the label
+        tables and then broadcast to codes. Other numpy routines see the
+        decoded array of labels.
+    """
+    
+    # Makes numpy arrays defer comparisons to this class
+    __array_ufunc__ = None
+    __hash__ = None
+    
+    def __init__(self, values, labels = None):
+        
+        if isinstance(values, Categorical):
+            self.labels = values.labels
+            self.codes = values.codes
+            
+        elif labels is None:
+            values = numpy.array(values)
+            self.labels, codes = numpy.unique(values, return_inverse = True)
+            if len(self.labels) > numpy.iinfo(numpy.int16).max:
+                raise ArgumentError("Too many different labels: {:d}".format(len(self.labels)))
+            self.codes = codes.astype(numpy.int16).reshape(values.shape)
+            
+        else:
+            self.labels = numpy.asarray(labels)
+            self.codes = numpy.array(values, dtype = numpy.int16)
+        
+    @property
+    def shape(self):
+        return self.codes.shape
+        
+    @property
+    def dtype(self):
+        return self.labels.dtype
+        
+    def __len__(self):
+        return len(self.codes)
+        
+    def __iter__(self):
+        return iter(numpy.asarray(self))
+        
+    def __array__(self, dtype = None):
+        result = self.labels[self.codes]
+        if not dtype is None:
+            result = result.astype(dtype)
+        return result
+        
+    def __getitem__(self, index):
+        codes = self.codes[index]
+        if isinstance(codes, numpy.ndarray):
+            return Categorical(codes, labels = self.labels)
+        return self.labels[codes]
+        
+    def __setitem__(self, index, value):
+        value = numpy.array(value)
+        new = numpy.setdiff1d(value, self.labels)
+        if len(new) > 0:
+            labels = numpy.union1d(self.labels, new)
+            self.codes = numpy.searchsorted(labels, self.labels)[self.codes].astype(numpy.int16)
+            self.labels = labels
+        self.codes[index] = numpy.searchsorted(self.labels, value)
+        
+    def __eq__(self, another):
+        if isinstance(another, Categorical):
+            return (self.labels[:,numpy.newaxis] == another.labels[numpy.newaxis,:])[self.codes, another.codes]
+            
+        another = numpy.asarray(another)
+        if len(another.shape) == 0:
+            return (self.labels == another)[self.codes]
+            
+        return numpy.asarray(self) == another
+        
+    def __ne__(self, another):
+        return numpy.logical_not(self == another)
+        
+    def __repr__(self):
+        return "Categorical({})".format(numpy.asarray(self).tolist())
+        
+    def copy(self):
+        """
+        Calculates a copy.
+        
+        Returns:
+        
+            A copy of the array.
+        """
+        return Categorical(self.codes.copy(), labels = self.labels.copy())
+        
+    def tolist(self):
+        """
+        Converts to a list of labels.
+        
+        Returns:
+        
+            A (nested) list of labels.
+        """
+        return numpy.asarray(self).tolist()
+        
+    def counts(self):
+        """
+        Counts occurrences of each label.
+        
+        Returns:
+        
+            A dictionary with labels as keys and numbers of occurrences
+            as values.
+        """
+        counts = numpy.bincount(self.codes.reshape(-1), minlength = len(self.labels))
+        present = counts > 0
+        return dict(zip(self.labels[present].tolist(), counts[present].tolist()))
+        
+    @staticmethod
+    def concatenate(arrays):
+        """
+        Concatenates arrays along the first axis.
+        
+        Args:
+        
+            arrays (list): arrays to concatenate.
+            
+        Returns:
+        
+            A Categorical if all arrays are Categorical and a numpy
+            array otherwise.
+        """
+        if not all(isinstance(i, Categorical) for i in arrays):
+            return numpy.concatenate(tuple(numpy.asarray(i) for i in arrays), axis = 0)
+            
+        labels = arrays[0].labels
+        for i in arrays[1:]:
+            labels = numpy.union1d(labels, i.labels)
+            
+        return Categorical(numpy.concatenate(tuple(
+            numpy.searchsorted(labels, i.labels)[i.codes] for i in arrays
+        ), axis = 0), labels = labels)
+        
 class UnitCell(Basis):
     """
     A class describing a crystal unit cell in a periodic environment.
@@ -581,7 +771,8 @@ class UnitCell(Basis):
         
         values (array): an array of atoms (or any other instances) with
         the leading dimenstion being the same as the one of
-        ``coordinates`` array.
+        ``coordinates`` array. A ``Categorical`` array of species is
+        kept as is.
 
     Kwargs:
     
@@ -614,15 +805,16 @@ class UnitCell(Basis):
                 raise ArgumentError('Coordinates array is 2D but the last dimension {:d} is not equal to space dimensionality {:d}'.format(self.coordinates.shape[1], dims))
         
         # Coordinates are now prepeared, proceed to values
-        self.values = numpy.array(values)
+        if isinstance(values, Categorical):
+            self.values = values.copy()
+        else:
+            self.values = numpy.array(values)
         if len(self.values.shape) == 0:
             self.values = self.values[numpy.newaxis,...]
                 
         if self.values.shape[0] < self.coordinates.shape[0] and self.coordinates.shape[0] % self.values.shape[0] == 0:
             # Broadcast values repeatedly
-            self.values = numpy.array( tuple(
-                self.values[i%self.values.shape[0]] for i in range(self.coordinates.shape[0])
-            ) )
+            self.values = self.values[numpy.arange(self.coordinates.shape[0]) % self.values.shape[0]]
             
         elif not self.values.shape[0] == self.coordinates.shape[0]:
             raise ArgumentError('Mismatch of sizes of coordinates and values arrays: {:d} vs {:d}'.format(
@@ -646,12 +838,22 @@ class UnitCell(Basis):
     def __getstate__(self):
         result = super(UnitCell,self).__getstate__()
         result["coordinates"] = self.coordinates.tolist()
-        result["values"] = self.values.tolist()
+        if isinstance(self.values, Categorical):
+            # Keep species categorical
+            result["values"] = {
+                "codes": self.values.codes.tolist(),
+                "labels": self.values.labels.tolist(),
+            }
+        else:
+            result["values"] = self.values.tolist()
         return result
         
     def __setstate__(self,data):
         super(UnitCell,self).__setstate__(data)
-        self.__init__(self, data["coordinates"], data["values"])
+        values = data["values"]
+        if isinstance(values, dict):
+            values = Categorical(values["codes"], labels = values["labels"])
+        self.__init__(self, data["coordinates"], values)
         
     @staticmethod
     def from_json(j):
@@ -668,7 +870,7 @@ class UnitCell(Basis):
         """
         if not "type" in j or not j["type"] == "dfttools.UnitCell":
             raise ValueError("This is not a valid UnitCell JSON representation.")
-        result = UnitCell(Basis(j["vectors"], meta = j["meta"]), j["coordinates"], j["values"])
+        result = UnitCell.__new__(UnitCell)
         result.__setstate__(j)
         return result
     
@@ -776,6 +978,93 @@ class UnitCell(Basis):
         else:
             raise ArgumentError("The input array has unsupported dimensionality %i" % len(ids.shape))
         
+    def neighbors(self, cutoff, periodic = True):
+        """
+        Locates all pairs of species closer than the cutoff distance.
+        
+        Args:
+        
+            cutoff (float): the cutoff distance.
+            
+        Kwargs:
+        
+            periodic (bool): if True, periodic images of species are
+            taken into account.
+            
+        Returns:
+        
+            Four numpy arrays describing pairs in a compressed sparse
+            row form:
+            
+            * indptr: pairs of species ``i`` are located at positions
+              ``indptr[i]:indptr[i+1]`` of the following arrays;
+            * indices: the second species in each pair;
+            * distances: distances in each pair;
+            * images: integer vectors of the periodic image of the
+              second species in each pair, i.e. the second species is
+              located at ``coordinates[j] + images`` in the cell basis.
+              
+        .. note::
+        
+            Pairs are sorted by both species indexes. Each pair is
+            listed twice, as (i,j) and (j,i), and the species is never
+            paired with itself in the same image.
+        """
+        from scipy.spatial import cKDTree
+        
+        cutoff = float(cutoff)
+        n = self.size()
+        d = self.vectors.shape[0]
+        
+        if periodic:
+            # Margins in the cell basis
+            shift = numpy.floor(self.coordinates).astype(numpy.int64)
+            crystal = self.coordinates - shift
+            margin = cutoff * ((self.__inverse__()**2).sum(axis = 0)**.5)
+            
+            # Ghost species within the margin around the cell
+            ghost_ids = []
+            ghost_images = []
+            for image in itertools.product(*tuple(range(-int(numpy.ceil(i)), int(numpy.ceil(i))+1) for i in margin)):
+                image = numpy.array(image, dtype = numpy.int64)
+                c = crystal + image
+                inside = numpy.all((c >= -margin) & (c < 1+margin), axis = 1)
+                ids = numpy.nonzero(inside)[0]
+                ghost_ids.append(ids)
+                ghost_images.append(numpy.tile(image, (len(ids), 1)))
+            ghost_ids = numpy.concatenate(ghost_ids)
+            ghost_images = numpy.concatenate(ghost_images)
+            order = numpy.lexsort(tuple(ghost_images.T[::-1]) + (ghost_ids,))
+            ghost_ids = ghost_ids[order]
+            ghost_images = ghost_images[order]
+            
+            origin = self.transform_to_cartesian(crystal)
+            ghosts = self.transform_to_cartesian(crystal[ghost_ids] + ghost_images)
+            
+        else:
+            origin = self.cartesian()
+            ghosts = origin
+            ghost_ids = numpy.arange(n)
+            ghost_images = numpy.zeros((n, d), dtype = numpy.int64)
+            
+        pairs = cKDTree(origin).sparse_distance_matrix(cKDTree(ghosts), cutoff, output_type = "ndarray")
+        
+        # Ghosts are sorted: sort pairs by a single key
+        pairs = pairs[numpy.argsort(pairs["i"] * len(ghosts) + pairs["j"])]
+        
+        i = pairs["i"]
+        j = ghost_ids[pairs["j"]]
+        images = ghost_images[pairs["j"]]
+        if periodic:
+            images += shift[i] - shift[j]
+        
+        # Discard self
+        keep = (i != j) | numpy.any(images != 0, axis = 1)
+        i, j, images, distances = i[keep], j[keep], images[keep], pairs["v"][keep]
+        
+        indptr = numpy.searchsorted(i, numpy.arange(n+1))
+        return indptr, j, distances, images
+        
     def size(self):
         """
         Retrieves the number of points or species in this unit cell.
@@ -1058,7 +1347,7 @@ class UnitCell(Basis):
         return UnitCell(
             self,
             numpy.concatenate(c, axis = 0),
-            numpy.concatenate(v, axis = 0))
+            Categorical.concatenate(v))
     
     @input_as_list
     def stack(self, cells, vector = 'x', **kwargs):
@@ -1095,7 +1384,7 @@ class UnitCell(Basis):
             
         basis = Basis.stack(*cells, vector = vector, **kwargs)
          
-        values = numpy.concatenate(tuple(cell.values for cell in cells if isinstance(cell, UnitCell)), axis = 0)
+        values = Categorical.concatenate(tuple(cell.values for cell in cells if isinstance(cell, UnitCell)))
         
         coordinates = []
         shift = numpy.zeros(dims)
@@ -1115,53 +1404,68 @@ class UnitCell(Basis):
         Args:
         
             vec (array): the supercell vectors in units of current unit
-            cell vectors
+            cell vectors, integers.
+            
+        Raises:
+        
+            ArgumentError: if the supercell vectors are not integer or
+            are linearly dependent.
             
         Returns:
         
             A new supercell.
         """
         vec = numpy.array(vec, dtype = numpy.float64)
+        m = numpy.round(vec).astype(numpy.int64)
+        if not numpy.all(m == vec):
+            raise ArgumentError("The supercell vectors should be integers, found {} instead".format(vec))
+            
+        # Lattice translations inside the supercell
+        diagonal = __hermite_diagonal__(m)
+        translations = numpy.array(tuple(itertools.product(*tuple(range(i) for i in diagonal))), dtype = numpy.int64)
         
-        sc_min = None
-        sc_max = None
+        # Tile and transform to the supercell basis
+        coordinates = (self.coordinates[numpy.newaxis,...] + translations[:,numpy.newaxis,:]).reshape(-1, self.coordinates.shape[1])
+        coordinates = numpy.dot(coordinates, numpy.linalg.inv(m))
+        coordinates -= numpy.floor(coordinates)
+        coordinates[coordinates >= 1] = 0
         
-        for v in itertools.product((0.0,1.0), repeat = vec.shape[0]):
-            
-            vertex = (vec*numpy.array(v)[:,numpy.newaxis]).sum(axis = 0)
-            
-            if sc_min is None:
-                sc_min = numpy.array(v)
-            else:
-                sc_min = numpy.minimum(sc_min, vertex)
-                
-            if sc_max is None:
-                sc_max = numpy.array(v)
-            else:
-                sc_max = numpy.maximum(sc_max, vertex)
+        return UnitCell(
+            Basis(
+                numpy.dot(m, self.vectors),
+                meta = self.meta),
+            coordinates,
+            self.values[numpy.tile(numpy.arange(self.size()), len(translations))],
+        )
+    
+    @input_as_list
+    def repeated(self, times):
+        """
+        Produces a new cell from a given by repeating it in all
+        directions.
         
-        # Fix roundoff
-        random_displacement = random.rand(self.coordinates.shape[-1])[numpy.newaxis,:]
-        u = self.copy()
-        u.coordinates += random_displacement
+        Args:
+        
+            times (array): array of ints specifying how much the cell
+            should be repeated along each of the vectors.
+            
+        Returns:
         
-        sc = u.repeated((sc_max - sc_min).astype(numpy.int64)).normalized()
+            A new unit cell. The copies of this cell follow each other
+            with the first vector index running fastest.
+        """
+        repeats = self.__repeats__(times)
         
-        origin = (self.vectors * sc_min[:,numpy.newaxis]).sum(axis = 0)
+        # Integer lattice offsets, the first one running fastest
+        translations = numpy.array(tuple(itertools.product(*tuple(range(i) for i in repeats[::-1]))), dtype = numpy.int64)[:,::-1]
+        coordinates = (self.coordinates[numpy.newaxis,...] + translations[:,numpy.newaxis,:]) / repeats
         
-        result = UnitCell(
-            Basis(
-                numpy.dot(vec, self.vectors),
-                meta = self.meta),
-            sc.cartesian() + origin[numpy.newaxis,:],
-            sc.values,
-            c_basis = 'cartesian',
+        return UnitCell(
+            Basis(self.vectors*repeats[:,numpy.newaxis], meta = self.meta),
+            coordinates.reshape(-1, self.coordinates.shape[1]),
+            self.values[numpy.tile(numpy.arange(self.size()), len(translations))],
         )
         
-        result.apply(numpy.all(numpy.logical_and(result.coordinates >= 0, result.coordinates < 1), axis = 1))
-        result.coordinates -= result.transform_from(u, random_displacement)
-        return result
-    
     def species(self):
         """
         Collects number of species of each kind in this cell.
@@ -1173,6 +1477,14 @@ class UnitCell(Basis):
             A dictionary containing species as keys and number of atoms
             as values.
         """
+        if isinstance(self.values, Categorical):
+            return self.values.counts()
+            
+        if len(self.values.shape) == 1 and not self.values.dtype == object:
+            species, counts = numpy.unique(self.values, return_counts = True)
+            return dict(zip(species.tolist(), counts.tolist()))
+            
+        # Objects may not be sortable and numpy.unique flattens arrays
         answer = {}
         for s in self.values:
             try:
@@ -1294,6 +1606,233 @@ class UnitCell(Basis):
             driver(data_points, data_values, points_i, **kwargs),
         )
 
+class Trajectory(object):
+    """
+    A sequence of unit cells with the same species, such as a molecular
+    dynamics or a relaxation history. Coordinates of all steps are
+    stored in a single array while lattice vectors are stored either
+    once or per step.
+    
+    Args:
+    
+        vectors (array): lattice vectors shared by all steps (a 2D
+        array) or lattice vectors for each step (a 3D array). Lattice
+        vectors which are the same for all steps are stored once;
+        
+        coordinates (array): a 3D array of coordinates with the leading
+        dimension being the number of steps;
+        
+        values (array): an array of atoms (or any other instances)
+        shared by all steps.
+        
+    Kwargs:
+    
+        c_basis (str,array): 'cartesian' if coordinates are passed in
+        the cartesian basis or an array of booleans marking steps with
+        cartesian coordinates. Crystal coordinates are assumed by
+        default;
+        
+        meta (dict): a metadata shared by all steps;
+        
+        units (str,float): optional units for the Basis of each step.
+        
+    .. note::
+    
+        Steps are retrieved as ``UnitCell`` objects on demand: by
+        iterating or indexing the trajectory. Slicing returns a new
+        Trajectory.
+    """
+    
+    def __init__(self, vectors, coordinates, values, c_basis = None, meta = None, units = None):
+        
+        self.vectors = numpy.array(vectors, dtype = numpy.float64)
+        self.coordinates = numpy.array(coordinates, dtype = numpy.float64)
+        if isinstance(values, Categorical):
+            self.values = values.copy()
+        else:
+            self.values = numpy.array(values)
+        
+        if not len(self.coordinates.shape) == 3:
+            raise ArgumentError("Coordinates array has to be 3D, found {:d}D".format(len(self.coordinates.shape)))
+            
+        steps, n, dims = self.coordinates.shape
+        
+        if not self.vectors.shape in ((dims, dims), (steps, dims, dims)):
+            raise ArgumentError("Vectors array has to be either {:d}x{:d} or {:d}x{:d}x{:d}, found {}".format(dims, dims, steps, dims, dims, "x".join(str(i) for i in self.vectors.shape)))
+            
+        # Store same vectors once
+        if len(self.vectors.shape) == 3 and steps > 0 and numpy.all(self.vectors == self.vectors[0]):
+            self.vectors = self.vectors[0]
+            
+        if len(self.values.shape) == 0 or not self.values.shape[0] == n:
+            raise ArgumentError("Mismatch of sizes of coordinates and values arrays: {:d} vs {}".format(n, self.values.shape[0] if len(self.values.shape) > 0 else "scalar"))
+            
+        if c_basis is None:
+            pass
+            
+        elif isinstance(c_basis, str):
+            if c_basis == 'cartesian':
+                self.coordinates = self.__from_cartesian__(self.coordinates, self.vectors)
+            else:
+                raise ArgumentError("Unknown c_basis='{}'".format(c_basis))
+                
+        else:
+            cartesian = numpy.array(c_basis, dtype = bool)
+            if not cartesian.shape == (steps,):
+                raise ArgumentError("The c_basis array has to be of length {:d}".format(steps))
+            if numpy.any(cartesian):
+                vectors = self.vectors if self.shared() else self.vectors[cartesian]
+                self.coordinates[cartesian] = self.__from_cartesian__(self.coordinates[cartesian], vectors)
+            
+        if not meta is None:
+            self.meta = meta.copy()
+        else:
+            self.meta = {}
+            
+        if not units is None:
+            self.meta["units"] = units
+            
+    @staticmethod
+    def __from_cartesian__(coordinates, vectors):
+        inverse = numpy.linalg.inv(vectors)
+        if len(vectors.shape) == 2:
+            return numpy.tensordot(coordinates, inverse, axes = ((2,),(0,)))
+        else:
+            return numpy.einsum("sai,sij->saj", coordinates, inverse)
+            
+    @staticmethod
+    def from_cells(cells):
+        """
+        Collects unit cells into a trajectory.
+        
+        Args:
+        
+            cells (list): unit cells with the same values.
+            
+        Returns:
+        
+            A Trajectory object. The metadata of the first cell is used.
+        """
+        if len(cells) == 0:
+            raise ArgumentError("No cells to collect")
+            
+        values = cells[0].values
+        for c in cells[1:]:
+            if not c.values.shape == values.shape or not numpy.all(c.values == values):
+                raise ArgumentError("Values of unit cells differ")
+                
+        return Trajectory(
+            tuple(c.vectors for c in cells),
+            tuple(c.coordinates for c in cells),
+            values,
+            meta = cells[0].meta,
+        )
+        
+    def __len__(self):
+        return self.coordinates.shape[0]
+        
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+            
+    def __getitem__(self, index):
+        if isinstance(index, (int, long, numpy.integer)):
+            return UnitCell(
+                Basis(self.basis_vectors(index), meta = self.meta),
+                self.coordinates[index],
+                self.values,
+            )
+            
+        return Trajectory(
+            self.vectors if self.shared() else self.vectors[index],
+            self.coordinates[index],
+            self.values,
+            meta = self.meta,
+        )
+        
+    def shared(self):
+        """
+        Checks if lattice vectors are shared by all steps.
+        
+        Returns:
+        
+            True if all steps have the same lattice vectors.
+        """
+        return len(self.vectors.shape) == 2
+        
+    def basis_vectors(self, index):
+        """
+        Retrieves lattice vectors of a step.
+        
+        Args:
+        
+            index (int): the step.
+            
+        Returns:
+        
+            A 2D array with lattice vectors.
+        """
+        if self.shared():
+            return self.vectors
+        return self.vectors[index]
+        
+    def size(self):
+        """
+        Retrieves the number of points or species in each step.
+        
+        Returns:
+        
+            Number of points or species.
+        """
+        return self.coordinates.shape[1]
+        
+    def cartesian(self):
+        """
+        Computes cartesian coordinates for all steps.
+        
+        Returns:
+        
+            A 3D numpy array with cartesian coordinates.
+        """
+        if self.shared():
+            return numpy.tensordot(self.coordinates, self.vectors, axes = ((2,),(0,)))
+        return numpy.einsum("sai,sij->saj", self.coordinates, self.vectors)
+        
+    @input_as_list
+    def distances(self, ids):
+        """
+        Computes distances between species for all steps.
+        
+        Args:
+        
+            ids (array): a list of specimen IDs, see
+            ``UnitCell.distances``.
+            
+        Returns:
+        
+            A numpy array containing distances with the leading
+            dimension being the number of steps.
+        """
+        v = self.cartesian()
+        
+        if len(ids) == 0:
+            return ((v[:,numpy.newaxis,...] - v[:,:,numpy.newaxis,:])**2).sum(axis = -1)**.5
+            
+        ids = numpy.array(ids, dtype = numpy.int64)
+        
+        if len(ids.shape) == 1:
+            if ids.shape[0] < 2:
+                raise ArgumentError("Only %i points are found, at least 2 required" % ids.shape[0])
+            return ((v[:,ids[:-1],:]-v[:,ids[1:],:])**2).sum(axis = -1)**.5
+            
+        elif len(ids.shape) == 2:
+            if ids.shape[1] != 2:
+                raise ArgumentError("The input array is [%ix%i], required [nx2]" % ids.shape)
+            return ((v[:,ids[:,0],:]-v[:,ids[:,1],:])**2).sum(axis = -1)**.5
+            
+        else:
+            raise ArgumentError("The input array has unsupported dimensionality %i" % len(ids.shape))
+            
 class Grid(Basis):
     """
     A class describing a data on a grid in a periodic environment.
@@ -1753,6 +2292,34 @@ class Grid(Basis):
                 coordinates.append(self.coordinates[dim])
             
         return Grid(basis, coordinates, values)
+        
+    @input_as_list
+    def repeated(self, times):
+        """
+        Produces a new grid from a given by repeating it in all
+        directions.
+        
+        Args:
+        
+            times (array): array of ints specifying how much the grid
+            should be repeated along each of the vectors.
+            
+        Returns:
+        
+            A new grid.
+        """
+        repeats = self.__repeats__(times)
+        
+        coordinates = tuple(
+            ((c[numpy.newaxis,:] + numpy.arange(r)[:,numpy.newaxis]) / r).reshape(-1)
+            for c, r in zip(self.coordinates, repeats)
+        )
+        
+        return Grid(
+            Basis(self.vectors*repeats[:,numpy.newaxis], meta = self.meta),
+            coordinates,
+            numpy.tile(self.values, tuple(repeats) + (1,)*(len(self.values.shape)-len(repeats))),
+        )
 
     @input_as_list
     def reorder_vectors(self, new):
@@ -31,6 +31,7 @@ else:
     ]
     
 ext_modules += [
+    Extension("dfttools.parsers.native_generic", [ "c/generic-parser.c", "c/native_generic.c" ]),
     Extension("dfttools.parsers.native_openmx", [ "c/generic-parser.c", "c/native_openmx.c" ]),
     Extension("dfttools.parsers.native_qe", [ "c/generic-parser.c", "c/native_qe.c" ]),
 ]
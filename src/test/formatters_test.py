@@ -72,6 +72,10 @@ class BackForthTests(unittest.TestCase):
 
     def test_siesta_not_raises(self):
         siesta_input(self.cell)
+        
+    def test_siesta_categorical(self):
+        c = UnitCell(self.cell, ((0,0,0),(.5,.5,.5)), Categorical(("Co","O"))).cut(0,0,0,.2,.2,.2)
+        assert siesta_input(c) == siesta_input(UnitCell(c, c.coordinates, c.values.tolist()))
 
     def test_openmx_back_forth(self):
         c1 = self.cell
@@ -0,0 +1,172 @@
+"""
+Helpers shared by parser tests.
+"""
+import numpy
+from numpy import testing
+
+class CopyCountingString(str):
+    """
+    A string counting characters copied by slicing and indexing.
+    """
+
+    def __new__(cls, *args, **kwargs):
+        result = str.__new__(cls, *args, **kwargs)
+        result.copied = 0
+        return result
+
+    def __getslice__(self, start, end):
+        result = str.__getslice__(self, start, end)
+        self.copied += len(result)
+        return result
+
+    def __getitem__(self, index):
+        result = str.__getitem__(self, index)
+        self.copied += len(result)
+        return result
+
+def synthetic_energy(step, spin, k, band):
+    """
+    Band energies in eV printed in synthetic outputs.
+    """
+    return -100.0+0.1*band+1e-4*k-0.5*spin+0.01*step
+    
+def synthetic_bands_output(nk, nb = 8):
+    """
+    Builds a minimal pw.x band structure output with nk k-points.
+    """
+    lines = [
+        "     Program PWSCF v.5.0.1 starts on 19Nov2012 at 13:44: 6 ",
+        "",
+        "     lattice parameter (alat)  =      10.2000  a.u.",
+        "     celldm(1)=  10.200000  celldm(2)=   0.000000  celldm(3)=   0.000000",
+        "",
+        "     reciprocal axes: (cart. coord. in units 2 pi/alat)",
+        "               b(1) = ( -1.000000 -1.000000  1.000000 )  ",
+        "               b(2) = (  1.000000  1.000000  1.000000 )  ",
+        "               b(3) = ( -1.000000  1.000000 -1.000000 )  ",
+        "",
+        "     number of k points=    {:d}".format(nk),
+        "                       cart. coord. in units 2pi/alat",
+    ]
+    for i in range(nk):
+        lines.append("        k({:5d}) = (   0.0000000   0.0000000   {:.7f}), wk =   0.0714286".format(i+1, 1.0*i/nk))
+    lines += ["", "     End of band structure calculation", ""]
+    for i in range(nk):
+        lines.append("          k = 0.0000 0.0000 {:.4f}     band energies (ev):".format(1.0*i/nk))
+        lines.append("")
+        # pw.x prints 8 energies per line without separating large values
+        energies = ["{:9.4f}".format(synthetic_energy(0, 0, i, j)) for j in range(nb)]
+        for j in range(0, nb, 8):
+            lines.append("  "+"".join(energies[j:j+8]))
+        lines.append("")
+    lines += ["     Writing output data file silicon.save", "", "   JOB DONE."]
+    return "\n".join(lines)
+
+def synthetic_md_output(steps, n, units = "angstrom", vc = False):
+    """
+    Builds a minimal pw.x relaxation output with the given number of
+    ionic steps.
+    """
+    lines = [
+        "     lattice parameter (alat)  =      10.0000  a.u.",
+        "     number of atoms/cell      =  {:11d}".format(n),
+        "     celldm(1)=  10.000000  celldm(2)=   0.000000  celldm(3)=   0.000000",
+        "",
+        "     crystal axes: (cart. coord. in units of alat)",
+        "               a(1) = (   1.000000   0.000000   0.000000 )  ",
+        "               a(2) = (   0.000000   1.000000   0.000000 )  ",
+        "               a(3) = (   0.000000   0.000000   1.000000 )  ",
+        "",
+        "   Cartesian axes",
+        "",
+        "     site n.     atom                  positions (alat units)",
+    ]
+    for i in range(n):
+        lines.append("     {:5d}           {:2s}  tau({:4d}) = (   0.0000000   0.0000000   {:.7f}  )".format(i+1, "Si" if i%2 == 0 else "O", i+1, 1.0*i/n))
+    for step in range(steps):
+        lines.append("")
+        if vc:
+            lines += [
+                "CELL_PARAMETERS (alat= 10.00000000)",
+                "   {:.9f}   0.000000000   0.000000000".format(1+1e-3*step),
+                "   0.000000000   1.000000000   0.000000000",
+                "   0.000000000   0.000000000   1.000000000",
+                "",
+            ]
+        lines.append("ATOMIC_POSITIONS ({})".format(units))
+        for i in range(n):
+            lines.append("{:2s}       {:.9f}   {:.9f}   {:.9f}".format("Si" if i%2 == 0 else "O", 1e-3*step, 0.5, 1.0*i/n))
+        lines.append("")
+    lines += ["     End final coordinates", "", "   JOB DONE."]
+    return "\n".join(lines)
+
+def synthetic_outcar(nk, nb = 8, nspin = 1, steps = 1):
+    """
+    Builds a minimal OUTCAR with nk k-points.
+    """
+    lines = [
+        " vasp.5.4.1 05Feb16 (build Feb 08 2016 19:07:22) complex",
+        "",
+        "  reciprocal lattice vectors",
+        "     0.000000000  0.277777778  0.277777778     0.000000000  1.000000000  1.000000000",
+        "     0.277777778  0.000000000  0.277777778     1.000000000  0.000000000  1.000000000",
+        "     0.277777778  0.277777778  0.000000000     1.000000000  1.000000000  0.000000000",
+        "",
+        " k-points in reciprocal lattice and weights: K-points",
+    ]
+    for i in range(nk):
+        lines.append("   0.00000000  0.00000000  {:.8f}       0.125".format(1.0*i/nk))
+    lines += [" ", ""]
+    for step in range(steps):
+        lines += [
+            " E-fermi :   {:.4f}     XC(G=0): -10.1234     alpha+bet : -8.1234".format(5.6789+step),
+            "",
+        ]
+        for spin in range(nspin):
+            if nspin > 1:
+                lines += [" spin component {:d}".format(spin+1), ""]
+            for i in range(nk):
+                lines.append(" k-point {:5d} :       0.0000    0.0000    {:.4f}".format(i+1, 1.0*i/nk))
+                lines.append("  band No.  band energies     occupation ")
+                for j in range(nb):
+                    lines.append("  {:5d}    {:9.4f}      {:.5f}".format(j+1, synthetic_energy(step, spin, i, j), 2.0/nspin if j < nb/2 else 0))
+                lines.append("")
+        lines += ["", " ---- Iteration", ""]
+    lines += ["", " General timing and accounting informations for this job:"]
+    return "\n".join(lines)
+
+class BandsCopyTemplate(object):
+    """
+    A template of tests checking that parsing bands does not copy the
+    text repeatedly: the number of characters copied per k-point does
+    not grow with the number of k-points. Descendants define
+    ``synthetic`` (a function of the number of k-points) and ``bands``.
+    """
+    
+    def bands(self, data):
+        """
+        Parses bands from the data.
+        """
+        raise NotImplementedError
+    
+    def __copied__(self, nk):
+        data = CopyCountingString(self.synthetic(nk))
+        b = self.bands(data)
+        assert b.values.shape == (nk, 8)
+        return data.copied
+        
+    def test_bands_linear(self):
+        assert self.__copied__(8000)*1000 <= self.__copied__(1000)*8000
+        
+def assert_trajectory(trajectory, cells):
+    """
+    Checks that a trajectory holds the same steps as a list of cells.
+    """
+    assert len(trajectory) == len(cells)
+    for i, j in zip(trajectory, cells):
+        assert i.units_aware()
+        testing.assert_allclose(i.vectors, j.vectors)
+        testing.assert_allclose(i.coordinates, j.coordinates, atol = 1e-14)
+        testing.assert_equal(i.values, j.values)
+    cartesian = numpy.array(tuple(i.cartesian() for i in cells))
+    testing.assert_allclose(trajectory.cartesian(), cartesian, atol = 1e-14*abs(cartesian).max())
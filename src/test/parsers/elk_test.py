@@ -9,6 +9,8 @@ import numericalunits
 from dfttools.parsers.elk import input, output, bands, unitcells
 from dfttools.types import UnitCell, Basis
 
+from .common import assert_trajectory
+
 class Test_input0(unittest.TestCase):
 
     def setUp(self):
@@ -81,6 +83,27 @@ class Test_unitcells0(unittest.TestCase):
         with open(os.path.join(os.path.dirname(os.path.realpath(__file__)),"cases/elk.unitcells.0.testcase"),'r') as f:
             self.parser = unitcells(f.read())
             
+    def test_trajectory(self):
+        t = self.parser.trajectory()
+        assert_trajectory(t, self.parser.unitCells())
+        assert len(t) == 13
+        assert not t.shared()
+        assert t.meta["units"] == "angstrom"
+        testing.assert_equal(t.values, ("W",)*2 + ("Se",)*4)
+        testing.assert_allclose(t.vectors[-1], numpy.array((
+            (11.39760697, 0.000000000, -0.4916833360),
+            (0.000000000, 6.657114335, 0.000000000),
+            (0.2357896961, 0.000000000, 36.87349199),
+        ))*numericalunits.aBohr)
+        testing.assert_allclose(t.coordinates[-1], (
+            ( 0.18724733, 0.25000000, 0.49516462),
+            (-0.18724733,-0.25000000,-0.49516462),
+            ( 0.42544409,-0.25000000,-0.43179860),
+            (-0.42544412, 0.25000000, 0.43179861),
+            (-0.07848466, 0.25000000,-0.40573043),
+            ( 0.07848464,-0.25000000, 0.40573044),
+        ))
+        
     def test_unitCells(self):
         c = self.parser.unitCells()
         assert len(c) == 13
@@ -3,8 +3,9 @@ import re
 import math
 
 from numpy import testing
+import numpy
 
-from dfttools.parsers.generic import parse, cre_varName, cre_word
+from dfttools.parsers.generic import map_chunks, parse, cre_varName, cre_word, cre_float, cre_int, LiteralCache, LiteralPattern, StringParser
 
 class StringTest(unittest.TestCase):
     
@@ -125,6 +126,59 @@ class StringTest(unittest.TestCase):
         sp = parse("123, 456; 789")
         testing.assert_equal(sp.nextFloat(";"),(123, 456))
         
+    def test_nextFloat3(self):
+        
+        sp = parse("1.5d-1 -2.0D+2 nan 7; 8")
+        x = sp.nextFloat(3)
+        assert x.dtype == numpy.float64
+        testing.assert_equal(x,(0.15, -200, float("nan")))
+        testing.assert_equal(sp.nextFloat(";"),(7,))
+        assert sp.__position__ == 20
+        testing.assert_equal(sp.nextFloat(0),numpy.zeros(0))
+        assert sp.__position__ == 20
+        self.assertRaises(StopIteration,sp.nextFloat,2)
+        
+    def test_nextNumbers_native(self):
+        
+        data = "x = 1.25, y=-3e2 z 4. 0.5E-1\n1 2 +3 4 abc 5 6 7.8.9 ;"
+        for method, match in (("nextFloat", cre_float), ("nextInt", cre_int)):
+            sp1 = parse(data)
+            sp2 = parse(data)
+            for n in (2, (2,2), 0, ";"):
+                x1 = getattr(sp1, method)(n)
+                x2 = sp2.nextMatch(match, n = n)
+                testing.assert_equal(x1, x2.astype(x1.dtype))
+                assert sp1.__position__ == sp2.__position__
+        
+    def test_nextNative(self):
+        
+        def native(string, pos, n):
+            if n < 0:
+                raise ValueError
+            return string[pos:pos+n], pos+n
+            
+        sp = parse("abcdef")
+        sp.skip("b")
+        assert sp.nextNative(native, 3) == "cde"
+        assert sp.__position__ == 5
+        with self.assertRaises(ValueError):
+            sp.nextNative(native, -1)
+        assert sp.__position__ == 5
+        with self.assertRaises(ValueError):
+            parse(u"abcdef").nextNative(native, 3)
+        
+    def test_offsets(self):
+        
+        for sp in (parse("ab abab aba"), StringParser("ab abab aba", markers = ("aba",))):
+            sp.skip("b")
+            testing.assert_equal(sp.offsets("aba"), (3, 8))
+            testing.assert_equal(sp.offsets("aba", 1), (3,))
+            assert sp.__position__ == 2
+            with self.assertRaises(StopIteration):
+                sp.offsets("aba", 3)
+            sp.reset(sp.offsets("aba")[1])
+            assert sp.nextLine() == "aba"
+        
     def test_lineOperations(self):
         
         sp = parse("\none\ntwo\nthree\nfour")
@@ -196,6 +250,46 @@ class StringTest(unittest.TestCase):
         assert sp.closest(("g","h","a","b","a")) == 2
         assert sp.closest(("z","x","y")) is None
         
+    def test_closest3(self):
+        
+        sp = parse("xyz 1.5e3 abc")
+        assert sp.closest(("abc", cre_float, "1.5")) == 1
+        assert sp.closest((re.compile("(x)(y)"), "x")) == 0
+        assert sp.closest(("yz", "xyz")) == 1
+        assert sp.closest(()) is None
+        sp.skip("xyz")
+        assert sp.closest(("xyz", "ABC")) == 1
+        
+    def test_closest_single_pass(self):
+        n = 2000
+        sp = parse("  1.0"*n+"\n\n  2.0")
+        
+        def fail(*args, **kwargs):
+            raise AssertionError("Alternatives are searched one by one")
+        sp.distance = fail
+        
+        cache = StringParser.alternatives
+        lookups = cache.hits + cache.misses
+        count = 0
+        while sp.closest((cre_float, "\n\n")) == 0:
+            sp.nextFloat()
+            count += 1
+        assert count == n
+        # A single combined pattern per call
+        assert cache.hits + cache.misses - lookups == n + 1
+        
+    def test_closest_groups(self):
+        c = re.compile
+        sp = parse("abc 123 xyz")
+        # Clashing and duplicate group names
+        assert sp.closest((c(r"(?P<_0>\d+)"), c(r"(?P<_1>x)(y)"))) == 0
+        assert sp.closest((c(r"(?P<a>x)"), c(r"(?P<a>\d)"))) == 1
+        assert sp.closest((c(r"(a)(b)"), "c", c(r"1(2)(3)"))) == 0
+        sp.skip("a")
+        assert sp.closest((c(r"(a)(b)"), c(r"(?:c)"), c(r"1(2)(3)"))) == 1
+        sp.skip("c")
+        assert sp.closest((c(r"(a)(b)"), "z", c(r"1(2)(3)"))) == 2
+        
     def test_matchAfter(self):
         
         sp = parse("param1 = value1, param2 value2")
@@ -213,3 +307,96 @@ class StringTest(unittest.TestCase):
         sp = parse("value1 = 3; <value2> 3 4.5 5 6 </value2>")
         testing.assert_equal(sp.floatAfter("<value2>", n = "</value2>"),(3, 4.5, 5, 6))
         assert sp.floatAfter("value1") == 3
+
+class LiteralCacheTest(unittest.TestCase):
+    
+    def test_lru(self):
+        c = LiteralCache(size = 2)
+        p = c["abc"]
+        assert p.pattern == "abc"
+        assert p.flags & re.I
+        assert c["abc"] is p
+        assert (c.hits, c.misses) == (1, 1)
+        c["def"]
+        c["abc"]
+        c["ghi"]
+        assert len(c) == 2
+        assert c["abc"] is p
+        c["def"]
+        assert (c.hits, c.misses) == (3, 4)
+        c.clear()
+        assert len(c) == 0
+        assert (c.hits, c.misses) == (0, 0)
+        
+    def test_literal(self):
+        c = LiteralCache()
+        assert isinstance(c["-->"], LiteralPattern)
+        assert isinstance(c["\n\n"], LiteralPattern)
+        assert not isinstance(c["k ="], LiteralPattern)
+        assert not isinstance(c[""], LiteralPattern)
+        
+    def test_literal_pattern(self):
+        p = LiteralPattern("==")
+        s = "a ==== b == c"
+        assert list((i.start(), i.end(), i.group()) for i in p.finditer(s)) == \
+            list((i.start(), i.end(), i.group()) for i in re.finditer(p.pattern, s))
+        assert list(i.start() for i in p.finditer(s, 3)) == [3, 9]
+        assert p.search(s, 10) is None
+        
+    def test_shared(self):
+        StringParser.literals.clear()
+        parse("1 = 2 = 3").skip(" = ")
+        sp = parse("4 = 5 = 6")
+        sp.skip(" = ")
+        assert StringParser.literals.misses == 1
+        assert StringParser.literals.hits == 1
+        assert sp.nextInt() == 5
+
+class MarkersTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.data = "aaa, k = 1, K = 2, aa, k = 3 ... abc aAa"
+        self.markers = ("aa", "k =", "abc", "zzz")
+        
+    def __compare__(self, method, *args, **kwargs):
+        sp1 = parse(self.data)
+        sp2 = parse(self.data, markers = self.markers)
+        for position in range(len(self.data)+1):
+            sp1.__position__ = sp2.__position__ = position
+            try:
+                r1 = getattr(sp1, method)(*args, **kwargs)
+            except StopIteration:
+                self.assertRaises(StopIteration, getattr(sp2, method), *args, **kwargs)
+                continue
+            r2 = getattr(sp2, method)(*args, **kwargs)
+            assert r1 == r2
+            assert sp1.__position__ == sp2.__position__
+            
+    def test_methods(self):
+        for marker in self.markers:
+            for n in (1, 2, 3):
+                self.__compare__("goto", marker, n = n)
+                self.__compare__("skip", marker, n = n)
+                self.__compare__("distance", marker, n = n)
+                self.__compare__("distance", marker, n = n, default = -1)
+            self.__compare__("present", marker)
+        self.__compare__("closest", ("abc", "k =", "zzz"))
+        self.__compare__("closest", ("zzz",))
+        
+    def test_index(self):
+        sp = parse(self.data, markers = self.markers)
+        assert sp.__offsets__("aa") == [0, 1, 19, 37, 38]
+        assert sp.__offsets__("k =") == [5, 12, 23]
+        assert sp.__offsets__("zzz") == []
+        assert sp.__offsets__("xyz") is None
+
+class MapChunksTest(unittest.TestCase):
+    
+    def test_chunks(self):
+        for n, threads, minimal, expected in (
+            (10, 4, 1, ((0,2),(2,5),(5,7),(7,10))),
+            (10, 4, 4, ((0,5),(5,10))),
+            (10, 4, 100, ((0,10),)),
+            (0, 4, 1, ((0,0),)),
+        ):
+            assert tuple(map_chunks(lambda a, b: (a, b), n, threads = threads, minimal = minimal)) == expected
@@ -1,11 +1,17 @@
 import unittest
 import os
+import json
+import shutil
+import tempfile
+import threading
+import BaseHTTPServer
+import SocketServer
 
 import numpy
 from numpy import testing
 import numericalunits
 
-from dfttools.parsers.materialsproject import jsonr
+from dfttools.parsers.materialsproject import jsonr, Client
 
 class Test_structure0(unittest.TestCase):
 
@@ -43,3 +49,113 @@ class Test_structure0(unittest.TestCase):
             [0.16666206, 0.33333306, 0.0],
         ])
         testing.assert_equal(c.values,["C"]*2)
+        
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        
+        if self.path == "/api_check":
+            body = {"api_key_valid": self.headers.get("x-api-key") == "valid"}
+            
+        elif self.path.startswith("/materials/") and self.path.endswith("/vasp/structure"):
+            i = int(self.path.split("/")[2].split("-")[1])
+            body = dict(self.server.data, response = self.server.data["response"][i:i+1])
+            
+        elif self.path.startswith("/status/"):
+            self.send_response(int(self.path.split("/")[2]))
+            self.end_headers()
+            self.wfile.write(json.dumps({"valid_response": True, "response": []}))
+            return
+            
+        elif self.path == "/invalid":
+            body = {"valid_response": False, "error": "Invalid request"}
+            
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+            
+        body = json.dumps(body)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        
+    def log_message(self, *args):
+        pass
+        
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+        
+class Test_client(unittest.TestCase):
+    
+    def setUp(self):
+        with open(os.path.join(os.path.dirname(os.path.realpath(__file__)),"cases/materialsproject.unitcells.0.testcase"),'r') as f:
+            data = json.load(f)
+        self.reference = jsonr(data).unitCells()
+        
+        self.server = Server(("127.0.0.1", 0), Handler)
+        self.server.data = data
+        self.server.requests = []
+        self.thread = threading.Thread(target = self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.gateway = "http://127.0.0.1:{:d}/".format(self.server.server_address[1])
+        self.folder = tempfile.mkdtemp()
+        
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.folder)
+        
+    def test_key(self):
+        client = Client("valid", gateway = self.gateway)
+        client.check_key()
+        client.download_structures("mp-0")
+        client.download_structures("mp-1")
+        assert self.server.requests.count("/api_check") == 1
+        
+        with self.assertRaises(RuntimeError):
+            Client("invalid", gateway = self.gateway).download_structures("mp-0")
+            
+    def test_404(self):
+        with self.assertRaises(RuntimeError):
+            Client("valid", gateway = self.gateway).request("unknown")
+        
+    def test_many(self):
+        client = Client("valid", gateway = self.gateway, workers = 4)
+        result = client.download_many("mp-{:d}".format(i) for i in range(len(self.reference)))
+        assert len(result) == len(self.reference)
+        for r, c in zip(result, self.reference):
+            cells = r.unitCells()
+            assert len(cells) == 1
+            assert cells[0] == c
+        assert len(self.server.requests) == len(self.reference) + 1
+        
+    def test_cache(self):
+        client = Client("valid", gateway = self.gateway, cache = self.folder)
+        r1 = client.download_structures("mp-3", skip_key_check = True)
+        r2 = Client("valid", gateway = self.gateway, cache = self.folder).download_structures("mp-3", skip_key_check = True)
+        assert self.server.requests == ["/materials/mp-3/vasp/structure"]
+        assert r1.json == r2.json
+        
+        # Expired
+        Client("valid", gateway = self.gateway, cache = self.folder, ttl = 0).download_structures("mp-3", skip_key_check = True)
+        assert len(self.server.requests) == 2
+        
+    def test_not_cached(self):
+        client = Client("valid", gateway = self.gateway, cache = self.folder)
+        for request in ("status/500", "status/403", "invalid"):
+            for i in range(2):
+                with self.assertRaises(RuntimeError):
+                    client.request(request)
+        assert self.server.requests == ["/status/500"]*2 + ["/status/403"]*2 + ["/invalid"]*2
+        assert os.listdir(self.folder) == []
+        
+    def test_cache_key(self):
+        Client("valid", gateway = self.gateway, cache = self.folder).download_structures("mp-3", skip_key_check = True)
+        Client("other", gateway = self.gateway, cache = self.folder).download_structures("mp-3", skip_key_check = True)
+        assert len(self.server.requests) == 2
+        assert len(os.listdir(self.folder)) == 2
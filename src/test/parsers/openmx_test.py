@@ -7,8 +7,11 @@ import numpy
 import numericalunits
 
 from dfttools.parsers.openmx import *
+from dfttools.parsers.generic import ParseError
 from dfttools.types import UnitCell, Basis
 
+from .common import assert_trajectory
+
 class Test_bands0(unittest.TestCase):
 
     def setUp(self):
@@ -305,6 +308,44 @@ class Test_output0(unittest.TestCase):
             (3.7545, 2.1677, 51.5580),
         ))*numericalunits.angstrom)
         
+    def test_trajectory(self):
+        c = self.parser.unitCells(UnitCell(
+            Basis(numpy.eye(3), units = "angstrom"),
+            numpy.zeros((3,3)),
+            ("mo","se","se"),
+        ))
+        t = self.parser.trajectory(c[0])
+        assert_trajectory(t, c)
+        assert len(t) == 14
+        assert t.shared()
+        assert t.meta["units"] == "angstrom"
+        testing.assert_equal(t.values, ("mo", "se", "se"))
+        testing.assert_allclose(t.vectors, numpy.array((
+            (7.094992286790, 0.000000000000, 0.000000000000),
+            (3.547496143395, 6.144443560015, 0.000000000000),
+            (0.000000000000, 0.000000000000, 188.972598857892),
+        ))*numericalunits.aBohr)
+        testing.assert_allclose(t.cartesian()[-1], numpy.array((
+            (1.8773, 1.0838, 50.0000),
+            (3.7545, 2.1677, 48.4420),
+            (3.7545, 2.1677, 51.5580),
+        ))*numericalunits.angstrom)
+        testing.assert_allclose(t.distances(0, 1), numpy.array(tuple(i.distances(0, 1) for i in c)))
+        
+    def test_truncated(self):
+        c = UnitCell(
+            Basis(numpy.eye(3), units = "angstrom"),
+            numpy.zeros((3,3)),
+            ("mo","se","se"),
+        )
+        data = self.parser.data
+        parser = output(data[:data.rfind("XYZ(ang)")+len("XYZ(ang)")])
+        with self.assertRaises(ParseError):
+            parser.unitCells(c)
+        with self.assertRaises(ParseError):
+            parser.trajectory(c)
+        assert len(parser.unitCells(c, noraise = True)) == 13
+        
     def test_populations(self):
         p = self.parser.populations()
         
@@ -409,10 +450,28 @@ class Test_joint_lowdin(unittest.TestCase):
         for v in data["basis"].values():
             testing.assert_equal(v.shape, (shape[2],))
             
+    def test_values(self):
+        for workers in (None, 2):
+            data = joint_populations(self.data[:0:-1], workers = workers)
+            for i in self.data[1:]:
+                p = populations(i)
+                for field in ("k", "energies", "weights"):
+                    testing.assert_equal(data[field][p["k-id"]], p[field])
+                testing.assert_equal(data["bands"], p["bands"])
+                for k, v in p["basis"].items():
+                    testing.assert_equal(data["basis"][k], v)
+            assert not "k-id" in data
+            
     def test_fail_0(self):
         with self.assertRaises(ValueError):
             joint_populations([self.data[0],self.data[1]])
             
+    def test_fail_missing(self):
+        with self.assertRaises(ValueError):
+            joint_populations([self.data[1],self.data[2],self.data[2]])
+        with self.assertRaises(ValueError):
+            joint_populations([self.data[1],self.data[3]], workers = 2)
+            
     def test_fail_1(self):
         with self.assertRaises(ValueError):
             joint_populations([self.data[1],self.data[3]])
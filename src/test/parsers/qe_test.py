@@ -1,15 +1,20 @@
 import unittest
 import os
 import math
+import mmap
+import re
 
 from numpy import testing
 import numpy
 import numericalunits
 
 from dfttools.parsers.generic import ParseError
+from dfttools.parsers import qe
 from dfttools.parsers.qe import bands, output, cond, input, proj
 from dfttools.types import Basis
 
+from .common import BandsCopyTemplate, assert_trajectory, synthetic_energy, synthetic_bands_output, synthetic_md_output
+
 class Test_bands0(unittest.TestCase):
 
     def setUp(self):
@@ -87,6 +92,38 @@ class Test_output0(unittest.TestCase):
         assert a[-1] == 27.2
     def test_alat(self):
         assert self.parser.alat() == 7.0103*numericalunits.aBohr
+    def test_trajectory(self):
+        t = self.parser.trajectory()
+        assert_trajectory(t, self.parser.unitCells())
+        assert len(t) == 20
+        assert not t.shared()
+        assert t.meta["units"] == "angstrom"
+        testing.assert_equal(t.values, ("As", "As"))
+        testing.assert_allclose(t.vectors[-1], numpy.array((
+            ( 0.593659483, 0.000000000, 0.870567646),
+            (-0.296829546, 0.514124144, 0.870567651),
+            (-0.296829546,-0.514124144, 0.870567651),
+        ))*7.01033623*numericalunits.aBohr)
+        testing.assert_allclose(t.coordinates[-1], (
+            ( 0.272235154, 0.272235145, 0.272235145),
+            (-0.272235154,-0.272235145,-0.272235145),
+        ))
+        
+    def test_truncated(self):
+        data = self.parser.data
+        parser = output(data[:data.rfind("ATOMIC_POSITIONS")+40])
+        with self.assertRaises(ParseError):
+            parser.unitCells()
+        with self.assertRaises(ParseError):
+            parser.trajectory()
+            
+    def test_empty(self):
+        parser = output("")
+        with self.assertRaises(ParseError):
+            parser.unitCells()
+        with self.assertRaises(ParseError):
+            parser.trajectory()
+        
     def test_unitCells(self):
         cells = self.parser.unitCells()
         assert len(cells)==20
@@ -208,6 +245,27 @@ class Test_output0(unittest.TestCase):
             
         with self.assertRaises(ParseError):
             self.parser.bands(index = 19, skipVCRelaxException = True)
+            
+    def test_bands_lazy(self):
+        b = self.parser.bands(index = None, skipVCRelaxException = True)
+        lazy = self.parser.bands(index = None, skipVCRelaxException = True, lazy = True)
+        assert not isinstance(lazy, list)
+        for i, j in zip(b, lazy):
+            assert i == j
+            assert i.meta["Fermi"] == j.meta["Fermi"]
+        with self.assertRaises(StopIteration):
+            next(lazy)
+            
+    def test_sections(self):
+        fermi = self.parser.fermi()
+        accuracy = self.parser.scf_accuracy()
+        steps = self.parser.scf_steps()
+        for i in range(19):
+            assert self.parser.fermi(i) == fermi[i]
+            assert self.parser.fermi(i-19) == fermi[i]
+            testing.assert_equal(self.parser.scf_accuracy(i), accuracy[steps[:i].sum():steps[:i+1].sum()])
+        with self.assertRaises(ParseError):
+            self.parser.fermi(19)
     
     def test_valid_header(self):
         assert output.valid_header(self.parser.parser.string[:1000])
@@ -334,6 +392,26 @@ class Test_output2(unittest.TestCase):
             0.000598,
         ))*numericalunits.Ry/numericalunits.aBohr)
         
+    def test_force_index(self):
+        f = self.parser.force()
+        for i in range(len(f)):
+            assert self.parser.force(i) == f[i]
+        assert self.parser.force(-1) == f[-1]
+        
+    def test_force_missing(self):
+        data = self.parser.data
+        first = data.index("Total force =")
+        second = data.index("Total force =", first+1)
+        end = data.index("\n", second)
+        parser = output(data[:second] + data[end:])
+        f = self.parser.force()
+        f2 = parser.force()
+        assert len(f2) == len(f) - 1
+        assert parser.force(0) == f2[0] == f[0]
+        assert parser.force(1) is None
+        for i in range(2, len(f)):
+            assert parser.force(i) == f2[i-1] == f[i]
+        
 class Test_output3(unittest.TestCase):
     """
     Example copied from espresso-5.0.1/PW/examples/example01/results/si.band.cg.out
@@ -369,6 +447,39 @@ class Test_output3(unittest.TestCase):
         testing.assert_allclose(b.values[0,:], numpy.array((-5.8099, 6.2549, 6.2549, 6.2549, 8.8221, 8.8221, 8.8221, 9.7232))*numericalunits.eV)
         testing.assert_allclose(b.values[-1,:],numpy.array((-3.4180,-0.8220, 5.0289, 5.0289, 7.8139, 9.5968, 9.5968,13.8378))*numericalunits.eV)
         
+class Test_output3_mapped(unittest.TestCase):
+    
+    def setUp(self):
+        self.path = os.path.join(os.path.dirname(os.path.realpath(__file__)),"cases/qe.output.3.testcase")
+        with open(self.path,'r') as f:
+            self.reference = output(f.read()).bands()
+            
+    def __check__(self, parser):
+        assert isinstance(parser.data, mmap.mmap)
+        assert parser.success()
+        b = parser.bands()
+        testing.assert_equal(b.coordinates, self.reference.coordinates)
+        testing.assert_equal(b.values, self.reference.values)
+        
+    def test_file(self):
+        with open(self.path,'r') as f:
+            self.__check__(output(f))
+        
+    def test_path(self):
+        self.__check__(output.from_path(self.path))
+        
+    def test_close(self):
+        with output.from_path(self.path) as parser:
+            self.__check__(parser)
+        with self.assertRaises(ValueError):
+            parser.data[0]
+        
+    def test_path_as_data(self):
+        # A string is always data, even if it names a file
+        parser = output(self.path)
+        assert parser.data == self.path
+        assert not parser.success()
+        
 class Test_output4(unittest.TestCase):
     """
     Fixed occupations (insulator).
@@ -495,9 +606,95 @@ class Test_proj0(unittest.TestCase):
         c2 = self.parser._weights()
         testing.assert_allclose(c,c2)
 
+    def test_weights_window(self):
+        c = self.parser.weights()
+        testing.assert_equal(self.parser.weights(lower = 2, upper = 5), c[:,2:5])
+        testing.assert_equal(self.parser.weights(lower = 3), c[:,3:])
+        testing.assert_allclose(self.parser.weights(lower = 2, upper = 5), self.parser._weights(lower = 2, upper = 5), rtol = 1e-6)
+        
+    def test_weights_k(self):
+        c = self.parser.weights()
+        testing.assert_equal(self.parser.weights(k = (27, 0, 5, 5)), c[[27, 0, 5, 5]])
+        testing.assert_equal(self.parser.weights(lower = 1, upper = 2, k = numpy.arange(3, 7)), c[3:7,1:2])
+        
+    def test_weights_dtype(self):
+        c = self.parser.weights()
+        c2 = self.parser.weights(dtype = numpy.float64)
+        assert c.dtype == numpy.float32
+        assert c2.dtype == numpy.float64
+        testing.assert_allclose(c, c2, rtol = 1e-6)
+        testing.assert_allclose(c2, self.parser._weights())
+        with self.assertRaises(ValueError):
+            self.parser.weights(dtype = numpy.int64)
+            
+    def test_weights_k_range(self):
+        with self.assertRaises(ValueError):
+            self.parser.weights(k = (0, 28))
+        with self.assertRaises(ValueError):
+            self.parser.weights(k = (-1, 0))
+            
+    def test_weights_broken(self):
+        data = self.parser.data
+        with self.assertRaises(ParseError):
+            proj(data[:data.rindex(" k = ")+50]).weights()
+        with self.assertRaises(ParseError):
+            proj(data[:data.index("Calling projwave")]).weights()
+        with open(os.path.join(os.path.dirname(os.path.realpath(__file__)),"cases/qe.output.0.testcase"),'r') as f:
+            with self.assertRaises(ParseError):
+                proj(f.read()).weights()
+            
     def test_valid_header(self):
         assert proj.valid_header(self.parser.parser.string[:1000])
         
+class Test_proj0_mapped(unittest.TestCase):
+    
+    def test_weights(self):
+        path = os.path.join(os.path.dirname(os.path.realpath(__file__)),"cases/qe.proj.0.testcase")
+        with open(path,'r') as f:
+            reference = proj(f.read()).weights()
+        parser = proj.from_path(path)
+        assert isinstance(parser.data, mmap.mmap)
+        testing.assert_equal(parser.weights(), reference)
+        testing.assert_allclose(parser._weights(), reference, rtol = 1e-6)
+
+class Test_proj0_chunks(unittest.TestCase):
+    
+    def setUp(self):
+        with open(os.path.join(os.path.dirname(os.path.realpath(__file__)),"cases/qe.proj.0.testcase"),'r') as f:
+            data = f.read()
+        # Repeat k-point blocks
+        start = data.index(" k = ")
+        end = data.index("Lowdin Charges")
+        data = data[:start] + data[start:end]*100 + data[end:]
+        self.serial = proj(data)
+        self.serial.threads = 1
+        self.parallel = proj(data)
+        self.parallel.threads = 4
+        
+    def test_weights(self):
+        c = self.serial.weights()
+        assert c.shape == (2800, 8, 8)
+        testing.assert_equal(self.parallel.weights(), c)
+        testing.assert_equal(self.parallel.weights(lower = 1, upper = 3, dtype = numpy.float64), self.serial.weights(lower = 1, upper = 3, dtype = numpy.float64))
+        k = numpy.arange(2799, -1, -2)
+        testing.assert_equal(self.parallel.weights(k = k), c[k])
+        
+    def test_weights_growth(self):
+        # The first block is longer than the rest
+        data = self.serial.data
+        start = data.index(" k = ")
+        end = data.index(" k = ", start + 1)
+        data = data[:end].replace("psi = ", "psi = " + " "*1000) + data[end:]
+        parser = proj(data)
+        parser.threads = 1
+        testing.assert_equal(parser.weights(), self.serial.weights())
+        
+    def test_caret(self):
+        self.serial.parser.skip("Lowdin Charges")
+        position = self.serial.parser.__position__
+        self.serial.weights()
+        assert self.serial.parser.__position__ == position
+        
 class Test_proj1(unittest.TestCase):
     """
     NC case.
@@ -856,3 +1053,139 @@ K_POINTS automatic
     
     def test_valid_header(self):
         assert input.valid_header(self.parser.parser.string[:1000])
+
+class Test_output_native(unittest.TestCase):
+    
+    def setUp(self):
+        self.parser = output(synthetic_bands_output(7, nb = 150))
+        
+    def test_bands(self):
+        b = self.parser.bands()
+        assert b.values.shape == (7, 150)
+        testing.assert_allclose(b.values/numericalunits.eV, numpy.fromfunction(synthetic_energy, (1, 1, 7, 150))[0,0])
+        
+    def test_bands_fallback(self):
+        b = self.parser.bands()
+        self.parser.parser.reset()
+        self.parser.parser.skip("End of band structure calculation")
+        testing.assert_equal(b.values, self.parser.__bands_energies_python__(7))
+        
+    def test_bands_error(self):
+        # Errors other than unsupported formats are not hidden
+        def native(*args):
+            raise MemoryError
+        original = qe.qe_output_bands
+        qe.qe_output_bands = native
+        try:
+            with self.assertRaises(MemoryError):
+                self.parser.bands()
+        finally:
+            qe.qe_output_bands = original
+            
+    def test_bands_broken(self):
+        data = synthetic_bands_output(7, nb = 150)
+        i = data.rindex("k =")
+        # Different number of bands in the last block falls back
+        b = output(data[:i] + data[i:].replace("\n\n", "\n\n   1.0000\n\n", 1)).bands()
+        assert len(b.values) == 7
+        
+class Test_output_chunks(unittest.TestCase):
+    
+    def test_bands(self):
+        data = synthetic_bands_output(5000, nb = 12)
+        serial = output(data)
+        serial.threads = 1
+        parallel = output(data)
+        parallel.threads = 4
+        b = parallel.bands()
+        assert b.values.shape == (5000, 12)
+        testing.assert_equal(b.values, serial.bands().values)
+        assert parallel.parser.__position__ == serial.parser.__position__
+        
+    def test_bands_ragged(self):
+        data = synthetic_bands_output(2048, nb = 4)
+        # One more band in the second half of k-points
+        i = data.index("k =", data.index("End of band structure"))
+        for j in range(1024):
+            i = data.index("k =", i+1)
+        data = data[:i] + re.sub(r"^(  (?: *-?\d+\.\d{4}){4})$", r"\1 -99.0000", data[i:], flags = re.M)
+        serial = output(data)
+        serial.threads = 1
+        parallel = output(data)
+        parallel.threads = 2
+        b = parallel.bands()
+        assert len(b.values) == 2048
+        assert len(b.values[0]) == 4 and len(b.values[-1]) == 5
+        for i, j in zip(b.values, serial.bands().values):
+            testing.assert_equal(i, j)
+        
+class Test_output_positions(unittest.TestCase):
+    
+    def __python__(self, parser):
+        header = next(parser.__frames__())
+        parser.parser.reset()
+        parser.parser.skip("Cartesian axes")
+        return [header] + list(parser.__steps_python__(len(header[1]), header[0], parser.alat()))
+        
+    def __check__(self, data):
+        parser = output(data)
+        native = list(parser.__frames__())
+        python = self.__python__(parser)
+        assert len(native) == len(python)
+        for i, j in zip(native, python):
+            testing.assert_allclose(i[0], j[0])
+            testing.assert_allclose(i[1], j[1])
+            testing.assert_equal(i[2], j[2])
+            assert i[3] == j[3]
+        return native
+        
+    def test_cases(self):
+        for i in range(6):
+            with open(os.path.join(os.path.dirname(os.path.realpath(__file__)),"cases/qe.output.{:d}.testcase".format(i)),'r') as f:
+                self.__check__(f.read())
+                
+    def test_angstrom(self):
+        frames = self.__check__(synthetic_md_output(3, 4))
+        assert len(frames) == 4
+        testing.assert_allclose(frames[-1][1][:,1], 0.5*numericalunits.angstrom)
+        testing.assert_equal(frames[-1][2], ("Si", "O", "Si", "O"))
+        assert frames[-1][3]
+        
+    def test_vc(self):
+        frames = self.__check__(synthetic_md_output(3, 4, units = "crystal", vc = True))
+        testing.assert_allclose(frames[-1][0][0,0], 10.02*numericalunits.aBohr)
+        testing.assert_allclose(frames[-1][1][:,0], 2e-3)
+        assert not frames[-1][3]
+        
+    def test_trajectory(self):
+        t = output(synthetic_md_output(500, 64)).trajectory()
+        assert len(t) == 501
+        assert t.shared()
+        assert t.coordinates.shape == (501, 64, 3)
+        testing.assert_equal(t.values, ("Si", "O")*32)
+        c = t.cartesian()
+        testing.assert_allclose(c[-1,:,0], 0.499*numericalunits.angstrom)
+        testing.assert_allclose(c[-1,:,1], 0.5*numericalunits.angstrom)
+        testing.assert_allclose(c[1:,:,2]/numericalunits.angstrom, numpy.tile(numpy.arange(64)/64., (500, 1)), atol = 1e-9)
+        
+    def test_broken(self):
+        data = synthetic_md_output(3, 4)
+        i = data.rindex("O        ")
+        frames = self.__check__(data[:i] + "Si" + data[i+1:])
+        testing.assert_equal(frames[-1][2], ("Si", "O", "Si", "Si"))
+        
+class Test_output_scaling(BandsCopyTemplate, unittest.TestCase):
+    
+    synthetic = staticmethod(synthetic_bands_output)
+    
+    def bands(self, data):
+        # The native reader does not use StringParser: make it fail
+        calls = []
+        def native(n_kp):
+            calls.append(n_kp)
+            raise qe.FormatError("Not used in this test")
+        parser = output(data)
+        parser.__bands_energies_native__ = native
+        result = parser.bands()
+        assert len(calls) == 1
+        return result
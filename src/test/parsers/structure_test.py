@@ -5,8 +5,11 @@ import numpy
 from numpy import testing
 import numericalunits
 
+from dfttools.parsers.generic import ParseError
 from dfttools.parsers.structure import xsf, cube
 
+from .common import assert_trajectory
+
 class Test_xsf0(unittest.TestCase):
 
     def setUp(self):
@@ -46,6 +49,26 @@ class Test_xsf1(unittest.TestCase):
         with open(os.path.join(os.path.dirname(os.path.realpath(__file__)),"cases/structure.xsf.1.testcase"),'r') as f:
             self.parser = xsf(f.read())
 
+    def test_truncated(self):
+        data = self.parser.data
+        parser = xsf(data[:data.rfind("30      1.2550000")+20])
+        with self.assertRaises(ParseError):
+            parser.unitCells()
+        with self.assertRaises(ParseError):
+            parser.trajectory()
+            
+    def test_trajectory(self):
+        t = self.parser.trajectory()
+        assert_trajectory(t, self.parser.unitCells())
+        assert len(t) == 2
+        assert t.shared()
+        assert t.meta["units"] == "angstrom"
+        testing.assert_equal(t.values, ("16", "30"))
+        testing.assert_allclose(t.cartesian()[:,1], numpy.array((
+            (1.355, -1.355, -1.355),
+            (1.255, -1.255, -1.255),
+        ))*numericalunits.angstrom)
+        
     def test_unitCells(self):
         c = self.parser.unitCells()
         
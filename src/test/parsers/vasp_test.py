@@ -0,0 +1,108 @@
+import unittest
+import os
+import mmap
+import shutil
+import tempfile
+
+from numpy import testing
+import numpy
+import numericalunits
+
+from dfttools.parsers.generic import ParseError
+from dfttools.parsers.vasp import Output as output
+from dfttools.simple import parse
+
+from .common import BandsCopyTemplate, synthetic_energy, synthetic_outcar
+
+class Test_output0(unittest.TestCase):
+    
+    def setUp(self):
+        self.parser = output(synthetic_outcar(10))
+        
+    def test_valid_header(self):
+        assert output.valid_header(self.parser.data[:1000])
+        
+    def test_fermi(self):
+        testing.assert_equal(self.parser.fermi(), [5.6789*numericalunits.eV])
+        
+    def test_bands(self):
+        b = self.parser.bands()
+        assert b.values.shape == (10, 8)
+        testing.assert_allclose(b.vectors, numpy.array((
+            (0,1,1),
+            (1,0,1),
+            (1,1,0),
+        )))
+        testing.assert_allclose(b.coordinates[:,2], numpy.arange(10)*0.1)
+        testing.assert_allclose(b.values, numpy.fromfunction(synthetic_energy, (1, 1, 10, 8))[0,0]*numericalunits.eV, atol = 1e-6*numericalunits.eV)
+        assert b.meta["Fermi"] == 5.6789*numericalunits.eV
+        
+class Test_output_spin(unittest.TestCase):
+    
+    def setUp(self):
+        self.parser = output(synthetic_outcar(5, nb = 6, nspin = 2, steps = 3))
+        self.energies = numpy.fromfunction(synthetic_energy, (3, 2, 5, 6))*numericalunits.eV
+        
+    def test_fermi(self):
+        testing.assert_allclose(self.parser.fermi(), (5.6789+numpy.arange(3))*numericalunits.eV)
+        
+    def test_eigenvalues(self):
+        e, o = self.parser.eigenvalues()
+        assert e.shape == (3, 2, 5, 6)
+        testing.assert_allclose(e, self.energies, atol = 1e-6*numericalunits.eV)
+        testing.assert_equal(o[..., :3], 1)
+        testing.assert_equal(o[..., 3:], 0)
+        
+        for i in range(-3, 3):
+            e, o = self.parser.eigenvalues(i)
+            assert e.shape == (2, 5, 6)
+            testing.assert_allclose(e, self.energies[i], atol = 1e-6*numericalunits.eV)
+            
+        with self.assertRaises(ParseError):
+            self.parser.eigenvalues(3)
+            
+    def test_blocks(self):
+        bounds, nk = self.parser.__step__(1)
+        assert len(bounds) == 3 and nk == 5
+        for i in range(2):
+            testing.assert_equal(self.parser.__spin_channel_blocks__(bounds[i], bounds[i+1], 6), self.parser.__spin_channel__(bounds[i], nk, 6))
+        
+    def test_bands(self):
+        b = self.parser.bands(index = -1, spin = 1)
+        assert b.values.shape == (5, 6)
+        testing.assert_allclose(b.values, self.energies[-1, 1], atol = 1e-6*numericalunits.eV)
+        assert b.meta["Fermi"] == 7.6789*numericalunits.eV
+        
+class Test_output_mapped(unittest.TestCase):
+    
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "OUTCAR")
+        with open(self.path, "w") as f:
+            f.write(synthetic_outcar(5, nb = 6, nspin = 2, steps = 3))
+        self.reference = output(synthetic_outcar(5, nb = 6, nspin = 2, steps = 3))
+            
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+        
+    def test_file(self):
+        with open(self.path, "r") as f:
+            parser = output(f)
+            assert isinstance(parser.data, mmap.mmap)
+            e, o = parser.eigenvalues()
+            e_ref, o_ref = self.reference.eigenvalues()
+            testing.assert_equal(e, e_ref)
+            testing.assert_equal(o, o_ref)
+            assert parser.bands() == self.reference.bands()
+            
+    def test_parse(self):
+        with open(self.path, "r") as f:
+            b = parse(f, "band-structure")
+        assert b == self.reference.bands()
+        
+class Test_output_scaling(BandsCopyTemplate, unittest.TestCase):
+    
+    synthetic = staticmethod(synthetic_outcar)
+    
+    def bands(self, data):
+        return output(data).bands()
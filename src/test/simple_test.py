@@ -1,8 +1,14 @@
 import os
+import shutil
+import tempfile
+from StringIO import StringIO
 
 import unittest
 
-from dfttools.simple import get_all_parsers, guess_parser, parse
+import numpy
+
+from dfttools import simple
+from dfttools.simple import get_all_parsers, guess_parser, parse, ParseCache, get_registry, parse_many, DirectoryManifest, ParserRegistry
 from dfttools.parsers.generic import AbstractParser, ParseError
 from dfttools.parsers import qe, openmx, elk, structure
 
@@ -72,6 +78,75 @@ class Test_methods(unittest.TestCase):
         for i,j in zip(c1,c2):
             assert i==j
 
+class TestRegistry(unittest.TestCase):
+    
+    def setUp(self):
+        self.registry = get_registry()
+        
+    def test_by_filename(self):
+        assert self.registry.by_filename("/some/path/GEOMETRY_OPT.OUT") == [elk.UnitCellsParser]
+        assert self.registry.by_filename("elk.in") == [elk.Input]
+        assert self.registry.by_filename("/some/path/structure.XSF") == [structure.XSF]
+        assert self.registry.by_filename("openmx.tran0_1") == [openmx.Transmission]
+        assert self.registry.by_filename("/some/path/elk.in.bak") == []
+        
+    def test_by_header(self):
+        path = os.path.join(os.path.dirname(os.path.realpath(__file__)),"parsers/cases/qe.output.0.testcase")
+        with open(path, "r") as f:
+            assert self.registry.by_header(f.read(4096)) == [qe.Output]
+            
+    def test_tagged(self):
+        assert self.registry.tagged(qe.Output, "unit-cell") == ["unitCells"]
+        assert self.registry.tagged(qe.Output, "band-structure") == ["__bands_silent__"]
+        assert self.registry.tagged(qe.Cond, "unit-cell") == []
+        assert self.registry.tagged(elk.Input, "unit-cell") == ["unitCells"]
+        
+    def test_large_header(self):
+        path = os.path.join(os.path.dirname(os.path.realpath(__file__)),"parsers/cases/qe.output.0.testcase")
+        with open(path, "r") as f:
+            data = f.read()
+        f = StringIO(" "*1024 + data)
+        assert guess_parser(f) == [qe.Output]
+        assert f.tell() == 0
+        
+    def test_deep_header(self):
+        
+        class Early(AbstractParser):
+            valid_header = staticmethod(lambda h: h.startswith("early"))
+            
+        class Deep(AbstractParser):
+            header_size = 1024*1024
+            valid_header = staticmethod(lambda h: "deep" in h)
+            
+        class Named(AbstractParser):
+            extensions = (".named",)
+            
+        registry = ParserRegistry((Early, Deep, Named))
+        
+        f = StringIO("early" + " "*(16*1024) + "deep")
+        assert registry.guess(f) == [Early, Deep]
+        f.name = "file.named"
+        assert registry.guess(f) == [Early, Deep, Named]
+        
+        f = StringIO("early" + " "*(2*1024*1024) + "deep")
+        assert registry.guess(f) == [Early]
+        
+        # Signatures are looked for within the declared header size only
+        f = StringIO(" "*(16*1024) + "early")
+        assert ParserRegistry((Early, Named)).guess(f) == []
+        
+    def test_short_header(self):
+        
+        class Reading(StringIO):
+            read_sizes = []
+            def read(self, size = -1):
+                self.read_sizes.append(size)
+                return StringIO.read(self, size)
+                
+        f = Reading(" "*(2*1024*1024))
+        assert guess_parser(f) == []
+        assert sum(f.read_sizes) <= 4*1024
+        
 class TestNameGuess(unittest.TestCase):
     
     path = os.path.join(os.path.dirname(os.path.realpath(__file__)),"parsers/cases/openmx.bands.0.testcase")
@@ -117,3 +192,208 @@ class TestParserFailures(unittest.TestCase):
         with open(self.file_truncated_structure,'r') as f:
             with self.assertRaises(ParseError):
                 parse(f,'unit-cell')
+
+class TestManifest(unittest.TestCase):
+    
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        source = os.path.join(os.path.dirname(os.path.realpath(__file__)),"parsers/cases/openmx.output.0.testcase")
+        for i in ("input", "output"):
+            shutil.copy(os.path.join(source, i), self.folder)
+        with open(os.path.join(self.folder, "data.scfout"), "wb") as f:
+            f.write("\x00"*4096)
+        self.manifest = DirectoryManifest(self.folder)
+        self.guessed = []
+        guess = self.manifest.registry.guess
+        def counting(f):
+            self.guessed.append(f.name)
+            return guess(f)
+        self.manifest.registry = type("Registry", (object,), dict(guess = staticmethod(counting), header_sizes = get_registry().header_sizes))()
+        
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+        
+    def test_find(self):
+        assert self.manifest.find(openmx.Input) == [os.path.join(self.folder, "input")]
+        assert self.manifest.find(openmx.Output) == [os.path.join(self.folder, "output")]
+        assert self.manifest.find(qe.Output) == []
+        assert len(self.guessed) == 3
+        
+    def test_refresh(self):
+        self.manifest.refresh()
+        self.manifest.refresh()
+        assert len(self.guessed) == 3
+        
+        # Same header
+        path = os.path.join(self.folder, "input")
+        os.utime(path, (0, 0))
+        self.manifest.refresh()
+        assert len(self.guessed) == 3
+        
+        # New header
+        with open(path, "w") as f:
+            f.write("Program PWSCF")
+        assert self.manifest.find(openmx.Input) == []
+        assert self.guessed[3:] == [path]
+        
+        os.remove(path)
+        self.manifest.refresh()
+        assert not path in self.manifest.entries
+        
+    def test_deep_header(self):
+        
+        class Deep(AbstractParser):
+            header_size = 1024*1024
+            valid_header = staticmethod(lambda h: "deep" in h)
+            
+        manifest = DirectoryManifest(self.folder, registry = ParserRegistry((Deep,)))
+        path = os.path.join(self.folder, "deep")
+        with open(path, "w") as f:
+            f.write(" "*(16*1024) + "deep")
+        assert manifest.find(Deep) == [path]
+        
+        # Same size, change beyond the first kilobytes
+        with open(path, "w") as f:
+            f.write(" "*(16*1024) + "deaf")
+        os.utime(path, (0, 0))
+        assert manifest.find(Deep) == []
+        
+    def test_companion(self):
+        with open(os.path.join(self.folder, "input"), 'r') as f:
+            c = parse(f, "unit-cell")
+        with open(os.path.join(self.folder, "output"), 'r') as f:
+            c1 = openmx.output(f.read()).unitCells(c)
+            c2 = parse(f, "unit-cell")
+        for i, j in zip(c1, c2):
+            assert i == j
+        
+class TestParseCache(unittest.TestCase):
+    
+    path = os.path.join(os.path.dirname(os.path.realpath(__file__)),"parsers/cases/qe.output.0.testcase")
+    
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache = ParseCache(self.folder)
+        
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+        
+    def test_hit(self):
+        with open(self.path,'r') as f:
+            c1 = parse(f, "unit-cell", cache = self.cache)
+            assert self.cache.misses == 1 and self.cache.hits == 0
+            assert len(self.cache) == 1
+            c2 = parse(f, "unit-cell", cache = self.cache)
+            assert self.cache.hits == 1
+            b1 = parse(f, "band-structure", cache = self.cache)
+            b2 = parse(f, "band-structure", cache = self.cache)
+            assert len(self.cache) == 2
+            
+        assert len(c1) == len(c2)
+        for i,j in zip(c1,c2):
+            assert i == j
+            assert i.meta == j.meta
+        assert b1 == b2
+        assert b1.meta["Fermi"] == b2.meta["Fermi"]
+        
+    def test_skip_parsing(self):
+        with open(self.path,'r') as f:
+            c1 = parse(f, "band-structure", cache = self.cache)
+            p = simple.__parse__
+            simple.__parse__ = None
+            try:
+                c2 = parse(f, "band-structure", cache = self.cache)
+            finally:
+                simple.__parse__ = p
+        assert c1 == c2
+        
+    def test_parser_revision(self):
+        with open(self.path,'r') as f:
+            key = self.cache.key(f, "band-structure", (), parsers = [qe.Output])
+            assert not self.cache.key(f, "band-structure", (), parsers = [qe.Input]) == key
+            
+            # Parser source changes
+            path = os.path.splitext(qe.__file__)[0]+".py"
+            revision = simple.__revisions__[path]
+            simple.__revisions__[path] = "0"
+            try:
+                assert not self.cache.key(f, "band-structure", (), parsers = [qe.Output]) == key
+            finally:
+                simple.__revisions__[path] = revision
+            assert self.cache.key(f, "band-structure", (), parsers = [qe.Output]) == key
+        
+    def test_contents(self):
+        with open(self.path,'r') as f:
+            data = f.read()
+        c1 = parse(StringIO(data), "band-structure", cache = self.cache)
+        c2 = parse(StringIO(data), "band-structure", cache = self.cache)
+        assert self.cache.hits == 1
+        assert c1 == c2
+        parse(StringIO(data.replace("-6.9960","-6.9961")), "band-structure", cache = self.cache)
+        assert self.cache.misses == 2
+        
+    def test_unpicklable(self):
+        self.cache["a"] = [1, lambda x: x]
+        self.cache["b"] = [1, (i for i in range(3))]
+        assert os.listdir(self.folder) == []
+        with self.assertRaises(KeyError):
+            self.cache["a"]
+        
+    def test_evict(self):
+        cache = ParseCache(self.folder, size = 1)
+        with open(self.path,'r') as f:
+            parse(f, "unit-cell", cache = cache)
+            parse(f, "band-structure", cache = cache)
+        assert len(cache) == 0
+        cache.size = 1024**2
+        with open(self.path,'r') as f:
+            parse(f, "unit-cell", cache = cache)
+            parse(f, "band-structure", cache = cache)
+        assert len(cache) == 2
+        cache.clear()
+        assert len(cache) == 0
+
+class TestParseMany(unittest.TestCase):
+    
+    def setUp(self):
+        self.paths = list(os.path.join(os.path.dirname(os.path.realpath(__file__)),"parsers/cases/"+i) for i in (
+            "qe.output.0.testcase",
+            "qe.output.1.testcase",
+            "elk.input.1.testcase",
+            "qe.output.2.testcase",
+            "structure.xsf.0.testcase",
+        ))
+        self.reference = []
+        for p in self.paths:
+            with open(p, 'r') as f:
+                try:
+                    self.reference.append(parse(f, "unit-cell"))
+                except ParseError:
+                    self.reference.append(None)
+                    
+    def __check__(self, reference, result):
+        if reference is None:
+            assert isinstance(result, ParseError)
+        else:
+            assert len(reference) == len(result)
+            for i, j in zip(reference, result):
+                assert i == j
+                
+    def test_ordered(self):
+        for workers in (1, 3):
+            result = parse_many(self.paths, "unit-cell", workers = workers)
+            assert len(result) == len(self.paths)
+            for r1, r2 in zip(self.reference, result):
+                self.__check__(r1, r2)
+                
+    def test_unordered(self):
+        result = dict(parse_many(self.paths, "unit-cell", workers = 2, ordered = False))
+        assert sorted(result.keys()) == sorted(self.paths)
+        for p, r in zip(self.paths, self.reference):
+            self.__check__(r, result[p])
+            
+    def test_errors(self):
+        result = parse_many(self.paths[:1] + ["non-existing-file"], "band-structure", workers = 2)
+        assert not isinstance(result[0], ParseError)
+        assert isinstance(result[1], ParseError)
+        assert "non-existing-file" in str(result[1])
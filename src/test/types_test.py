@@ -1,6 +1,8 @@
 import unittest
+import itertools
 import math
 import pickle
+import json
 import os
 
 import numpy
@@ -104,6 +106,24 @@ class BasisTest(unittest.TestCase):
     def test_reciprocal(self):
         testing.assert_allclose(numpy.dot(numpy.swapaxes(self.b.reciprocal().vectors,0,1),self.b.vectors),numpy.eye(3), atol = 1e-10)
         
+    def test_cache(self):
+        v = self.b.volume()
+        r = self.b.reciprocal()
+        r.vectors *= 2
+        testing.assert_allclose(self.b.reciprocal().vectors, r.vectors/2)
+        
+        self.b.vectors *= 2
+        testing.assert_allclose(self.b.volume(), 8*v)
+        testing.assert_allclose(self.b.transform_from_cartesian((2,0,0)), (1,0,0), atol = 1e-14)
+        
+        self.b.vectors[2,2] = 12
+        testing.assert_allclose(self.b.volume(), 16*v)
+        testing.assert_allclose(self.b.transform_from_cartesian(self.b.vectors[2]), (0,0,1), atol = 1e-14)
+        
+        self.b.vectors = self.c.vectors
+        assert self.b.volume() == 1
+        testing.assert_equal(self.b.reciprocal().vectors, numpy.eye(3))
+        
     def test_vertices(self):
         v = self.b.vertices()
         s = 0.5*3.**.5
@@ -453,6 +473,44 @@ class CellTest(unittest.TestCase):
             (d,0)
         ))
     
+    def test_neighbors_0(self):
+        indptr, indices, distances, images = self.cell.neighbors(1.01*self.a)
+        testing.assert_equal(indptr, (0, 12, 24))
+        testing.assert_allclose(distances, self.a)
+        testing.assert_equal(indices, (0,)*6 + (1,)*6 + (0,)*6 + (1,)*6)
+        for i in range(2):
+            for j in range(2):
+                c = self.cell.transform_to_cartesian(self.cell.coordinates[indices[12*i:12*i+12]] + images[12*i:12*i+12] - self.cell.coordinates[i])
+                testing.assert_allclose((c**2).sum(axis = 1)**.5, self.a)
+                
+    def test_neighbors_1(self):
+        numpy.random.seed(0)
+        cell = UnitCell(
+            Basis(((1,0,0),(.6,.9,0),(.3,.2,1.1))),
+            numpy.random.rand(7,3)*3-1,
+            'X',
+        )
+        indptr, indices, distances, images = cell.neighbors(1.7)
+        
+        reference = []
+        for i in range(7):
+            for j in range(7):
+                for image in itertools.product(range(-5,6), repeat = 3):
+                    d = (cell.transform_to_cartesian(cell.coordinates[j] + image - cell.coordinates[i])**2).sum()**.5
+                    if d <= 1.7 and not (i == j and image == (0,0,0)):
+                        reference.append((i,j)+image)
+        assert len(reference) == len(indices)
+        testing.assert_equal(numpy.repeat(numpy.arange(7), numpy.diff(indptr)), numpy.array(reference)[:,0])
+        testing.assert_equal(indices, numpy.array(reference)[:,1])
+        testing.assert_equal(images, numpy.array(reference)[:,2:])
+        
+        indptr, indices, distances, images = cell.neighbors(1.7, periodic = False)
+        d = cell.distances()
+        for i in range(7):
+            testing.assert_equal(indices[indptr[i]:indptr[i+1]], numpy.nonzero((d[i] <= 1.7) & (numpy.arange(7) != i))[0])
+            testing.assert_allclose(distances[indptr[i]:indptr[i+1]], d[i, indices[indptr[i]:indptr[i+1]]])
+        testing.assert_equal(images, 0)
+    
     def test_distances_1(self):
         supercell = self.cell.repeated(2,2,1)
         testing.assert_allclose(supercell.distances(0,2,4,6),(self.a,)*3)
@@ -530,6 +588,15 @@ class CellTest(unittest.TestCase):
             (2./3.,2./3,0.5)), atol = 1e-14)
         testing.assert_equal(rp.values,("Co",)*8)
         
+    def test_repeated_2(self):
+        rp = self.cell.repeated(3,2,2)
+        st = self.cell.stack(self.cell, self.cell, vector = 'x')
+        st = st.stack(st, vector = 'y')
+        st = st.stack(st, vector = 'z')
+        testing.assert_allclose(rp.vectors,st.vectors)
+        testing.assert_allclose(rp.coordinates,st.coordinates, atol = 1e-14)
+        testing.assert_equal(rp.values,st.values)
+        
     def test_select_0(self):
         testing.assert_equal(self.cell.select((0.,0.,0.,1.,1.,1.)),(True,True))
         
@@ -644,6 +711,17 @@ class CellTest(unittest.TestCase):
         assert sp['Co'] == 3
         assert sp['C'] == 1
         
+    def test_species_2(self):
+        c = UnitCell(self.cell, self.cell.coordinates, Categorical(("Co","O")))
+        c = c.add(c).repeated(2,1,1)
+        assert isinstance(c.values, Categorical)
+        assert c.species() == {"Co":4, "O":4}
+        
+    def test_species_3(self):
+        # Complex numbers cannot be sorted
+        c = UnitCell(self.cell, self.cell.coordinates, numpy.array((1j, 1j), dtype = object))
+        assert c.species() == {1j:2}
+        
     def test_reorder_0(self):
         c = self.cell.copy()
         c.reorder_vectors(0,2,1)
@@ -690,6 +768,32 @@ class CellTest(unittest.TestCase):
         ), atol = 1e-10)
         testing.assert_equal(s.values,('Co',)*4)
         
+    def test_supercell_skewed(self):
+        vec = ((2,1,0),(0,3,1),(1,0,2))
+        s = self.cell.supercell(*vec)
+        assert s.size() == 13*self.cell.size()
+        assert numpy.all(s.coordinates >= 0) and numpy.all(s.coordinates < 1)
+        testing.assert_allclose(s.volume(), 13*self.cell.volume())
+        testing.assert_equal(s.values, ('Co',)*26)
+        
+        # All species are lattice images of the original ones
+        original = self.cell.transform_from(s, s.coordinates)
+        delta = original - numpy.tile(self.cell.coordinates, (13,1))
+        testing.assert_allclose(delta, numpy.round(delta), atol = 1e-10)
+        
+        # No duplicates
+        d = s.neighbors(0.1*self.a)
+        assert len(d[1]) == 0
+        
+        # Deterministic
+        testing.assert_equal(s.coordinates, self.cell.supercell(*vec).coordinates)
+        
+    def test_supercell_fail(self):
+        with self.assertRaises(ArgumentError):
+            self.cell.supercell((1,0,0),(0,1.5,0),(0,0,1))
+        with self.assertRaises(ArgumentError):
+            self.cell.supercell((1,0,0),(2,0,0),(0,0,1))
+        
     def test_interpolate(self):
         c = UnitCell(
             Basis((1,1), kind = 'orthorombic', meta = {'key':'value'}),
@@ -838,6 +942,163 @@ class Cell2Grid(unittest.TestCase):
             (3,1),
         ))
 
+class CategoricalTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.values = numpy.array(("Co", "O", "O", "Fe", "O"))
+        self.c = Categorical(self.values)
+        
+    def test_init(self):
+        testing.assert_equal(self.c.labels, ("Co", "Fe", "O"))
+        assert self.c.codes.dtype == numpy.int16
+        testing.assert_equal(self.c.codes, (0, 2, 2, 1, 2))
+        testing.assert_equal(numpy.array(self.c), self.values)
+        assert self.c.shape == (5,)
+        assert len(self.c) == 5
+        assert list(self.c) == list(self.values)
+        assert self.c.tolist() == self.values.tolist()
+        
+    def test_getitem(self):
+        assert self.c[3] == "Fe"
+        s = self.c[1:4]
+        assert isinstance(s, Categorical)
+        assert s.labels is self.c.labels
+        testing.assert_equal(numpy.array(s), self.values[1:4])
+        testing.assert_equal(numpy.array(self.c[self.c == "O"]), ("O",)*3)
+        
+    def test_setitem(self):
+        c = self.c.copy()
+        c[0] = "Al"
+        c[1:3] = "Fe"
+        testing.assert_equal(c.labels, ("Al", "Co", "Fe", "O"))
+        testing.assert_equal(numpy.array(c), ("Al", "Fe", "Fe", "Fe", "O"))
+        testing.assert_equal(numpy.array(self.c), self.values)
+        
+    def test_eq(self):
+        testing.assert_equal(self.c == "O", self.values == "O")
+        testing.assert_equal(self.c != "O", self.values != "O")
+        testing.assert_equal(self.c == self.values[::-1], self.values == self.values[::-1])
+        testing.assert_equal(self.values[::-1] == self.c, self.values == self.values[::-1])
+        testing.assert_equal(self.c == Categorical(self.values[::-1]), self.values == self.values[::-1])
+        
+    def test_counts(self):
+        assert self.c.counts() == {"Co":1, "Fe":1, "O":3}
+        assert self.c[1:3].counts() == {"O":2}
+        
+    def test_concatenate(self):
+        c = Categorical.concatenate((self.c, Categorical(("Zn","Co"))))
+        assert isinstance(c, Categorical)
+        testing.assert_equal(c.labels, ("Co", "Fe", "O", "Zn"))
+        testing.assert_equal(numpy.array(c), tuple(self.values) + ("Zn", "Co"))
+        
+        c = Categorical.concatenate((self.c, numpy.array(("Zn",))))
+        assert isinstance(c, numpy.ndarray)
+        testing.assert_equal(c, tuple(self.values) + ("Zn",))
+        
+    def test_cell(self):
+        b = Basis(((1,0,0),(0,1,0),(0,0,1)))
+        coordinates = numpy.linspace(0, 1, 15, endpoint = False).reshape(5, 3)
+        c = UnitCell(b, coordinates, self.c)
+        c2 = UnitCell(b, coordinates, self.values)
+        assert isinstance(c.values, Categorical)
+        assert not c.values is self.c
+        assert c == c2
+        assert c2 == c
+        assert c.species() == c2.species()
+        
+        c.values[0] = "Fe"
+        assert self.c[0] == "Co"
+        
+    def test_cut(self):
+        b = Basis(((1,0,0),(0,1,0),(0,0,1)))
+        c = UnitCell(b, ((0,0,0),(.5,.5,.5)), Categorical(("Co","O"))).cut(0,0,0,.2,.2,.2)
+        assert isinstance(c.values, Categorical)
+        assert c.species() == {"Co":1}
+        
+    def test_pickle(self):
+        b = Basis(((1,0,0),(0,1,0),(0,0,1)))
+        c = UnitCell(b, numpy.linspace(0, 1, 15, endpoint = False).reshape(5, 3), self.c)
+        
+        c2 = pickle.loads(pickle.dumps(c))
+        assert isinstance(c2.values, Categorical)
+        testing.assert_equal(c2.values.labels, self.c.labels)
+        testing.assert_equal(c2.values.codes, self.c.codes)
+        assert c2 == c
+        
+        c2 = UnitCell.from_json(json.loads(json.dumps(c.to_json())))
+        assert isinstance(c2.values, Categorical)
+        assert c2 == c
+        
+class TrajectoryTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.vectors = numpy.array((
+            ((1.,0,0),(0,1.,0),(0,0,1.)),
+            ((2.,0,0),(0,1.,0),(0,0,1.)),
+            ((2.,0,0),(1.,1.,0),(0,0,3.)),
+        ))
+        self.coordinates = numpy.array((
+            ((0,0,0),(.5,.5,.5)),
+            ((.1,0,0),(.5,.5,.5)),
+            ((0,.2,0),(.5,.5,.25)),
+        ))
+        self.t = Trajectory(self.vectors, self.coordinates, ("a","b"), units = "angstrom")
+        self.cells = list(UnitCell(Basis(v, units = "angstrom"), c, ("a","b")) for v, c in zip(self.vectors, self.coordinates))
+        
+    def test_init_fail(self):
+        with self.assertRaises(ArgumentError):
+            Trajectory(self.vectors, self.coordinates[0], ("a","b"))
+        with self.assertRaises(ArgumentError):
+            Trajectory(self.vectors[:2], self.coordinates, ("a","b"))
+        with self.assertRaises(ArgumentError):
+            Trajectory(self.vectors, self.coordinates, ("a","b","c"))
+            
+    def test_shared(self):
+        assert not self.t.shared()
+        t = Trajectory((self.vectors[0],)*3, self.coordinates, ("a","b"))
+        assert t.shared()
+        assert t.vectors.shape == (3,3)
+        
+    def test_cells(self):
+        assert len(self.t) == 3
+        for c1, c2 in zip(self.t, self.cells):
+            assert c1 == c2
+            assert c1.units_aware()
+        assert self.t[-1] == self.cells[-1]
+        
+    def test_slice(self):
+        t = self.t[1:]
+        assert isinstance(t, Trajectory)
+        assert len(t) == 2
+        assert t[0] == self.cells[1]
+        t = self.t[numpy.array((2,0))]
+        assert t[0] == self.cells[2]
+        assert t[1] == self.cells[0]
+        
+    def test_from_cells(self):
+        t = Trajectory.from_cells(self.cells)
+        testing.assert_equal(t.vectors, self.vectors)
+        testing.assert_equal(t.coordinates, self.coordinates)
+        assert t.meta["units"] == "angstrom"
+        with self.assertRaises(ArgumentError):
+            Trajectory.from_cells(self.cells[:1] + [UnitCell(self.cells[1], self.coordinates[1], ("a","c"))])
+            
+    def test_cartesian(self):
+        c = self.t.cartesian()
+        assert c.shape == (3,2,3)
+        for i in range(3):
+            testing.assert_allclose(c[i], self.cells[i].cartesian())
+        t = Trajectory(self.vectors, c, ("a","b"), c_basis = "cartesian")
+        testing.assert_allclose(t.coordinates, self.coordinates, atol = 1e-15)
+        t = Trajectory(self.vectors, numpy.concatenate((c[:1], self.coordinates[1:])), ("a","b"), c_basis = (True, False, False))
+        testing.assert_allclose(t.coordinates, self.coordinates, atol = 1e-15)
+        
+    def test_distances(self):
+        for ids in ((), (0,1), ((0,1),(1,1))):
+            d = self.t.distances(*ids)
+            for i in range(3):
+                testing.assert_allclose(d[i], self.cells[i].distances(*ids))
+                
 class GridInitialiazationTest(unittest.TestCase):
                 
     def test_init_grid_0(self):